@@ -22,6 +22,7 @@ CREATE TABLE agents (
         "cortisol": 0.3,
         "endorphin": 0.5
     }'::jsonb,
+    hormones_decayed_at TIMESTAMPTZ DEFAULT NOW(), -- Last decay toward baseline (srv/agents/hormones.py)
     trust_coefficient DECIMAL DEFAULT 0.5,
     
     -- Capabilities
@@ -64,6 +65,8 @@ CREATE TABLE tasks (
     upvotes INTEGER DEFAULT 0,
     downvotes INTEGER DEFAULT 0,
     hot_score DECIMAL DEFAULT 0,
+    hot_scored_at TIMESTAMPTZ DEFAULT NOW(),
+    mirror_version BIGINT, -- Bumped on every write; orders Redis mirror updates (srv/agents/task_mirror.py)
     
     -- Hormone rewards (dopamine injection on completion)
     dopamine_reward DECIMAL DEFAULT 1.0,
@@ -118,4 +121,200 @@ CREATE TABLE agent_interactions (
 CREATE INDEX idx_agents_team ON agents(team);
 CREATE INDEX idx_tasks_status ON tasks(status);
 CREATE INDEX idx_tasks_hot_score ON tasks(hot_score DESC);
+-- Ranked walk over open tasks only, for GET /tasks/hot and the candidate scan of
+-- POST /tasks/claim-next: the top N entries, then N heap fetches. Nothing is
+-- INCLUDEd: title, category and description are unbounded TEXT and could push an
+-- entry past the btree tuple limit, failing the INSERT
+CREATE INDEX idx_tasks_open_rank ON tasks(hot_score DESC, priority DESC)
+    WHERE status = 'open';
+-- Decay passes page through the longest-unscored open tasks on (hot_scored_at, id)
+CREATE INDEX idx_tasks_open_hot_scored_at ON tasks(hot_scored_at, id) WHERE status = 'open';
 CREATE INDEX idx_perspectives_task ON task_perspectives(task_id);
+
+-- ============================================================================
+-- HOT RANKING (Lemmy-style: log-scaled score over a power-law age penalty)
+-- ============================================================================
+
+-- Inputs are explicit (including as_of) so the function is IMMUTABLE
+CREATE OR REPLACE FUNCTION task_hot_score(
+    upvotes INTEGER,
+    downvotes INTEGER,
+    priority INTEGER,
+    dopamine_reward DECIMAL,
+    created_at TIMESTAMPTZ,
+    as_of TIMESTAMPTZ
+) RETURNS DECIMAL AS $$
+    SELECT ROUND((
+        10000 * LOG(GREATEST(1,
+            3
+            + COALESCE(upvotes, 0) - COALESCE(downvotes, 0)
+            + COALESCE(priority, 5)
+            + 2 * COALESCE(dopamine_reward, 1.0)
+        ))
+        / POWER(GREATEST(EXTRACT(EPOCH FROM (as_of - COALESCE(created_at, as_of))), 0) / 3600 + 2, 1.8)
+    )::numeric, 4)
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Incremental: re-score a task only when its inputs change or it reopens.
+-- Ageing alone is handled by the decay passes in srv/agents/hot_rank.py.
+CREATE OR REPLACE FUNCTION tasks_refresh_hot_score()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.hot_score := task_hot_score(
+        NEW.upvotes, NEW.downvotes, NEW.priority, NEW.dopamine_reward, NEW.created_at, NOW()
+    );
+    NEW.hot_scored_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tasks_hot_score_insert
+BEFORE INSERT ON tasks
+FOR EACH ROW EXECUTE FUNCTION tasks_refresh_hot_score();
+
+CREATE TRIGGER tasks_hot_score_update
+BEFORE UPDATE OF upvotes, downvotes, priority, dopamine_reward, status ON tasks
+FOR EACH ROW
+WHEN (
+    OLD.upvotes IS DISTINCT FROM NEW.upvotes
+    OR OLD.downvotes IS DISTINCT FROM NEW.downvotes
+    OR OLD.priority IS DISTINCT FROM NEW.priority
+    OR OLD.dopamine_reward IS DISTINCT FROM NEW.dopamine_reward
+    OR (NEW.status = 'open' AND OLD.status IS DISTINCT FROM 'open')
+)
+EXECUTE FUNCTION tasks_refresh_hot_score();
+
+-- ============================================================================
+-- TASK FEED (GET /tasks/feed: NOTIFY for live delivery, table for resume)
+-- ============================================================================
+
+CREATE TABLE task_events (
+    event_id BIGSERIAL PRIMARY KEY,
+    task_id UUID NOT NULL,
+    event_type TEXT NOT NULL CHECK (event_type IN ('created', 'status')),
+    status TEXT,
+    category TEXT,
+    team_assignment TEXT,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX idx_task_events_created_at ON task_events(created_at);
+
+-- One event row per insert / status change; the NOTIFY carries the whole
+-- event (well under the 8000-byte payload limit) so listeners never query back
+CREATE OR REPLACE FUNCTION tasks_publish_event()
+RETURNS TRIGGER AS $$
+DECLARE
+    event task_events%ROWTYPE;
+BEGIN
+    INSERT INTO task_events (task_id, event_type, status, category, team_assignment, payload)
+    VALUES (
+        NEW.id,
+        CASE WHEN TG_OP = 'INSERT' THEN 'created' ELSE 'status' END,
+        NEW.status,
+        NEW.category,
+        NEW.team_assignment,
+        jsonb_build_object(
+            'title', left(NEW.title, 200),
+            'priority', NEW.priority,
+            'hot_score', NEW.hot_score,
+            'dopamine_reward', NEW.dopamine_reward,
+            'assigned_to', NEW.assigned_to
+        )
+    )
+    RETURNING * INTO event;
+
+    PERFORM pg_notify('task_events', row_to_json(event)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tasks_event_insert
+AFTER INSERT ON tasks
+FOR EACH ROW EXECUTE FUNCTION tasks_publish_event();
+
+CREATE TRIGGER tasks_event_status
+AFTER UPDATE OF status ON tasks
+FOR EACH ROW
+WHEN (OLD.status IS DISTINCT FROM NEW.status)
+EXECUTE FUNCTION tasks_publish_event();
+
+-- ============================================================================
+-- HORMONE LEVELS (write-behind: deltas coalesced in Redis, flushed in batches)
+-- ============================================================================
+
+-- Same values as the agents.hormone_levels default
+CREATE OR REPLACE FUNCTION hormone_baseline()
+RETURNS JSONB AS $$
+    SELECT '{
+        "dopamine": 1.0,
+        "oxytocin": 1.0,
+        "adrenaline": 1.0,
+        "serotonin": 1.0,
+        "cortisol": 0.3,
+        "endorphin": 0.5
+    }'::jsonb
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Decay each level toward its baseline (exponential, half_life_seconds), then
+-- add the accumulated delta. Hormones without a baseline do not decay; a level
+-- within 0.001 of baseline snaps to it, so decay ends and the agent stops being rewritten.
+CREATE OR REPLACE FUNCTION hormones_step(
+    levels JSONB,
+    delta JSONB,
+    elapsed_seconds DOUBLE PRECISION,
+    half_life_seconds DOUBLE PRECISION
+) RETURNS JSONB AS $$
+    SELECT COALESCE(
+        jsonb_object_agg(
+            h.hormone,
+            ROUND(
+                CASE WHEN ABS(h.decayed - h.base) < 0.001 THEN h.base ELSE h.decayed END + h.delta,
+                4
+            )
+        ),
+        levels
+    )
+    FROM (
+        SELECT v.hormone, v.base, v.delta,
+               v.base + (v.level - v.base) * POWER(0.5, GREATEST(elapsed_seconds, 0) / half_life_seconds)::numeric AS decayed
+        FROM (
+            SELECT k.hormone,
+                   COALESCE((levels->>k.hormone)::numeric, (hormone_baseline()->>k.hormone)::numeric, 0) AS level,
+                   COALESCE((hormone_baseline()->>k.hormone)::numeric, (levels->>k.hormone)::numeric, 0) AS base,
+                   COALESCE((delta->>k.hormone)::numeric, 0) AS delta
+            FROM jsonb_object_keys(COALESCE(levels, hormone_baseline()) || COALESCE(delta, '{}'::jsonb)) AS k(hormone)
+        ) v
+    ) h
+$$ LANGUAGE sql IMMUTABLE;
+
+-- True when every baselined hormone sits at its baseline: decay would not change the row
+CREATE OR REPLACE FUNCTION hormones_at_baseline(levels JSONB)
+RETURNS BOOLEAN AS $$
+    SELECT NOT EXISTS (
+        SELECT 1
+        FROM jsonb_each_text(hormone_baseline()) AS b(hormone, base)
+        WHERE (levels->>b.hormone)::numeric IS DISTINCT FROM b.base::numeric
+    )
+$$ LANGUAGE sql IMMUTABLE;
+
+-- ============================================================================
+-- TASK MIRROR VERSIONS (Redis writes compare-and-set on this, see task_mirror.py)
+-- ============================================================================
+
+-- Row locks serialize writes to one task, so per task the version order is
+-- the commit order, whatever order the mirror writes reach Redis in
+CREATE SEQUENCE tasks_mirror_version_seq;
+
+CREATE OR REPLACE FUNCTION tasks_bump_mirror_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.mirror_version := nextval('tasks_mirror_version_seq');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tasks_mirror_version
+BEFORE INSERT OR UPDATE ON tasks
+FOR EACH ROW EXECUTE FUNCTION tasks_bump_mirror_version();
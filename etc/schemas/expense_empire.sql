@@ -19,8 +19,8 @@ CREATE TABLE receipts.users (
   full_name TEXT,
   subscription_tier TEXT DEFAULT 'free' CHECK (subscription_tier IN ('free', 'pro', 'enterprise')),
   monthly_receipt_limit INTEGER DEFAULT 10,
-  receipts_uploaded_this_month INTEGER DEFAULT 0,
-  month_reset_date DATE DEFAULT date_trunc('month', CURRENT_DATE) + INTERVAL '1 month',
+  receipts_uploaded_this_month INTEGER DEFAULT 0,  -- Copy of the Redis quota counter, synced by the API
+  month_reset_date DATE DEFAULT date_trunc('month', CURRENT_DATE) + INTERVAL '1 month',  -- Counter is stale once this passes
   is_heat_donor BOOLEAN DEFAULT FALSE,  -- Future: 20% compute donation flag
   created_at TIMESTAMPTZ DEFAULT NOW(),
   updated_at TIMESTAMPTZ DEFAULT NOW(),
@@ -73,6 +73,19 @@ INSERT INTO receipts.categories (category_code, category_name, cra_line_number,
   ('PROFESSIONAL', 'Professional Fees', '8862', 'Legal, accounting, consulting'),
   ('UTILITIES', 'Utilities', '9220', 'Phone, internet, hydro');
 
+-- Push invalidation for the per-worker category cache (api/categories.py)
+CREATE OR REPLACE FUNCTION receipts.notify_categories_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_notify('receipts_categories_changed', TG_OP);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER categories_notify_trigger
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON receipts.categories
+FOR EACH STATEMENT EXECUTE FUNCTION receipts.notify_categories_changed();
+
 -- Receipts table
 CREATE TABLE receipts.receipts (
   receipt_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -80,7 +93,7 @@ CREATE TABLE receipts.receipts (
 
   -- File metadata
   original_filename TEXT NOT NULL,
-  file_hash TEXT UNIQUE NOT NULL,  -- SHA256 for deduplication
+  file_hash TEXT NOT NULL,  -- SHA256 for deduplication (unique per user among live receipts)
   file_size_bytes INTEGER NOT NULL,
   mime_type TEXT NOT NULL CHECK (mime_type IN ('image/png', 'image/jpeg', 'application/pdf')),
   storage_path TEXT NOT NULL,  -- /var/phoenix_receipts_data/{user_id}/{receipt_id}.ext
@@ -88,6 +101,8 @@ CREATE TABLE receipts.receipts (
   -- Extraction status
   extraction_status TEXT DEFAULT 'pending' CHECK (extraction_status IN ('pending', 'processing', 'completed', 'failed', 'manual_review')),
   ai_confidence_score NUMERIC(3,2),  -- 0.00 to 1.00
+  extraction_attempts INTEGER DEFAULT 0,
+  next_attempt_at TIMESTAMPTZ DEFAULT NOW(),  -- Retry backoff / processing lease for ai/worker.py
 
   -- Extracted fields (Canadian CRA compliance)
   vendor_name TEXT,
@@ -116,11 +131,21 @@ CREATE TABLE receipts.receipts (
   updated_at TIMESTAMPTZ DEFAULT NOW()
 );
 
-CREATE INDEX idx_receipts_user_id ON receipts.receipts(user_id) WHERE deleted_at IS NULL;
+-- Keyset pagination for GET /api/receipts/list: (uploaded_at, receipt_id) < cursor
+CREATE INDEX idx_receipts_user_uploaded ON receipts.receipts(user_id, uploaded_at DESC, receipt_id DESC) WHERE deleted_at IS NULL;
 CREATE INDEX idx_receipts_file_hash ON receipts.receipts(file_hash);
+CREATE UNIQUE INDEX idx_receipts_user_file_hash ON receipts.receipts(user_id, file_hash) WHERE deleted_at IS NULL;
 CREATE INDEX idx_receipts_extraction_status ON receipts.receipts(extraction_status);
+-- Extraction queue: workers claim due rows with FOR UPDATE SKIP LOCKED
+CREATE INDEX idx_receipts_extraction_queue ON receipts.receipts(next_attempt_at)
+  WHERE extraction_status IN ('pending', 'processing') AND deleted_at IS NULL;
 CREATE INDEX idx_receipts_uploaded_at ON receipts.receipts(uploaded_at DESC);
-CREATE INDEX idx_receipts_expires_at ON receipts.receipts(expires_at) WHERE deleted_at IS NULL;
+-- Seeds a user's monthly quota counter (deleted and purged receipts still count)
+CREATE INDEX idx_receipts_user_uploaded_all ON receipts.receipts(user_id, uploaded_at);
+-- Expiry purge: keyset on (expires_at, receipt_id) in jobs/purge_expired.py
+CREATE INDEX idx_receipts_expires_at ON receipts.receipts(expires_at, receipt_id) WHERE deleted_at IS NULL;
+-- T2125 export: one user's receipts for a tax year (export/t2125.py)
+CREATE INDEX idx_receipts_user_transaction_date ON receipts.receipts(user_id, transaction_date) WHERE deleted_at IS NULL;
 
 -- Forensics trigger for receipt changes
 CREATE OR REPLACE FUNCTION receipts.log_receipt_changes()
@@ -157,7 +182,8 @@ CREATE TRIGGER receipt_audit_trigger
 AFTER UPDATE ON receipts.receipts
 FOR EACH ROW EXECUTE FUNCTION receipts.log_receipt_changes();
 
--- Ephemeral deletion function (cron job calls this daily)
+-- Ephemeral deletion function (single statement; the daily run uses jobs/purge_expired.py,
+-- which batches, checkpoints and also removes the stored files)
 CREATE OR REPLACE FUNCTION receipts.delete_expired_receipts()
 RETURNS TABLE(deleted_count INTEGER) AS $$
 DECLARE
@@ -177,6 +203,16 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Resume points for batch jobs under srv/receipts/jobs
+CREATE TABLE receipts.job_checkpoints (
+  job_name TEXT PRIMARY KEY,
+  position JSONB,  -- Job-specific keyset position / in-flight work
+  run_started_at TIMESTAMPTZ,
+  run_finished_at TIMESTAMPTZ,  -- Older than run_started_at = interrupted, next run resumes
+  last_run_stats JSONB,
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
 -- ============================================================================
 -- PHASE 3: AI ORACLE — VENDOR NORMALIZATION & LEARNING
 -- ============================================================================
@@ -192,35 +228,153 @@ CREATE TABLE receipts.vendor_aliases (
 );
 
 CREATE INDEX idx_vendor_aliases_raw ON receipts.vendor_aliases(raw_vendor_name);
+CREATE INDEX idx_vendor_aliases_raw_lower ON receipts.vendor_aliases(LOWER(raw_vendor_name));
 CREATE INDEX idx_vendor_aliases_normalized ON receipts.vendor_aliases(normalized_vendor_name);
 
--- Function to normalize vendor names
+-- Push invalidation for the per-worker vendor index (ai/vendors.py)
+-- Counter flushes (times_seen, last_seen_at) do not fire it
+CREATE OR REPLACE FUNCTION receipts.notify_vendor_aliases_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_notify('receipts_vendor_aliases_changed', TG_OP);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER vendor_aliases_notify_trigger
+AFTER INSERT OR DELETE OR TRUNCATE OR UPDATE OF raw_vendor_name, normalized_vendor_name
+ON receipts.vendor_aliases
+FOR EACH STATEMENT EXECUTE FUNCTION receipts.notify_vendor_aliases_changed();
+
+-- Function to normalize vendor names (ad-hoc SQL use; extraction uses the in-memory
+-- index in ai/vendors.py, which also batches the times_seen counters)
 CREATE OR REPLACE FUNCTION receipts.normalize_vendor_name(raw_name TEXT)
 RETURNS TEXT AS $$
 DECLARE
   normalized TEXT;
 BEGIN
-  -- Check if we have a known alias
+  -- Check if we have a known alias (served by idx_vendor_aliases_raw_lower)
   SELECT normalized_vendor_name INTO normalized
   FROM receipts.vendor_aliases
   WHERE LOWER(raw_vendor_name) = LOWER(raw_name)
   ORDER BY times_seen DESC
   LIMIT 1;
 
-  IF normalized IS NOT NULL THEN
-    -- Update times_seen counter
-    UPDATE receipts.vendor_aliases
-    SET times_seen = times_seen + 1, last_seen_at = NOW()
-    WHERE LOWER(raw_vendor_name) = LOWER(raw_name);
+  -- Fall back to original name (title case)
+  RETURN COALESCE(normalized, initcap(raw_name));
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Content-addressed extraction results (ai/extraction_cache.py, Redis fallback)
+CREATE TABLE receipts.extraction_cache (
+  cache_key TEXT PRIMARY KEY,  -- extraction:{prompt_version}:{model}:{file_hash}
+  file_hash TEXT NOT NULL,
+  extraction_model TEXT NOT NULL,
+  prompt_version TEXT NOT NULL,
+  result JSONB NOT NULL,
+  gpu_seconds NUMERIC(10,3),  -- Inference time each hit avoids
+  hit_count INTEGER DEFAULT 0,
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  last_hit_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX idx_extraction_cache_last_hit ON receipts.extraction_cache(last_hit_at);
+
+-- ============================================================================
+-- PHASE 4: CRA EXPORT — BACKGROUND T2125 WORKBOOKS
+-- ============================================================================
+
+-- Large Excel exports run as jobs (export/jobs.py); files live under {UPLOAD_DIR}/exports
+CREATE TABLE receipts.export_jobs (
+  job_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  user_id UUID NOT NULL REFERENCES receipts.users(user_id),
+  tax_year INTEGER,  -- NULL = all years
+  status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'completed', 'failed')),
+  receipt_count INTEGER,
+  file_path TEXT,
+  file_size_bytes BIGINT,
+  error TEXT,
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  updated_at TIMESTAMPTZ DEFAULT NOW(),  -- Heartbeat while queued or running
+  completed_at TIMESTAMPTZ,
+  expires_at TIMESTAMPTZ
+);
+
+CREATE INDEX idx_export_jobs_user ON receipts.export_jobs(user_id, created_at DESC);
+CREATE INDEX idx_export_jobs_expires_at ON receipts.export_jobs(expires_at);
 
-    RETURN normalized;
-  ELSE
-    -- Return original name (title case)
-    RETURN initcap(raw_name);
+-- Per-user, per-year T2125 totals, maintained incrementally by trigger
+-- Live (deleted_at IS NULL) receipts with a transaction_date; NULL category_id = uncategorized
+-- Rebuild / verify: python -m jobs.t2125_summary rebuild|verify
+CREATE TABLE receipts.t2125_summary (
+  user_id UUID NOT NULL REFERENCES receipts.users(user_id),
+  tax_year INTEGER NOT NULL,
+  category_id INTEGER REFERENCES receipts.categories(category_id),
+  receipt_count INTEGER NOT NULL DEFAULT 0,
+  total_amount NUMERIC(14,2) NOT NULL DEFAULT 0,
+  tax_amount NUMERIC(14,2) NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ DEFAULT NOW(),
+  CONSTRAINT t2125_summary_key UNIQUE NULLS NOT DISTINCT (user_id, tax_year, category_id)
+);
+
+-- Add one receipt's contribution (sign = 1) or take it back (sign = -1)
+CREATE OR REPLACE FUNCTION receipts.t2125_summary_apply(
+  p_user_id UUID, p_date DATE, p_category_id INTEGER,
+  p_total NUMERIC, p_tax NUMERIC, sign INTEGER
+)
+RETURNS VOID AS $$
+BEGIN
+  INSERT INTO receipts.t2125_summary AS s
+    (user_id, tax_year, category_id, receipt_count, total_amount, tax_amount)
+  VALUES (
+    p_user_id, EXTRACT(YEAR FROM p_date)::INTEGER, p_category_id,
+    sign, sign * COALESCE(p_total, 0), sign * COALESCE(p_tax, 0)
+  )
+  ON CONFLICT ON CONSTRAINT t2125_summary_key DO UPDATE
+  SET receipt_count = s.receipt_count + EXCLUDED.receipt_count,
+      total_amount = s.total_amount + EXCLUDED.total_amount,
+      tax_amount = s.tax_amount + EXCLUDED.tax_amount,
+      updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Covers inserts, extraction results, manual corrections, soft-delete/restore and hard delete
+CREATE OR REPLACE FUNCTION receipts.maintain_t2125_summary()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.deleted_at IS NULL AND OLD.transaction_date IS NOT NULL THEN
+    PERFORM receipts.t2125_summary_apply(
+      OLD.user_id, OLD.transaction_date, OLD.category_id, OLD.total_amount, OLD.tax_amount, -1
+    );
   END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.deleted_at IS NULL AND NEW.transaction_date IS NOT NULL THEN
+    PERFORM receipts.t2125_summary_apply(
+      NEW.user_id, NEW.transaction_date, NEW.category_id, NEW.total_amount, NEW.tax_amount, 1
+    );
+  END IF;
+  RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
+CREATE TRIGGER receipt_t2125_summary_insert_delete_trigger
+AFTER INSERT OR DELETE ON receipts.receipts
+FOR EACH ROW EXECUTE FUNCTION receipts.maintain_t2125_summary();
+
+-- Status-only updates (extraction progress, leases) skip the summary entirely
+CREATE TRIGGER receipt_t2125_summary_update_trigger
+AFTER UPDATE OF user_id, transaction_date, category_id, total_amount, tax_amount, deleted_at
+ON receipts.receipts
+FOR EACH ROW
+WHEN (
+  OLD.user_id IS DISTINCT FROM NEW.user_id
+  OR OLD.transaction_date IS DISTINCT FROM NEW.transaction_date
+  OR OLD.category_id IS DISTINCT FROM NEW.category_id
+  OR OLD.total_amount IS DISTINCT FROM NEW.total_amount
+  OR OLD.tax_amount IS DISTINCT FROM NEW.tax_amount
+  OR OLD.deleted_at IS DISTINCT FROM NEW.deleted_at
+)
+EXECUTE FUNCTION receipts.maintain_t2125_summary();
+
 -- ============================================================================
 -- PHASE 5: SLIME EVOLUTION — NEUROTRANSMITTER GAMIFICATION
 -- ============================================================================
@@ -301,54 +455,66 @@ BEGIN
   WHERE total_receipts_processed >= 100
     AND NOT ('power_user' = ANY(achievement_badges));
 
-  -- Reset monthly receipt counters (first Monday of month)
-  IF EXTRACT(DAY FROM CURRENT_DATE) <= 7 THEN
-    UPDATE receipts.users
-    SET
-      receipts_uploaded_this_month = 0,
-      month_reset_date = date_trunc('month', CURRENT_DATE) + INTERVAL '1 month',
-      updated_at = NOW();
-  END IF;
+  -- Monthly upload counters are not reset here: quota keys in Redis are
+  -- per month, and month_reset_date marks the synced copy stale.
 END;
 $$ LANGUAGE plpgsql;
 
--- Function to update streak when receipt is uploaded
+-- Function to update streak when receipts are uploaded
+-- Statement-level: a bulk import of n receipts touches each user's rows once.
+-- Produces exactly what n sequential per-row updates would (CURRENT_DATE is
+-- fixed for the transaction, so rows 2..n only bump the counters and fold
+-- the new streak into longest_streak_days).
 CREATE OR REPLACE FUNCTION receipts.update_upload_streak()
 RETURNS TRIGGER AS $$
 BEGIN
-  UPDATE receipts.user_neurotransmitters
+  WITH uploads AS (
+    SELECT user_id, COUNT(*) AS n
+    FROM inserted_receipts
+    GROUP BY user_id
+  ),
+  streaks AS (
+    SELECT
+      t.user_id,
+      u.n,
+      CASE
+        WHEN t.last_upload_date = CURRENT_DATE - INTERVAL '1 day' THEN t.current_streak_days + 1
+        WHEN t.last_upload_date = CURRENT_DATE THEN t.current_streak_days
+        ELSE 1
+      END AS new_streak,
+      GREATEST(
+        t.longest_streak_days,
+        CASE
+          WHEN t.last_upload_date = CURRENT_DATE - INTERVAL '1 day' THEN t.current_streak_days + 1
+          ELSE t.current_streak_days
+        END
+      ) AS first_longest
+    FROM receipts.user_neurotransmitters t
+    JOIN uploads u ON u.user_id = t.user_id
+  )
+  UPDATE receipts.user_neurotransmitters t
   SET
-    total_receipts_processed = total_receipts_processed + 1,
-    current_streak_days = CASE
-      WHEN last_upload_date = CURRENT_DATE - INTERVAL '1 day' THEN current_streak_days + 1
-      WHEN last_upload_date = CURRENT_DATE THEN current_streak_days
-      ELSE 1
+    total_receipts_processed = t.total_receipts_processed + s.n,
+    current_streak_days = s.new_streak,
+    longest_streak_days = CASE
+      WHEN s.n > 1 THEN GREATEST(s.first_longest, s.new_streak)
+      ELSE s.first_longest
     END,
-    longest_streak_days = GREATEST(
-      longest_streak_days,
-      CASE
-        WHEN last_upload_date = CURRENT_DATE - INTERVAL '1 day' THEN current_streak_days + 1
-        ELSE current_streak_days
-      END
-    ),
     last_upload_date = CURRENT_DATE,
-    dopamine_score = dopamine_score + 10,  -- +10 dopamine per upload
+    dopamine_score = t.dopamine_score + 10 * s.n,  -- +10 dopamine per upload
     updated_at = NOW()
-  WHERE user_id = NEW.user_id;
+  FROM streaks s
+  WHERE t.user_id = s.user_id;
 
-  -- Update user's monthly receipt counter
-  UPDATE receipts.users
-  SET receipts_uploaded_this_month = receipts_uploaded_this_month + 1,
-      updated_at = NOW()
-  WHERE user_id = NEW.user_id;
-
-  RETURN NEW;
+  -- receipts_uploaded_this_month is owned by the API's Redis quota counter
+  RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
 CREATE TRIGGER receipt_upload_streak_trigger
 AFTER INSERT ON receipts.receipts
-FOR EACH ROW EXECUTE FUNCTION receipts.update_upload_streak();
+REFERENCING NEW TABLE AS inserted_receipts
+FOR EACH STATEMENT EXECUTE FUNCTION receipts.update_upload_streak();
 
 -- ============================================================================
 -- USEFUL VIEWS
@@ -361,7 +527,8 @@ SELECT
   u.email,
   u.full_name,
   u.subscription_tier,
-  u.receipts_uploaded_this_month,
+  CASE WHEN u.month_reset_date > CURRENT_DATE THEN u.receipts_uploaded_this_month ELSE 0 END
+    AS receipts_uploaded_this_month,
   u.monthly_receipt_limit,
   u.created_at,
   n.current_streak_days,
@@ -0,0 +1,165 @@
+"""
+Task Board Read-Path Benchmark
+GET /tasks/hot served from Postgres vs the Redis mirror, with a large open board
+
+Seeds bench tasks (category 'bench_mirror') until the board has --open-tasks
+open tasks, rebuilds the mirror, times each read path, then removes the
+bench tasks. Run it against a staging database, not the live board.
+
+    python bench_task_mirror.py --open-tasks 100000 --requests 5000 --concurrency 16
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from psycopg2.extras import RealDictCursor
+
+from task_board_api import get_db
+from task_mirror import OPEN_KEY, TaskMirror, create_redis
+
+BENCH_CATEGORY = "bench_mirror"
+
+HOT_SQL = """
+    SELECT id, title, description, category, hot_score,
+           dopamine_reward, status, perspectives_required, perspectives_collected
+    FROM tasks
+    WHERE status = 'open'
+    ORDER BY hot_score DESC, priority DESC
+    LIMIT %s
+"""
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))]
+
+
+def seed(open_tasks: int) -> int:
+    """Top the open board up to open_tasks with spread-out votes, priorities and ages"""
+    conn = get_db()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM tasks WHERE status = 'open'")
+            missing = max(0, open_tasks - cur.fetchone()[0])
+            cur.execute("""
+                INSERT INTO tasks (title, description, category, priority, dopamine_reward, upvotes, downvotes, created_at)
+                SELECT 'Bench task ' || g, repeat('lorem ipsum ', 20), %s,
+                       1 + g %% 10, 0.5 + (g %% 7) * 0.5, g %% 40, g %% 5,
+                       NOW() - (g %% 20000) * INTERVAL '1 minute'
+                FROM generate_series(1, %s) AS g
+            """, (BENCH_CATEGORY, missing))
+        conn.commit()
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE tasks")
+        conn.commit()
+        return missing
+    finally:
+        conn.close()
+
+
+def cleanup():
+    conn = get_db()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM task_events WHERE category = %s", (BENCH_CATEGORY,))
+            cur.execute("DELETE FROM tasks WHERE category = %s", (BENCH_CATEGORY,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def postgres_connect_per_call(limit: int):
+    """What /tasks/hot does without the mirror: a new connection and a dict per row"""
+    conn = get_db()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(HOT_SQL, (limit,))
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+
+async def measure(name: str, call, requests: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "path": name,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(1000 * percentile(latencies, 50), 3),
+        "p95_ms": round(1000 * percentile(latencies, 95), 3),
+        "p99_ms": round(1000 * percentile(latencies, 99), 3),
+        "mean_ms": round(1000 * statistics.fmean(latencies), 3),
+    }
+
+
+async def run(args):
+    print(f"Seeding up to {args.open_tasks} open tasks")
+    print(f"Inserted {await asyncio.to_thread(seed, args.open_tasks)} bench tasks")
+
+    mirror = TaskMirror(create_redis())
+    try:
+        print(f"Mirror rebuilt with {await mirror.rebuild(get_db)} open tasks")
+        print(f"ZCARD {OPEN_KEY} = {await mirror.redis.zcard(OPEN_KEY)}")
+
+        # Reused connection: isolates query cost from connection setup
+        held = get_db()
+        held_lock = asyncio.Lock()
+
+        def held_query():
+            with held.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(HOT_SQL, (args.limit,))
+                rows = cur.fetchall()
+            held.rollback()
+            return rows
+
+        async def postgres_held():
+            async with held_lock:
+                await asyncio.to_thread(held_query)
+
+        paths = [
+            ("postgres, connection per call", lambda: asyncio.to_thread(postgres_connect_per_call, args.limit)),
+            ("postgres, reused connection", postgres_held),
+            ("redis mirror", lambda: mirror.hot(args.limit)),
+        ]
+        results = []
+        for name, call in paths:
+            await measure(name, call, min(200, args.requests), args.concurrency)  # Warm-up
+            results.append(await measure(name, call, args.requests, args.concurrency))
+        held.close()
+
+        print(f"\n/tasks/hot?limit={args.limit}, {args.requests} requests, concurrency {args.concurrency}")
+        print(f"{'path':<32} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for r in results:
+            print(f"{r['path']:<32} {r['rps']:>9} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9}")
+    finally:
+        if not args.keep:
+            await asyncio.to_thread(cleanup)
+            await mirror.rebuild(get_db)
+        await mirror.redis.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--open-tasks", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=5000, help="Requests per read path")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--limit", type=int, default=10, help="/tasks/hot page size")
+    parser.add_argument("--keep", action="store_true", help="Leave the bench tasks in place")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Hormone Accumulator
+Write-behind hormone deltas: coalesced in Redis, flushed to agents.hormone_levels in one UPDATE
+
+Claims and completions only add to a per-agent Redis hash (hormone deltas
+plus the tasks_completed count). Every HORMONE_FLUSH_SECONDS the task board
+takes the pending hashes and applies them, together with decay toward
+baseline, in one UPDATE over all touched agents instead of a row rewrite
+per event. Agents already at baseline are left alone.
+
+Pending deltas exist only in Redis until they are flushed, so they live on
+their own Redis (HORMONE_REDIS_HOST/PORT, run with maxmemory-policy
+noeviction) rather than the LRU cache. What can still be lost:
+- records from the last second, on a Redis crash (appendfsync everysec)
+- a delta recorded while both Redis and Postgres fail (logged, counted in lost_agents)
+On a Redis that may evict keys without a TTL (allkeys-*), record() writes
+straight to Postgres instead; a dirty agent whose hash is missing at flush
+is logged and counted in lost_agents.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "hormones:pending:{}"
+DIRTY_KEY = "hormones:dirty"
+COMPLETED_FIELD = "tasks_completed"  # Counter kept in the same pending hash as the hormones
+
+# Defaults of agents.hormone_levels; decay pulls each level back toward these
+BASELINE = {
+    "dopamine": 1.0,
+    "oxytocin": 1.0,
+    "adrenaline": 1.0,
+    "serotonin": 1.0,
+    "cortisol": 0.3,
+    "endorphin": 0.5,
+}
+
+HORMONE_REDIS_HOST = os.getenv("HORMONE_REDIS_HOST", os.getenv("REDIS_HOST", "localhost"))
+HORMONE_REDIS_PORT = int(os.getenv("HORMONE_REDIS_PORT", "6380"))
+HORMONE_FLUSH_SECONDS = float(os.getenv("HORMONE_FLUSH_SECONDS", "5"))
+HORMONE_FLUSH_BATCH = int(os.getenv("HORMONE_FLUSH_BATCH", "500"))
+HORMONE_DECAY_SECONDS = float(os.getenv("HORMONE_DECAY_SECONDS", "300"))  # Idle agents off baseline decay this often
+HORMONE_HALF_LIFE_SECONDS = float(os.getenv("HORMONE_HALF_LIFE_SECONDS", "3600"))
+
+# KEYS[1] = dirty set; ARGV = max agents, pending key prefix
+# Pops up to N agents and returns {agent_id, {field, value, ...}, ...}, deleting their
+# pending hashes in the same step so increments that arrive later start a new hash
+TAKE_LUA = """
+local ids = redis.call('SPOP', KEYS[1], ARGV[1])
+local out = {}
+for _, id in ipairs(ids) do
+  local key = ARGV[2] .. id
+  out[#out + 1] = id
+  out[#out + 1] = redis.call('HGETALL', key)
+  redis.call('DEL', key)
+end
+return out
+"""
+
+# Agents with pending deltas, plus idle agents due for decay that are not at
+# baseline yet (agents at rest are never rewritten), in one statement
+FLUSH_SQL = """
+    WITH deltas AS (
+        SELECT agent_id, delta, completed
+        FROM unnest(%s::uuid[], %s::jsonb[], %s::int[]) AS d(agent_id, delta, completed)
+    ),
+    targets AS (
+        SELECT a.id, d.delta, d.completed,
+               EXTRACT(EPOCH FROM NOW() - COALESCE(a.hormones_decayed_at, NOW())) AS elapsed
+        FROM agents a
+        LEFT JOIN deltas d ON d.agent_id = a.id
+        WHERE d.agent_id IS NOT NULL
+           OR (a.hormones_decayed_at < NOW() - make_interval(secs => %s)
+               AND NOT hormones_at_baseline(a.hormone_levels))
+        FOR UPDATE OF a
+    )
+    UPDATE agents a
+    SET hormone_levels = hormones_step(a.hormone_levels, t.delta, t.elapsed, %s),
+        hormones_decayed_at = NOW(),
+        tasks_completed = a.tasks_completed + COALESCE(t.completed, 0)
+    FROM targets t
+    WHERE a.id = t.id
+"""
+
+# Direct write while Redis is down: the listed agents only, no decay
+DIRECT_SQL = """
+    UPDATE agents a
+    SET hormone_levels = hormones_step(a.hormone_levels, d.delta, 0, %s),
+        tasks_completed = a.tasks_completed + d.completed
+    FROM unnest(%s::uuid[], %s::jsonb[], %s::int[]) AS d(agent_id, delta, completed)
+    WHERE a.id = d.agent_id
+"""
+
+
+def merge(levels: dict | None, pending: dict) -> dict:
+    """Stored levels plus deltas not flushed yet (the pending tasks_completed count is ignored)"""
+    merged = dict(levels or BASELINE)
+    for hormone, delta in pending.items():
+        if hormone == COMPLETED_FIELD:
+            continue
+        merged[hormone] = round(float(merged.get(hormone, BASELINE.get(hormone, 0.0))) + float(delta), 4)
+    return merged
+
+
+def split_pending(fields: dict) -> tuple[dict, int]:
+    """A pending hash as (hormone deltas, tasks completed)"""
+    deltas = {hormone: float(value) for hormone, value in fields.items() if hormone != COMPLETED_FIELD}
+    return deltas, int(float(fields.get(COMPLETED_FIELD, 0)))
+
+
+class HormoneAccumulator:
+    """
+    Coalesced hormone deltas per agent
+
+    - record() is one MULTI/EXEC: HINCRBYFLOAT per hormone (HINCRBY for a
+      completion) + SADD to the dirty set
+    - flush() takes dirty agents atomically (Lua) and writes them in one UPDATE,
+      restoring the deltas to Redis if that UPDATE fails (or, with Redis down
+      too, writing them without decay)
+    - While Redis is down, or may evict keys without a TTL, record() applies
+      the delta to Postgres directly
+    - state() / merge_pending() add unflushed deltas to stored levels
+    """
+
+    def __init__(self, client, connect):
+        self.redis = client
+        self._connect = connect
+        self._take = client.register_script(TAKE_LUA)
+        self._task: asyncio.Task | None = None
+        self._evicting = False
+        self.recorded = 0
+        self.direct_writes = 0
+        self.lost_agents = 0
+        self.flushed_agents = 0
+        self.flush_seconds = 0.0
+
+    async def record(self, agent_id: str, deltas: dict, completed: int = 0):
+        """
+        Queue hormone deltas (and completed tasks) for the next flush
+
+        Called after the claim or completion has committed, so it never raises:
+        a delta that can reach neither Redis nor Postgres is logged and dropped.
+        """
+        deltas = {hormone: delta for hormone, delta in deltas.items() if delta}
+        if not deltas and not completed:
+            return
+        if self._evicting:
+            await self._write_direct(str(agent_id), deltas, completed)
+            return
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for hormone, delta in deltas.items():
+                    pipe.hincrbyfloat(PENDING_KEY.format(agent_id), hormone, delta)
+                if completed:
+                    pipe.hincrby(PENDING_KEY.format(agent_id), COMPLETED_FIELD, completed)
+                pipe.sadd(DIRTY_KEY, str(agent_id))
+                await pipe.execute()
+            self.recorded += 1
+        except redis.RedisError as e:
+            logger.warning(f"Hormone delta for {agent_id} written directly, Redis unavailable: {e}")
+            await self._write_direct(str(agent_id), deltas, completed)
+
+    async def _write_direct(self, agent_id: str, deltas: dict, completed: int):
+        try:
+            await asyncio.to_thread(self._write, [agent_id], [deltas], [completed], decay=False)
+            self.direct_writes += 1
+        except Exception as e:
+            self.lost_agents += 1
+            logger.error(f"Hormone delta for {agent_id} lost ({deltas}, completed={completed}): {e}")
+
+    async def start(self):
+        if self._task is None:
+            await self.check_eviction()
+            self._task = asyncio.create_task(self._run())
+
+    async def check_eviction(self):
+        """Stop write-behind while Redis could evict pending hashes or the dirty set"""
+        try:
+            policy = (await self.redis.config_get("maxmemory-policy")).get("maxmemory-policy", "")
+        except redis.RedisError as e:
+            # CONFIG may be renamed away; record() still falls back if Redis itself fails
+            logger.warning(f"Hormone Redis eviction policy unknown, assuming noeviction: {e}")
+            return
+        # volatile-* policies only evict keys with a TTL, and pending keys have none
+        evicting = policy.startswith("allkeys-")
+        if evicting and not self._evicting:
+            logger.error(f"Hormone Redis uses maxmemory-policy {policy}, writing deltas to Postgres directly")
+        self._evicting = evicting
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"Final hormone flush failed: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(HORMONE_FLUSH_SECONDS)
+            try:
+                await self.check_eviction()
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Hormone flush failed: {e}")
+
+    async def flush(self):
+        """Apply pending deltas (and due decay) to agents.hormone_levels"""
+        started = time.perf_counter()
+        try:
+            taken = await self._take(keys=[DIRTY_KEY], args=[HORMONE_FLUSH_BATCH, PENDING_KEY.format("")])
+        except redis.RedisError as e:
+            # Nothing pending can be read, but decay still runs
+            logger.warning(f"Pending hormone deltas unavailable: {e}")
+            taken = []
+        agent_ids = [str(agent_id) for agent_id in taken[0::2]]
+        lost = [agent_id for agent_id, fields in zip(agent_ids, taken[1::2]) if not fields]
+        if lost:
+            # Listed as dirty but the hash is gone: only eviction (or a manual DEL) does that
+            self.lost_agents += len(lost)
+            logger.error(f"Pending hormone deltas missing for {len(lost)} agents, lost: {', '.join(lost[:10])}")
+        pending = [
+            split_pending({fields[i]: fields[i + 1] for i in range(0, len(fields), 2)})
+            for fields in taken[1::2]
+        ]
+        deltas = [delta for delta, _ in pending]
+        completed = [count for _, count in pending]
+        try:
+            await asyncio.to_thread(self._write, agent_ids, deltas, completed, decay=True)
+        except Exception:
+            if agent_ids:
+                await self._hand_back(agent_ids, deltas, completed)
+            raise
+        self.flushed_agents += len(agent_ids)
+        self.flush_seconds += time.perf_counter() - started
+
+    async def _hand_back(self, agent_ids: list[str], deltas: list[dict], completed: list[int]):
+        """Return taken deltas to Redis for the next flush; with Redis down too, write them directly"""
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for agent_id, delta, count in zip(agent_ids, deltas, completed):
+                    for hormone, value in delta.items():
+                        pipe.hincrbyfloat(PENDING_KEY.format(agent_id), hormone, value)
+                    if count:
+                        pipe.hincrby(PENDING_KEY.format(agent_id), COMPLETED_FIELD, count)
+                    pipe.sadd(DIRTY_KEY, agent_id)
+                await pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Hormone deltas for {len(agent_ids)} agents written directly, Redis unavailable: {e}")
+            await asyncio.to_thread(self._write, agent_ids, deltas, completed, decay=False)
+            self.direct_writes += 1
+
+    def _write(self, agent_ids: list[str], deltas: list[dict], completed: list[int], decay: bool):
+        # decay=False: only the listed agents, no decay (direct write while Redis is down)
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                if decay:
+                    cur.execute(FLUSH_SQL, (
+                        agent_ids, [json.dumps(d) for d in deltas], completed,
+                        HORMONE_DECAY_SECONDS, HORMONE_HALF_LIFE_SECONDS,
+                    ))
+                else:
+                    cur.execute(DIRECT_SQL, (
+                        HORMONE_HALF_LIFE_SECONDS, agent_ids, [json.dumps(d) for d in deltas], completed,
+                    ))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    async def merge_pending(self, agents: list[dict]) -> list[dict]:
+        """
+        Add unflushed deltas to rows carrying id and hormone_levels (and tasks_completed,
+        if selected); rows come back as stored on Redis errors
+        """
+        if not agents:
+            return agents
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for agent in agents:
+                    pipe.hgetall(PENDING_KEY.format(agent["id"]))
+                pending = await pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Pending hormone deltas unavailable: {e}")
+            return agents
+        merged = []
+        for agent, fields in zip(agents, pending):
+            if fields:
+                agent = {**agent, "hormone_levels": merge(agent["hormone_levels"], fields)}
+                if "tasks_completed" in agent:
+                    agent["tasks_completed"] = (agent["tasks_completed"] or 0) + split_pending(fields)[1]
+            merged.append(agent)
+        return merged
+
+    async def state(self, agent_id: str) -> dict | None:
+        """Current hormone levels of one agent, pending deltas included (None if unknown)"""
+        def load():
+            conn = self._connect()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT hormone_levels FROM agents WHERE id = %s", (agent_id,))
+                    return cur.fetchone()
+            finally:
+                conn.close()
+
+        row = await asyncio.to_thread(load)
+        if not row:
+            return None
+        return (await self.merge_pending([{"id": agent_id, "hormone_levels": row[0]}]))[0]["hormone_levels"]
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "direct_writes": self.direct_writes,
+            "lost_agents": self.lost_agents,
+            "evicting": self._evicting,
+            "flushed_agents": self.flushed_agents,
+            "flush_seconds": round(self.flush_seconds, 3),
+        }
+
@@ -0,0 +1,133 @@
+"""
+Hot Rank Engine
+Time decay for tasks.hot_score, applied to open tasks in small batches
+
+Vote, priority and reward changes are scored immediately by the
+tasks_hot_score_* triggers; this loop only re-scores open tasks as they age,
+and only those whose score has moved by HOT_RANK_MIN_CHANGE since it was stored.
+
+    python hot_rank.py           # run forever
+    python hot_rank.py --once    # one full pass (cron)
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+HOT_RANK_INTERVAL_SECONDS = float(os.getenv("HOT_RANK_INTERVAL_SECONDS", "300"))
+HOT_RANK_BATCH_SIZE = int(os.getenv("HOT_RANK_BATCH_SIZE", "500"))
+HOT_RANK_BATCH_PAUSE_SECONDS = float(os.getenv("HOT_RANK_BATCH_PAUSE_SECONDS", "0.05"))
+
+# Decay is skipped unless it moves a score by at least this fraction: old tasks
+# barely age between passes, and every write costs index updates, a mirror
+# version bump and a Redis rescore
+HOT_RANK_MIN_CHANGE = float(os.getenv("HOT_RANK_MIN_CHANGE", "0.01"))
+
+# One keyset page of stale open tasks (oldest scores first), re-scoring only those
+# whose score moved enough. Returns every examined row, with the new score and
+# priority for the re-scored ones, so the caller can page on (hot_scored_at, id).
+# Rows being claimed or voted on right now are skipped (their own update
+# re-scores them or the next pass picks them up).
+DECAY_BATCH_SQL = """
+    WITH examined AS (
+        SELECT id, hot_scored_at, hot_score,
+               task_hot_score(upvotes, downvotes, priority, dopamine_reward, created_at, NOW()) AS new_score
+        FROM tasks
+        WHERE status = 'open'
+          AND hot_scored_at < NOW() - make_interval(secs => %(max_age)s)
+          AND (%(after_at)s::timestamptz IS NULL OR (hot_scored_at, id) > (%(after_at)s, %(after_id)s::uuid))
+        ORDER BY hot_scored_at, id
+        LIMIT %(limit)s
+    ),
+    stale AS (
+        SELECT t.id, e.new_score
+        FROM tasks t
+        JOIN examined e ON e.id = t.id
+        WHERE e.new_score IS DISTINCT FROM e.hot_score
+          AND (e.hot_score IS NULL OR ABS(e.new_score - e.hot_score) >= %(min_change)s * ABS(e.hot_score))
+        FOR UPDATE OF t SKIP LOCKED
+    ),
+    rescored AS (
+        UPDATE tasks t
+        SET hot_score = stale.new_score,
+            hot_scored_at = NOW()
+        FROM stale
+        WHERE t.id = stale.id
+          AND t.hot_score IS DISTINCT FROM stale.new_score
+        RETURNING t.id, t.hot_score, t.priority, t.mirror_version
+    )
+    SELECT e.id, e.hot_scored_at, r.hot_score, r.priority, r.mirror_version, r.id IS NOT NULL
+    FROM examined e
+    LEFT JOIN rescored r ON r.id = e.id
+    ORDER BY e.hot_scored_at, e.id
+"""
+
+
+def decay_pass(connect, max_age: float = HOT_RANK_INTERVAL_SECONDS, batch_size: int = HOT_RANK_BATCH_SIZE) -> list[tuple]:
+    """
+    Re-score open tasks not scored within max_age seconds, one short transaction per batch
+
+    Tasks whose score would move by less than HOT_RANK_MIN_CHANGE keep their
+    row (and hot_scored_at, so their decay accumulates until it counts).
+    Returns (id, hot_score, priority, mirror_version) for every re-scored task.
+    """
+    conn = connect()
+    rescored = []
+    after_at = after_id = None
+    try:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(DECAY_BATCH_SQL, {
+                    "max_age": max_age, "after_at": after_at, "after_id": after_id,
+                    "min_change": HOT_RANK_MIN_CHANGE, "limit": batch_size,
+                })
+                rows = cur.fetchall()
+            conn.commit()
+            rescored.extend((task_id, score, priority, version) for task_id, _, score, priority, version, changed in rows if changed)
+            if len(rows) < batch_size:
+                return rescored
+            after_id, after_at = rows[-1][0], rows[-1][1]
+            time.sleep(HOT_RANK_BATCH_PAUSE_SECONDS)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+async def run(connect, interval: float = HOT_RANK_INTERVAL_SECONDS, on_rescored=None):
+    """Background decay loop for the task board process (on_rescored gets each pass's rows)"""
+    while True:
+        try:
+            started = time.perf_counter()
+            rescored = await asyncio.to_thread(decay_pass, connect, interval)
+            if rescored:
+                logger.info(f"Hot rank decay: {len(rescored)} tasks re-scored in {time.perf_counter() - started:.2f}s")
+                if on_rescored is not None:
+                    await on_rescored(rescored)
+        except Exception as e:
+            logger.warning(f"Hot rank decay pass failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def main():
+    from task_board_api import get_db
+
+    parser = argparse.ArgumentParser(description="Decay tasks.hot_score for open tasks")
+    parser.add_argument("--once", action="store_true", help="Run one full pass and exit")
+    parser.add_argument("--max-age", type=float, default=HOT_RANK_INTERVAL_SECONDS,
+                        help="Re-score tasks last scored more than this many seconds ago")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.once:
+        logger.info(f"Hot rank decay: {len(decay_pass(get_db, args.max_age))} tasks re-scored")
+    else:
+        asyncio.run(run(get_db, args.max_age))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,39 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from contextlib import asynccontextmanager
+import asyncio
 import json
 import os
 from datetime import datetime
 from typing import Optional
 
-app = FastAPI(title="Phoenix Task Board", version="1.0.0")
+import hot_rank
+from hormones import HORMONE_REDIS_HOST, HORMONE_REDIS_PORT, HormoneAccumulator
+from task_feed import TaskFeed
+from task_mirror import TaskMirror, create_redis
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # hot_score decay for open tasks (safe to run in every process: batches use SKIP LOCKED)
+    background = [
+        asyncio.create_task(hot_rank.run(get_db, on_rescored=task_mirror.rescore)),
+        asyncio.create_task(task_mirror.run_verifier(get_db)),
+    ]
+    await task_feed.start()
+    await hormones.start()
+    yield
+    await task_feed.close()
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await hormones.close()
+    await hormones.redis.aclose()
+    await redis_client.aclose()
+
+app = FastAPI(title="Phoenix Task Board", version="1.0.0", lifespan=lifespan)
 
 # Database connection
 def get_db():
@@ -19,6 +45,18 @@ def get_db():
         password=os.getenv('POSTGRES_PASSWORD')
     )
 
+# One LISTEN connection per process, shared by every /tasks/feed client
+task_feed = TaskFeed(get_db)
+
+redis_client = create_redis()
+
+# Redis copy of the open board that serves /tasks/hot (Postgres remains the source of truth)
+task_mirror = TaskMirror(redis_client, get_db)
+
+# Hormone deltas from claims/completions, flushed to agents.hormone_levels in batches.
+# They are not a cache: they live on the noeviction Redis, not redis_client
+hormones = HormoneAccumulator(create_redis(HORMONE_REDIS_HOST, HORMONE_REDIS_PORT), get_db)
+
 class Task(BaseModel):
     title: str
     description: str
@@ -84,8 +122,23 @@ async def list_agents():
     cur.close()
     conn.close()
     
+    agents = await hormones.merge_pending(agents)
+    
     return {"agents": agents, "count": len(agents)}
 
+@app.get("/agents/{agent_id}/hormones")
+async def get_hormone_state(agent_id: str):
+    """Current hormone levels, including deltas not yet flushed"""
+    levels = await hormones.state(agent_id)
+    if levels is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return {"agent_id": agent_id, "hormone_levels": levels}
+
+@app.get("/agents/hormones/stats")
+async def hormone_stats():
+    """Hormone accumulator counters for this process"""
+    return hormones.stats()
+
 @app.post("/tasks/create")
 async def create_task(task: Task):
     """Create new task on board"""
@@ -96,12 +149,16 @@ async def create_task(task: Task):
         cur.execute("""
             INSERT INTO tasks (title, description, category, priority, dopamine_reward, perspectives_required)
             VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id
+            RETURNING id, title, description, category, hot_score, dopamine_reward,
+                      status, perspectives_required, perspectives_collected, priority, mirror_version
         """, (task.title, task.description, task.category, task.priority, task.dopamine_reward, task.perspectives_required))
         
-        task_id = cur.fetchone()[0]
+        row = dict(zip([c.name for c in cur.description], cur.fetchone()))
+        task_id = row["id"]
         conn.commit()
         
+        await task_mirror.upsert([row])
+        
         return {"task_id": str(task_id), "status": "created", "dopamine_reward": task.dopamine_reward}
     except Exception as e:
         conn.rollback()
@@ -111,13 +168,19 @@ async def create_task(task: Task):
         conn.close()
 
 @app.get("/tasks/hot")
-async def get_hot_tasks(limit: int = 10):
+async def get_hot_tasks(limit: int = 10, include_description: bool = True):
     """Get highest priority tasks by hot score"""
+    tasks = await task_mirror.hot(limit, include_description)
+    if tasks is not None:
+        return {"tasks": tasks, "count": len(tasks)}
+    
     conn = get_db()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
-    cur.execute("""
-        SELECT id, title, description, category, hot_score, 
+    # idx_tasks_open_rank finds the top rows; include_description=false only trims the payload
+    description = "description, " if include_description else ""
+    cur.execute(f"""
+        SELECT id, title, {description}category, hot_score, 
                dopamine_reward, status, perspectives_required, perspectives_collected
         FROM tasks
         WHERE status = 'open'
@@ -131,6 +194,137 @@ async def get_hot_tasks(limit: int = 10):
     
     return {"tasks": tasks, "count": len(tasks)}
 
+@app.get("/tasks/feed")
+async def stream_task_feed(
+    request: Request,
+    category: Optional[str] = None,
+    team: Optional[str] = None,
+    cursor: Optional[int] = None
+):
+    """Server-sent task events (created / status), replacing /tasks/hot polling"""
+    # EventSource reconnects send the last id they saw
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        cursor = int(last_event_id)
+    
+    async def stream():
+        yield "retry: 3000\n\n"
+        # The SSE id is the highest event_id sent so far (events can arrive out of
+        # id order); a resume from it re-scans the window just below it
+        high = cursor
+        async for event in task_feed.events(category, team, cursor):
+            if event is None:
+                yield ": keepalive\n\n"
+            elif "event_id" in event:
+                high = event["event_id"] if high is None else max(high, event["event_id"])
+                yield f"id: {high}\nevent: {event['event_type']}\ndata: {json.dumps(event, default=str)}\n\n"
+            else:
+                yield f"event: {event['event_type']}\ndata: {{}}\n\n"
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/tasks/feed/stats")
+async def task_feed_stats():
+    """Feed counters for this process"""
+    return task_feed.stats()
+
+@app.get("/tasks/mirror/stats")
+async def task_mirror_stats():
+    """Redis mirror counters for this process"""
+    return task_mirror.stats()
+
+@app.post("/tasks/claim-next")
+async def claim_next_tasks(
+    agent_id: str,
+    limit: int = Query(1, ge=1, le=50),
+    category: Optional[str] = None,
+    team: Optional[str] = None
+):
+    """Agent claims its N best open tasks in one statement (never 409s)"""
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    try:
+        # Rows other agents are claiming right now are skipped, not waited on,
+        # so concurrent agents walk down the ranking instead of colliding
+        cur.execute("""
+            WITH agent AS (
+                SELECT id, codename FROM agents WHERE id = %(agent_id)s
+            ),
+            picked AS (
+                SELECT t.id
+                FROM tasks t
+                WHERE t.status = 'open'
+                  AND EXISTS (SELECT 1 FROM agent)
+                  AND (%(category)s::text IS NULL OR t.category = %(category)s)
+                  AND (%(team)s::text IS NULL OR t.team_assignment = %(team)s)
+                ORDER BY t.hot_score DESC, t.priority DESC
+                LIMIT %(limit)s
+                FOR UPDATE OF t SKIP LOCKED
+            ),
+            claimed AS (
+                UPDATE tasks t
+                SET status = 'claimed',
+                    assigned_to = %(agent_id)s,
+                    claimed_at = NOW()
+                FROM picked
+                WHERE t.id = picked.id
+                RETURNING t.id, t.title, t.description, t.category, t.hot_score, t.priority,
+                          t.dopamine_reward, t.perspectives_required, t.mirror_version
+            )
+            SELECT a.codename AS agent, c.*
+            FROM agent a
+            LEFT JOIN claimed c ON TRUE
+            ORDER BY c.hot_score DESC, c.priority DESC
+        """, {"agent_id": agent_id, "limit": limit, "category": category, "team": team})
+        
+        rows = cur.fetchall()
+        if not rows:
+            conn.rollback()
+            raise HTTPException(status_code=404, detail="Agent not found")
+        
+        conn.commit()
+        
+        await task_mirror.remove([(row["id"], row["mirror_version"]) for row in rows if row["id"] is not None])
+        
+        tasks = [
+            {
+                "task_id": str(row["id"]),
+                "title": row["title"],
+                "description": row["description"],
+                "category": row["category"],
+                "hot_score": float(row["hot_score"]),
+                "perspectives_required": row["perspectives_required"],
+                "reward_on_completion": float(row["dopamine_reward"])
+            }
+            for row in rows if row["id"] is not None
+        ]
+        
+        # Not in the claim statement: the boost is write-behind, so a crash right
+        # after the commit can lose it (the claims themselves are durable).
+        # record() never raises, so a committed claim is never reported as failed
+        await hormones.record(agent_id, {"dopamine": 0.2 * len(tasks)})
+        
+        return {
+            "status": "claimed" if tasks else "empty",
+            "agent": rows[0]["agent"],
+            "tasks": tasks,
+            "count": len(tasks),
+            "dopamine_boost": f"+{0.2 * len(tasks):.1f}"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        cur.close()
+        conn.close()
+
 @app.post("/tasks/{task_id}/claim")
 async def claim_task(task_id: str, agent_id: str):
     """Agent claims task (dopamine anticipation)"""
@@ -138,17 +332,7 @@ async def claim_task(task_id: str, agent_id: str):
     cur = conn.cursor()
     
     try:
-        # Boost agent dopamine
-        cur.execute("""
-            UPDATE agents
-            SET hormone_levels = jsonb_set(
-                hormone_levels,
-                '{dopamine}',
-                to_jsonb((hormone_levels->>'dopamine')::decimal + 0.2)
-            )
-            WHERE id = %s
-            RETURNING codename
-        """, (agent_id,))
+        cur.execute("SELECT codename FROM agents WHERE id = %s", (agent_id,))
         
         agent_name = cur.fetchone()
         if not agent_name:
@@ -161,7 +345,7 @@ async def claim_task(task_id: str, agent_id: str):
                 assigned_to = %s,
                 claimed_at = NOW()
             WHERE id = %s AND status = 'open'
-            RETURNING id, dopamine_reward
+            RETURNING id, dopamine_reward, mirror_version
         """, (agent_id, task_id))
         
         result = cur.fetchone()
@@ -171,6 +355,11 @@ async def claim_task(task_id: str, agent_id: str):
         
         conn.commit()
         
+        await task_mirror.remove([(result[0], result[2])])
+        
+        # Dopamine anticipation, applied by the next hormone flush
+        await hormones.record(agent_id, {"dopamine": 0.2})
+        
         return {
             "status": "claimed",
             "agent": agent_name[0],
@@ -208,26 +397,21 @@ async def complete_task(task_id: str, agent_id: str, output: dict):
                 completed_at = NOW(),
                 output = %s::jsonb
             WHERE id = %s AND assigned_to = %s
-            RETURNING id
+            RETURNING id, mirror_version
         """, (json.dumps(output), task_id, agent_id))
         
-        if not cur.fetchone():
+        completed = cur.fetchone()
+        if not completed:
             raise HTTPException(status_code=400, detail="Task not assigned to this agent")
         
-        # Reward agent with dopamine
-        cur.execute("""
-            UPDATE agents
-            SET hormone_levels = jsonb_set(
-                    hormone_levels,
-                    '{dopamine}',
-                    to_jsonb((hormone_levels->>'dopamine')::decimal + %s)
-                ),
-                tasks_completed = tasks_completed + 1
-            WHERE id = %s
-        """, (dopamine_reward, agent_id))
-        
         conn.commit()
         
+        # Normally gone since the claim; drops any entry a lost write left behind
+        await task_mirror.remove([(task_id, completed[1])])
+        
+        # Reward agent with dopamine and count the completion (write-behind)
+        await hormones.record(agent_id, {"dopamine": dopamine_reward}, completed=1)
+        
         return {
             "status": "complete",
             "dopamine_reward": dopamine_reward,
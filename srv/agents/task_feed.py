@@ -0,0 +1,248 @@
+"""
+Task Feed
+Task events pushed to subscribers from one Postgres LISTEN connection per process
+
+Each event is a task_events row (delivered live by NOTIFY from the tasks
+triggers). Subscribers filter by category/team and have bounded buffers;
+a subscriber that falls behind is told so and resumes from its last
+event_id, replayed from the table.
+
+event_id is assigned at insert but NOTIFY follows commit order, so ids can
+arrive out of order. Resuming therefore also re-scans events committed up
+to TASK_FEED_RESCAN_SECONDS before the cursor event: delivery is
+at-least-once around a resume, and clients dedup on event_id.
+"""
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+TASK_EVENTS_CHANNEL = "task_events"
+TASK_FEED_BUFFER_SIZE = int(os.getenv("TASK_FEED_BUFFER_SIZE", "256"))
+TASK_FEED_REPLAY_MAX = int(os.getenv("TASK_FEED_REPLAY_MAX", "1000"))
+TASK_FEED_HEARTBEAT_SECONDS = float(os.getenv("TASK_FEED_HEARTBEAT_SECONDS", "15"))
+TASK_FEED_RETENTION_HOURS = float(os.getenv("TASK_FEED_RETENTION_HOURS", "24"))
+TASK_FEED_RESCAN_SECONDS = float(os.getenv("TASK_FEED_RESCAN_SECONDS", "10"))
+TASK_FEED_RECONNECT_SECONDS = 5.0
+
+# Control events (no event_id): the client should re-read /tasks/hot, then
+# reconnect with its last event_id ("lagged") or without one ("reset")
+LAGGED = {"event_type": "lagged"}
+RESET = {"event_type": "reset"}
+
+REPLAY_SQL = """
+    SELECT event_id, task_id, event_type, status, category, team_assignment, payload, created_at
+    FROM task_events
+    WHERE (
+            event_id > %(cursor)s
+            -- Lower ids that may have committed after the cursor event
+            OR (event_id < %(cursor)s AND created_at >= (
+                SELECT created_at - make_interval(secs => %(rescan)s)
+                FROM task_events WHERE event_id = %(cursor)s
+            ))
+          )
+      AND (%(category)s::text IS NULL OR category = %(category)s)
+      AND (%(team)s::text IS NULL OR team_assignment = %(team)s)
+    ORDER BY event_id
+    LIMIT %(limit)s
+"""
+
+PRUNE_SQL = """
+    DELETE FROM task_events
+    WHERE event_id IN (
+        SELECT event_id FROM task_events
+        WHERE created_at < NOW() - make_interval(secs => %s)
+        ORDER BY event_id
+        LIMIT 5000
+    )
+"""
+
+
+class Subscriber:
+    """One feed client: filters plus a bounded queue (None = closed by the feed)"""
+
+    def __init__(self, category: str | None, team: str | None):
+        self.category = category
+        self.team = team
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=TASK_FEED_BUFFER_SIZE)
+        self.closed = False
+
+    def matches(self, event: dict) -> bool:
+        return (
+            (self.category is None or event.get("category") == self.category)
+            and (self.team is None or event.get("team_assignment") == self.team)
+        )
+
+    def offer(self, event: dict) -> bool:
+        """Queue an event; False (and the subscriber is closed) if the buffer is full"""
+        if self.closed:
+            return True
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.close()
+            return False
+
+    def close(self):
+        # Drop what is buffered; the client replays it from the table
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class TaskFeed:
+    """
+    Fan-out of task_events NOTIFYs to feed subscribers
+
+    - One autocommit psycopg2 connection LISTENs, read via the event loop (no thread)
+    - If it drops, every subscriber is closed so it resumes from the table
+      instead of silently missing events
+    - Old task_events rows are pruned hourly, in batches
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._subscribers: set[Subscriber] = set()
+        self._tasks: list[asyncio.Task] = []
+        self.delivered = 0
+        self.overflows = 0
+        self.reconnects = 0
+
+    async def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._prune())]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for subscriber in self._subscribers:
+            subscriber.close()
+
+    async def _listen(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            conn = None
+            try:
+                conn = await asyncio.to_thread(self._connect)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {TASK_EVENTS_CHANNEL}")
+                readable = asyncio.Event()
+                loop.add_reader(conn.fileno(), readable.set)
+                try:
+                    logger.info(f"Task feed listening on {TASK_EVENTS_CHANNEL}")
+                    while True:
+                        await readable.wait()
+                        readable.clear()
+                        conn.poll()
+                        while conn.notifies:
+                            self._publish(json.loads(conn.notifies.pop(0).payload))
+                finally:
+                    loop.remove_reader(conn.fileno())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.reconnects += 1
+                logger.warning(f"Task feed listener lost ({e}), reconnecting in {TASK_FEED_RECONNECT_SECONDS:.0f}s")
+                for subscriber in list(self._subscribers):
+                    subscriber.close()
+                await asyncio.sleep(TASK_FEED_RECONNECT_SECONDS)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _publish(self, event: dict):
+        for subscriber in list(self._subscribers):
+            if subscriber.matches(event):
+                if subscriber.offer(event):
+                    self.delivered += 1
+                else:
+                    self.overflows += 1
+                    self._subscribers.discard(subscriber)
+
+    async def _prune(self):
+        while True:
+            try:
+                await asyncio.to_thread(self._prune_once)
+            except Exception as e:
+                logger.warning(f"Task event prune failed: {e}")
+            await asyncio.sleep(3600)
+
+    def _prune_once(self):
+        conn = self._connect()
+        try:
+            while True:
+                with conn.cursor() as cur:
+                    cur.execute(PRUNE_SQL, (TASK_FEED_RETENTION_HOURS * 3600,))
+                    deleted = cur.rowcount
+                conn.commit()
+                if deleted < 5000:
+                    return
+        finally:
+            conn.close()
+
+    def _replay(self, cursor: int, category: str | None, team: str | None) -> list[dict]:
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(REPLAY_SQL, {
+                    "cursor": cursor, "rescan": TASK_FEED_RESCAN_SECONDS,
+                    "category": category, "team": team, "limit": TASK_FEED_REPLAY_MAX + 1,
+                })
+                columns = [c.name for c in cur.description]
+                return [dict(zip(columns, row)) for row in cur.fetchall()]
+        finally:
+            conn.close()
+
+    async def events(self, category: str | None = None, team: str | None = None, cursor: int | None = None):
+        """
+        Matching events after cursor (replayed), then live ones
+
+        Yields event dicts, None as a heartbeat every TASK_FEED_HEARTBEAT_SECONDS
+        of silence, and LAGGED / RESET control events.
+        """
+        subscriber = Subscriber(category, team)
+        # Subscribe before replaying, so events committed during the replay are buffered
+        self._subscribers.add(subscriber)
+        try:
+            # Live events are deduped against exactly what was replayed, not an id
+            # high-water mark: a lower id committed later is still delivered
+            replayed_ids: set[int] = set()
+            if cursor is not None:
+                replayed = await asyncio.to_thread(self._replay, cursor, category, team)
+                if len(replayed) > TASK_FEED_REPLAY_MAX:
+                    yield RESET
+                else:
+                    for event in replayed:
+                        replayed_ids.add(event["event_id"])
+                        yield event
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), TASK_FEED_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event is None:
+                    yield LAGGED
+                    return
+                if event["event_id"] in replayed_ids:
+                    replayed_ids.discard(event["event_id"])  # Already sent by the replay
+                    continue
+                yield event
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+            "reconnects": self.reconnects,
+        }
@@ -0,0 +1,422 @@
+"""
+Task Mirror
+Redis copy of the open task board: one sorted set for the ranking, one hash per task
+
+Postgres stays the source of truth. The task board writes through to the
+mirror after each commit (create, claim, complete, decay), serves
+/tasks/hot from it, and falls back to Postgres while Redis is unavailable.
+
+Those writes can reach Redis in any order (a claim-next triggered by the
+feed's 'created' event may remove a task before create_task upserts it),
+so upserts and removals carry tasks.mirror_version and are applied
+compare-and-set: a write older than the last one applied to a task is
+ignored.
+
+    python task_mirror.py verify     # diff the mirror against Postgres
+    python task_mirror.py rebuild    # reload it from Postgres
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+OPEN_KEY = "taskboard:open"
+TASK_KEY = "taskboard:task:{}"
+VERSION_KEY = "taskboard:version:{}"  # Last mirror_version applied (kept after removal as a tombstone)
+
+# The /tasks/hot columns, as stored in each task hash
+TASK_FIELDS = (
+    "id", "title", "description", "category", "hot_score", "dopamine_reward",
+    "status", "perspectives_required", "perspectives_collected",
+)
+FLOAT_FIELDS = {"hot_score", "dopamine_reward"}
+INT_FIELDS = {"perspectives_required", "perspectives_collected"}
+
+TASK_MIRROR_ENABLED = os.getenv("TASK_MIRROR_ENABLED", "true").lower() in ("1", "true", "yes")
+TASK_MIRROR_RETRY_SECONDS = float(os.getenv("TASK_MIRROR_RETRY_SECONDS", "5"))
+TASK_MIRROR_VERIFY_SECONDS = float(os.getenv("TASK_MIRROR_VERIFY_SECONDS", "900"))
+TASK_MIRROR_VERSION_TTL_SECONDS = int(os.getenv("TASK_MIRROR_VERSION_TTL_SECONDS", "86400"))
+
+OPEN_TASKS_SQL = f"""
+    SELECT {", ".join(TASK_FIELDS)}, priority, mirror_version
+    FROM tasks
+    WHERE status = 'open'
+"""
+
+# KEYS = open set, then (task hash, version key) per task
+# ARGV = TTL, then (id, score, version, hash fields as JSON) per task
+UPSERT_LUA = """
+local ttl = ARGV[1]
+for i = 0, (#KEYS - 1) / 2 - 1 do
+  local hash, version_key = KEYS[2 + 2 * i], KEYS[3 + 2 * i]
+  local id, score, version, fields = ARGV[2 + 4 * i], ARGV[3 + 4 * i], ARGV[4 + 4 * i], ARGV[5 + 4 * i]
+  local applied = redis.call('GET', version_key)
+  if not applied or tonumber(applied) <= tonumber(version) then
+    redis.call('SET', version_key, version, 'EX', ttl)
+    redis.call('ZADD', KEYS[1], score, id)
+    redis.call('DEL', hash)
+    local args = {}
+    for field, value in pairs(cjson.decode(fields)) do
+      args[#args + 1] = field
+      args[#args + 1] = value
+    end
+    redis.call('HSET', hash, unpack(args))
+  end
+end
+"""
+
+# KEYS = open set, then (task hash, version key) per task
+# ARGV = TTL, then (id, version) per task; version '' removes unconditionally (row deleted)
+REMOVE_LUA = """
+local ttl = ARGV[1]
+for i = 0, (#KEYS - 1) / 2 - 1 do
+  local hash, version_key = KEYS[2 + 2 * i], KEYS[3 + 2 * i]
+  local id, version = ARGV[2 + 2 * i], ARGV[3 + 2 * i]
+  local applied = redis.call('GET', version_key)
+  if version == '' or not applied or tonumber(applied) <= tonumber(version) then
+    if version ~= '' then
+      redis.call('SET', version_key, version, 'EX', ttl)
+    end
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('DEL', hash)
+  end
+end
+"""
+
+
+# KEYS = open set, then (task hash, version key) per task
+# ARGV = TTL, then (id, score, hot_score, version) per task; tasks not mirrored are skipped
+RESCORE_LUA = """
+local ttl = ARGV[1]
+for i = 0, (#KEYS - 1) / 2 - 1 do
+  local hash, version_key = KEYS[2 + 2 * i], KEYS[3 + 2 * i]
+  local id, score, hot_score, version = ARGV[2 + 4 * i], ARGV[3 + 4 * i], ARGV[4 + 4 * i], ARGV[5 + 4 * i]
+  local applied = redis.call('GET', version_key)
+  if redis.call('EXISTS', hash) == 1 and (not applied or tonumber(applied) <= tonumber(version)) then
+    redis.call('SET', version_key, version, 'EX', ttl)
+    redis.call('ZADD', KEYS[1], 'XX', score, id)
+    redis.call('HSET', hash, 'hot_score', hot_score)
+  end
+end
+"""
+
+
+def rank_score(hot_score, priority) -> float:
+    """ORDER BY hot_score DESC, priority DESC as one sorted-set score (exact below 2^53)"""
+    return round(float(hot_score or 0) * 10000) * 1000 + min(max(int(priority or 0), 0), 999)
+
+
+def to_hash(row: dict) -> dict:
+    return {field: "" if row[field] is None else str(row[field]) for field in TASK_FIELDS}
+
+
+def from_hash(values: dict, include_description: bool = True) -> dict:
+    task = {}
+    for field in TASK_FIELDS:
+        if field == "description" and not include_description:
+            continue
+        value = values.get(field, "")
+        if field in FLOAT_FIELDS:
+            task[field] = float(value) if value else None
+        elif field in INT_FIELDS:
+            task[field] = int(value) if value else None
+        else:
+            task[field] = value or None
+    return task
+
+
+class TaskMirror:
+    """
+    Write-through mirror of open tasks
+
+    - Writes are Lua scripts applied after the Postgres commit, compare-and-set
+      on mirror_version per task, so their arrival order does not matter
+    - A failed write or read switches this process to Postgres reads for
+      TASK_MIRROR_RETRY_SECONDS; verify() (periodic, and via the CLI) repairs
+      any drift left by writes that never reached Redis
+    - Redis may evict mirror keys (it is a cache): hot() answers from Postgres
+      when a ranked task has no hash or the set is empty, and repairs them in
+      the background
+    """
+
+    def __init__(self, client: aioredis.Redis, connect=None):
+        self.redis = client
+        self._connect = connect
+        self._upsert = client.register_script(UPSERT_LUA)
+        self._remove = client.register_script(REMOVE_LUA)
+        self._rescore = client.register_script(RESCORE_LUA)
+        self._repair: asyncio.Task | None = None
+        self._repair_started = 0.0
+        self._down_until = 0.0
+        self.reads = 0
+        self.fallbacks = 0
+        self.write_errors = 0
+        self.repairs = 0
+
+    @property
+    def available(self) -> bool:
+        return TASK_MIRROR_ENABLED and time.monotonic() >= self._down_until
+
+    def _failed(self, action: str, e: Exception):
+        self._down_until = time.monotonic() + TASK_MIRROR_RETRY_SECONDS
+        logger.warning(f"Task mirror {action} failed, using Postgres for {TASK_MIRROR_RETRY_SECONDS:.0f}s: {e}")
+
+    async def upsert(self, rows: list[dict]):
+        """Add or refresh open tasks (rows carry TASK_FIELDS plus priority and mirror_version)"""
+        if not TASK_MIRROR_ENABLED or not rows:
+            return
+        try:
+            for start in range(0, len(rows), 1000):
+                chunk = rows[start:start + 1000]
+                keys, args = [OPEN_KEY], [TASK_MIRROR_VERSION_TTL_SECONDS]
+                for row in chunk:
+                    keys += [TASK_KEY.format(row["id"]), VERSION_KEY.format(row["id"])]
+                    args += [
+                        str(row["id"]), rank_score(row["hot_score"], row["priority"]),
+                        row["mirror_version"] or 0, json.dumps(to_hash(row)),
+                    ]
+                await self._upsert(keys=keys, args=args)
+        except redis.RedisError as e:
+            self.write_errors += 1
+            self._failed("upsert", e)
+
+    async def remove(self, tasks: list[tuple]):
+        """Drop tasks that left the open state, given (id, mirror_version); version None = row deleted"""
+        if not TASK_MIRROR_ENABLED or not tasks:
+            return
+        try:
+            for start in range(0, len(tasks), 1000):
+                keys, args = [OPEN_KEY], [TASK_MIRROR_VERSION_TTL_SECONDS]
+                for task_id, version in tasks[start:start + 1000]:
+                    keys += [TASK_KEY.format(task_id), VERSION_KEY.format(task_id)]
+                    args += [str(task_id), "" if version is None else version]
+                await self._remove(keys=keys, args=args)
+        except redis.RedisError as e:
+            self.write_errors += 1
+            self._failed("remove", e)
+
+    async def rescore(self, rows: list[tuple]):
+        """Apply (id, hot_score, priority, mirror_version) from decay passes to tasks already mirrored"""
+        if not TASK_MIRROR_ENABLED or not rows:
+            return
+        try:
+            for start in range(0, len(rows), 1000):
+                keys, args = [OPEN_KEY], [TASK_MIRROR_VERSION_TTL_SECONDS]
+                for task_id, score, priority, version in rows[start:start + 1000]:
+                    keys += [TASK_KEY.format(task_id), VERSION_KEY.format(task_id)]
+                    args += [str(task_id), rank_score(score, priority), str(score), version or 0]
+                await self._rescore(keys=keys, args=args)
+        except redis.RedisError as e:
+            self.write_errors += 1
+            self._failed("rescore", e)
+
+    async def hot(self, limit: int, include_description: bool = True) -> list[dict] | None:
+        """Top open tasks: one ZREVRANGE, then one pipeline of HGETALLs (None = use Postgres)"""
+        if not self.available:
+            self.fallbacks += 1
+            return None
+        try:
+            task_ids = await self.redis.zrevrange(OPEN_KEY, 0, limit - 1)
+            if not task_ids:
+                # Empty board, a mirror not built yet, or an evicted set: Postgres
+                # answers cheaply either way, and a rebuild restores the set
+                self.fallbacks += 1
+                self._start_repair(None)
+                return None
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for task_id in task_ids:
+                    pipe.hgetall(TASK_KEY.format(task_id))
+                hashes = await pipe.execute()
+        except redis.RedisError as e:
+            self.fallbacks += 1
+            self._failed("read", e)
+            return None
+        missing = [task_id for task_id, values in zip(task_ids, hashes) if not values]
+        if missing:
+            # Evicted hashes would make a short page: answer from Postgres this time
+            self.fallbacks += 1
+            self._start_repair(set(missing))
+            return None
+        self.reads += 1
+        return [from_hash(values, include_description) for values in hashes]
+
+    def _start_repair(self, task_ids: set | None):
+        """Re-check task_ids (None = rebuild) in the background, at most one per TASK_MIRROR_RETRY_SECONDS"""
+        if self._connect is None or time.monotonic() - self._repair_started < TASK_MIRROR_RETRY_SECONDS:
+            return
+        if self._repair is not None and not self._repair.done():
+            return
+        self._repair_started = time.monotonic()
+        repair = self.rebuild(self._connect) if task_ids is None else self._recheck(self._connect, task_ids)
+        self._repair = asyncio.create_task(repair)
+        self._repair.add_done_callback(self._repair_done)
+
+    def _repair_done(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.warning(f"Task mirror repair failed: {task.exception()}")
+        else:
+            self.repairs += 1
+
+    async def verify(self, connect, repair: bool = False) -> dict:
+        """Diff mirror membership, scores and hashes against Postgres; optionally fix the differences"""
+        rows = await asyncio.to_thread(fetch_open_tasks, connect)
+        expected = {str(row["id"]): rank_score(row["hot_score"], row["priority"]) for row in rows}
+        actual = dict(await self.redis.zrange(OPEN_KEY, 0, -1, withscores=True))
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for task_id in expected:
+                pipe.exists(TASK_KEY.format(task_id))
+            present = await pipe.execute()
+
+        missing = [t for t in expected if t not in actual]
+        extra = [t for t in actual if t not in expected]
+        wrong_score = [t for t in expected if t in actual and actual[t] != expected[t]]
+        no_hash = [t for t, ok in zip(expected, present) if not ok]
+        report = {
+            "open_tasks": len(expected),
+            "mirrored": len(actual),
+            "missing": len(missing),
+            "extra": len(extra),
+            "wrong_score": len(wrong_score),
+            "missing_hash": len(no_hash),
+        }
+
+        if repair and (missing or extra or wrong_score or no_hash):
+            await self._recheck(connect, set(missing) | set(extra) | set(wrong_score) | set(no_hash))
+            self.repairs += 1
+            logger.warning(f"Task mirror repaired: {report}")
+        return report
+
+    async def _recheck(self, connect, task_ids: set):
+        """Re-read task_ids from Postgres and apply their current state (versioned, so never regresses)"""
+        if not task_ids:
+            return
+        current = await asyncio.to_thread(fetch_open_tasks, connect, list(task_ids))
+        closed = task_ids - {str(row["id"]) for row in current}
+        versions = await asyncio.to_thread(fetch_versions, connect, list(closed)) if closed else {}
+        await self.upsert(current)
+        await self.remove([(task_id, versions.get(task_id)) for task_id in closed])
+
+    async def rebuild(self, connect) -> int:
+        """
+        Reload the mirror from Postgres
+
+        Snapshot rows are upserted compare-and-set, so tasks claimed after the
+        snapshot stay removed; ids in the mirror but not in the snapshot (closed
+        since, or created after it) are then re-checked one by one.
+        """
+        rows = await asyncio.to_thread(fetch_open_tasks, connect)
+        await self.upsert(rows)
+        snapshot = {str(row["id"]) for row in rows}
+        await self._recheck(connect, set(await self.redis.zrange(OPEN_KEY, 0, -1)) - snapshot)
+        return len(rows)
+
+    async def run_verifier(self, connect, interval: float = TASK_MIRROR_VERIFY_SECONDS):
+        """Periodic verify-and-repair, catching writes lost while Redis was unreachable"""
+        try:
+            if TASK_MIRROR_ENABLED and not await self.redis.exists(OPEN_KEY):
+                logger.info(f"Task mirror built with {await self.rebuild(connect)} open tasks")
+        except Exception as e:
+            logger.warning(f"Task mirror build failed: {e}")
+        while True:
+            await asyncio.sleep(interval)
+            if not TASK_MIRROR_ENABLED:
+                continue
+            try:
+                await self.verify(connect, repair=True)
+            except Exception as e:
+                logger.warning(f"Task mirror verify failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": TASK_MIRROR_ENABLED,
+            "available": self.available,
+            "reads": self.reads,
+            "fallbacks": self.fallbacks,
+            "write_errors": self.write_errors,
+            "repairs": self.repairs,
+        }
+
+
+def fetch_open_tasks(connect, task_ids: list | None = None) -> list[dict]:
+    """Open tasks (all, or just task_ids), streamed from a server-side cursor"""
+    conn = connect()
+    try:
+        with conn.cursor(name="task_mirror_open") as cur:
+            cur.itersize = 5000
+            if task_ids is None:
+                cur.execute(OPEN_TASKS_SQL)
+            else:
+                cur.execute(OPEN_TASKS_SQL + " AND id = ANY(%s::uuid[])", (task_ids,))
+            columns = None
+            rows = []
+            for row in cur:
+                if columns is None:
+                    columns = [c.name for c in cur.description]
+                rows.append(dict(zip(columns, row)))
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+
+def fetch_versions(connect, task_ids: list) -> dict:
+    """Current mirror_version of task_ids (ids without a row are left out)"""
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id::text, mirror_version FROM tasks WHERE id = ANY(%s::uuid[])", (task_ids,))
+            versions = dict(cur.fetchall())
+        conn.commit()
+        return versions
+    finally:
+        conn.close()
+
+
+def create_redis(host: str | None = None, port: int | None = None) -> aioredis.Redis:
+    return aioredis.Redis(
+        host=host or os.getenv("REDIS_HOST", "localhost"),
+        port=port or int(os.getenv("REDIS_PORT", "6379")),
+        password=os.getenv("REDIS_PASSWORD"),
+        decode_responses=True,
+        socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5")),
+        socket_connect_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5")),
+    )
+
+
+async def cli(command: str) -> int:
+    from task_board_api import get_db
+
+    mirror = TaskMirror(create_redis(), get_db)
+    try:
+        if command == "rebuild":
+            logger.info(f"Task mirror rebuilt with {await mirror.rebuild(get_db)} open tasks")
+            return 0
+        report = await mirror.verify(get_db, repair=command == "repair")
+        logger.info(f"Task mirror {command}: {report}")
+        in_sync = not (report["missing"] or report["extra"] or report["wrong_score"] or report["missing_hash"])
+        return 0 if in_sync or command == "repair" else 1
+    finally:
+        await mirror.redis.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check or reload the Redis task board mirror")
+    parser.add_argument("command", choices=("verify", "repair", "rebuild"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(cli(args.command)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Hormone accumulator: delta merging, pending hash parsing and the flush/hand-back paths (no Postgres needed)
+"""
+import asyncio
+
+import pytest
+
+from hormones import BASELINE, COMPLETED_FIELD, DIRTY_KEY, PENDING_KEY, HormoneAccumulator, merge, split_pending
+
+
+def accumulator(client, fail_flush: bool = False, fail_direct: bool = False) -> tuple[HormoneAccumulator, list]:
+    writes = []
+    hormones = HormoneAccumulator(client, connect=None)
+
+    def write(agent_ids, deltas, completed, decay):
+        writes.append((agent_ids, deltas, completed, decay))
+        if fail_flush if decay else fail_direct:
+            raise RuntimeError("Postgres down")
+
+    hormones._write = write
+    return hormones, writes
+
+
+def test_merge_adds_deltas_and_ignores_the_completed_count():
+    levels = {"dopamine": 1.2, "cortisol": 0.3}
+    merged = merge(levels, {"dopamine": "0.15", "cortisol": "-0.05", COMPLETED_FIELD: "2"})
+    assert merged == {"dopamine": 1.35, "cortisol": 0.25}
+    assert levels == {"dopamine": 1.2, "cortisol": 0.3}  # Not mutated
+
+
+def test_merge_starts_from_baseline():
+    assert merge(None, {"serotonin": 0.1}) == {**BASELINE, "serotonin": 1.1}
+    assert merge({"dopamine": 1.0}, {"endorphin": 0.25})["endorphin"] == 0.75
+
+
+def test_split_pending():
+    assert split_pending({"dopamine": "0.5", COMPLETED_FIELD: "3"}) == ({"dopamine": 0.5}, 3)
+    assert split_pending({"cortisol": "-0.1"}) == ({"cortisol": -0.1}, 0)
+    assert split_pending({COMPLETED_FIELD: "1"}) == ({}, 1)
+
+
+def test_merge_pending_adds_unflushed_deltas(fake_redis):
+    client = fake_redis({PENDING_KEY.format("a1"): {"dopamine": "0.2", COMPLETED_FIELD: "2"}})
+    hormones, _ = accumulator(client)
+    agents = [
+        {"id": "a1", "hormone_levels": {"dopamine": 1.0}, "tasks_completed": 5},
+        {"id": "a2", "hormone_levels": {"dopamine": 1.0}, "tasks_completed": None},
+    ]
+
+    merged = asyncio.run(hormones.merge_pending(agents))
+
+    assert merged[0] == {"id": "a1", "hormone_levels": {"dopamine": 1.2}, "tasks_completed": 7}
+    assert merged[1] is agents[1]
+    assert agents[0]["tasks_completed"] == 5
+
+
+def test_merge_pending_returns_stored_rows_when_redis_is_down(fake_redis):
+    agents = [{"id": "a1", "hormone_levels": {"dopamine": 1.0}}]
+    hormones, _ = accumulator(fake_redis(down=True))
+    assert asyncio.run(hormones.merge_pending(agents)) is agents
+
+
+def test_record_queues_deltas_and_completions(fake_redis):
+    client = fake_redis()
+    hormones, writes = accumulator(client)
+    asyncio.run(hormones.record("a1", {"dopamine": 0.3, "cortisol": 0}, completed=1))
+
+    key = PENDING_KEY.format("a1")
+    assert client.executed == [
+        ("hincrbyfloat", key, "dopamine", 0.3),
+        ("hincrby", key, COMPLETED_FIELD, 1),
+        ("sadd", DIRTY_KEY, "a1"),
+    ]
+    assert writes == []
+
+
+def test_record_writes_directly_without_decay_when_redis_is_down(fake_redis):
+    hormones, writes = accumulator(fake_redis(down=True))
+    asyncio.run(hormones.record("a1", {"dopamine": 0.3}, completed=1))
+    assert writes == [(["a1"], [{"dopamine": 0.3}], [1], False)]
+    assert hormones.direct_writes == 1
+
+
+def test_flush_decays_even_when_pending_cannot_be_taken(fake_redis):
+    hormones, writes = accumulator(fake_redis(down=True))
+    asyncio.run(hormones.flush())
+    assert writes == [([], [], [], True)]
+
+
+def test_failed_flush_hands_deltas_back_to_redis(fake_redis):
+    client = fake_redis(script_result=["a1", ["dopamine", "0.5", COMPLETED_FIELD, "2"]])
+    hormones, writes = accumulator(client, fail_flush=True)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(hormones.flush())
+
+    key = PENDING_KEY.format("a1")
+    assert client.executed == [
+        ("hincrbyfloat", key, "dopamine", 0.5),
+        ("hincrby", key, COMPLETED_FIELD, 2),
+        ("sadd", DIRTY_KEY, "a1"),
+    ]
+    assert writes == [(["a1"], [{"dopamine": 0.5}], [2], True)]
+
+
+def test_failed_flush_writes_directly_when_redis_is_gone_too(fake_redis):
+    client = fake_redis(script_result=["a1", ["dopamine", "0.5", COMPLETED_FIELD, "2"]])
+    hormones, writes = accumulator(client, fail_flush=True)
+
+    async def flush_then_lose_redis():
+        take = hormones._take
+
+        async def take_then_fail(keys, args):
+            taken = await take(keys=keys, args=args)
+            client.down = True
+            return taken
+
+        hormones._take = take_then_fail
+        await hormones.flush()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(flush_then_lose_redis())
+    assert writes[-1] == (["a1"], [{"dopamine": 0.5}], [2], False)
+    assert hormones.direct_writes == 1
+
+
+def test_record_never_raises_when_postgres_is_down_too(fake_redis):
+    hormones, writes = accumulator(fake_redis(down=True), fail_direct=True)
+    asyncio.run(hormones.record("a1", {"dopamine": 0.3}))  # The claim has committed already
+    assert writes == [(["a1"], [{"dopamine": 0.3}], [0], False)]
+    assert hormones.lost_agents == 1 and hormones.direct_writes == 0
+
+
+def test_evicting_redis_switches_record_to_direct_writes(fake_redis):
+    client = fake_redis(policy="allkeys-lru")
+    hormones, writes = accumulator(client)
+
+    asyncio.run(hormones.check_eviction())
+    asyncio.run(hormones.record("a1", {"dopamine": 0.3}))
+    assert writes == [(["a1"], [{"dopamine": 0.3}], [0], False)]
+    assert client.executed == [] and hormones.stats()["evicting"]
+
+    client.policy = "volatile-lru"  # Pending hashes have no TTL, so these are safe
+    asyncio.run(hormones.check_eviction())
+    asyncio.run(hormones.record("a1", {"dopamine": 0.3}))
+    assert len(writes) == 1 and hormones.recorded == 1
+
+
+def test_flush_counts_dirty_agents_whose_hash_is_gone(fake_redis):
+    hormones, writes = accumulator(fake_redis(script_result=["a1", [], "a2", ["dopamine", "0.5"]]))
+    asyncio.run(hormones.flush())
+    assert writes == [(["a1", "a2"], [{}, {"dopamine": 0.5}], [0, 0], True)]
+    assert hormones.lost_agents == 1 and hormones.flushed_agents == 2
@@ -0,0 +1,61 @@
+"""
+Hot rank decay: keyset paging over batches and which rows are reported as re-scored (no Postgres needed)
+"""
+from datetime import datetime, timedelta, timezone
+
+import hot_rank
+
+T0 = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        self.conn.params.append(dict(params))
+
+    def fetchall(self):
+        return self.conn.pages.pop(0)
+
+
+class FakeConn:
+    def __init__(self, pages):
+        self.pages = list(pages)
+        self.params = []
+        self.commits = 0
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_decay_pass_pages_by_scored_at_and_returns_changed_rows(monkeypatch):
+    monkeypatch.setattr(hot_rank, "HOT_RANK_BATCH_PAUSE_SECONDS", 0)
+    conn = FakeConn([
+        [("t1", T0, 5.0, 3, 7, True), ("t2", T0 + timedelta(seconds=1), 4.0, 1, 2, False)],
+        [("t3", T0 + timedelta(seconds=2), 1.0, 0, 4, True)],
+    ])
+
+    rescored = hot_rank.decay_pass(lambda: conn, max_age=60, batch_size=2)
+
+    assert rescored == [("t1", 5.0, 3, 7), ("t3", 1.0, 0, 4)]  # t2 moved too little to rewrite
+    assert (conn.params[0]["after_at"], conn.params[0]["after_id"]) == (None, None)
+    assert (conn.params[1]["after_at"], conn.params[1]["after_id"]) == (T0 + timedelta(seconds=1), "t2")
+    assert conn.params[0]["min_change"] == hot_rank.HOT_RANK_MIN_CHANGE
+    assert conn.commits == 2 and conn.closed
@@ -0,0 +1,82 @@
+"""
+Task feed: resume dedup, filtering and overflow (no Postgres needed)
+"""
+import asyncio
+
+import task_feed
+from task_feed import LAGGED, RESET, TaskFeed
+
+
+def event(event_id: int, category: str = "finance", team: str | None = None) -> dict:
+    return {"event_id": event_id, "event_type": "created", "category": category, "team_assignment": team}
+
+
+def feed_replaying(events: list[dict]) -> TaskFeed:
+    feed = TaskFeed(connect=None)
+    feed._replay = lambda cursor, category, team: events
+    return feed
+
+
+def test_resume_delivers_late_lower_ids_once():
+    async def run():
+        feed = feed_replaying([event(5), event(6)])
+        stream = feed.events(cursor=4)
+        received = [(await anext(stream))["event_id"], (await anext(stream))["event_id"]]
+        # Live: 6 was replayed already, 3 committed late with a lower id, 7 is new
+        for event_id in (6, 3, 7, 6):
+            feed._publish(event(event_id))
+        received += [(await anext(stream))["event_id"] for _ in range(3)]
+        await stream.aclose()
+        return received, feed
+
+    received, feed = asyncio.run(run())
+    assert received == [5, 6, 3, 7, 6]  # A second 6 is a new delivery, not a replay duplicate
+    assert feed.stats()["subscribers"] == 0
+
+
+def test_oversized_replay_asks_for_a_reset(monkeypatch):
+    monkeypatch.setattr(task_feed, "TASK_FEED_REPLAY_MAX", 2)
+
+    async def run():
+        stream = feed_replaying([event(i) for i in range(1, 4)]).events(cursor=0)
+        first = await anext(stream)
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(run()) is RESET
+
+
+def test_subscribers_only_get_matching_events():
+    async def run():
+        feed = feed_replaying([])
+        stream = feed.events(category="finance", team="ops")
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)  # Let the generator subscribe
+        feed._publish(event(1, category="legal", team="ops"))
+        feed._publish(event(2, category="finance", team=None))
+        feed._publish(event(3, category="finance", team="ops"))
+        received = (await pending)["event_id"]
+        await stream.aclose()
+        return received, feed.delivered
+
+    assert asyncio.run(run()) == (3, 1)
+
+
+def test_a_full_buffer_closes_the_subscriber_with_lagged(monkeypatch):
+    monkeypatch.setattr(task_feed, "TASK_FEED_BUFFER_SIZE", 2)
+
+    async def run():
+        feed = feed_replaying([])
+        stream = feed.events()
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        for event_id in range(1, 5):
+            feed._publish(event(event_id))
+        first = await pending
+        rest = [item async for item in stream]
+        return first, rest, feed
+
+    first, rest, feed = asyncio.run(run())
+    # The buffered events are dropped too: the client replays them from its cursor
+    assert first is LAGGED and rest == []
+    assert feed.overflows == 1 and feed.stats()["subscribers"] == 0
@@ -0,0 +1,172 @@
+"""
+Task mirror: score encoding, hash round trip, versioned writes and the read fallback
+
+The Lua tests use their own keys, never the live taskboard:* ones.
+"""
+import asyncio
+import json
+import random
+import uuid
+
+from task_mirror import (
+    REMOVE_LUA, RESCORE_LUA, TASK_FIELDS, UPSERT_LUA, TaskMirror, from_hash, rank_score, to_hash,
+)
+
+
+def task_row(**overrides) -> dict:
+    row = {
+        "id": str(uuid.uuid4()), "title": "Audit invoices", "description": "Q3 vendors",
+        "category": "finance", "hot_score": 12.3456, "dopamine_reward": 0.5, "status": "open",
+        "perspectives_required": 3, "perspectives_collected": 0, "priority": 5, "mirror_version": 1,
+    }
+    row.update(overrides)
+    return row
+
+
+def test_rank_score_orders_like_the_sql():
+    rng = random.Random(7)
+    tasks = [(round(rng.uniform(0, 500), 4), rng.randint(0, 10)) for _ in range(500)]
+    tasks += [(100.0, 3), (100.0, 7), (100.0001, 0), (0.0, 0)]
+    by_sql = sorted(tasks, key=lambda t: (t[0], t[1]), reverse=True)
+    by_score = sorted(tasks, key=lambda t: rank_score(*t), reverse=True)
+    assert [rank_score(*t) for t in by_sql] == [rank_score(*t) for t in by_score]
+    assert rank_score(100.0, 7) > rank_score(100.0, 3) > rank_score(99.9999, 999)
+
+
+def test_rank_score_clamps_priority_and_treats_null_as_zero():
+    assert rank_score(1.0, -4) == rank_score(1.0, 0) == rank_score(1.0, None)
+    assert rank_score(1.0, 5000) == rank_score(1.0, 999) < rank_score(1.0001, 0)
+    assert rank_score(None, None) == 0
+
+
+def test_rank_score_is_exact_at_large_hot_scores():
+    score = rank_score(900000.1234, 42)
+    assert score < 2 ** 53 and score == 9000001234042
+
+
+def test_hash_round_trip():
+    row = task_row(description=None, dopamine_reward=None)
+    values = to_hash(row)
+    assert set(values) == set(TASK_FIELDS)
+    assert all(isinstance(v, str) for v in values.values())
+
+    task = from_hash(values)
+    assert task == {field: row[field] for field in TASK_FIELDS}
+    assert "description" not in from_hash(values, include_description=False)
+
+
+def test_upsert_and_remove_send_versions(fake_redis):
+    mirror = TaskMirror(fake_redis())
+    row = task_row(mirror_version=None)
+    asyncio.run(mirror.upsert([row]))
+    asyncio.run(mirror.remove([(row["id"], 9), ("gone", None)]))
+
+    (keys, args), = mirror._upsert.calls
+    assert keys[1:] == [f"taskboard:task:{row['id']}", f"taskboard:version:{row['id']}"]
+    assert args[1:4] == [row["id"], rank_score(row["hot_score"], row["priority"]), 0]
+    assert json.loads(args[4]) == to_hash(row)
+
+    (keys, args), = mirror._remove.calls
+    assert args[1:] == [row["id"], 9, "gone", ""]
+
+
+def test_upsert_chunks_large_batches(fake_redis):
+    mirror = TaskMirror(fake_redis())
+    asyncio.run(mirror.upsert([task_row() for _ in range(2500)]))
+    assert [len(keys) for keys, _ in mirror._upsert.calls] == [2001, 2001, 1001]
+
+
+def test_hot_falls_back_to_postgres_and_repairs_missing_hashes(fake_redis, monkeypatch):
+    row = task_row()
+    client = fake_redis(ranking=[row["id"], "evicted"], hashes={f"taskboard:task:{row['id']}": to_hash(row)})
+    mirror = TaskMirror(client, connect=object())
+    rechecked = []
+
+    async def recheck(connect, task_ids):
+        rechecked.append(task_ids)
+
+    monkeypatch.setattr(mirror, "_recheck", recheck)
+
+    async def run():
+        tasks = await mirror.hot(10)
+        await mirror._repair
+        return tasks
+
+    assert asyncio.run(run()) is None  # A short page would hide a task
+    assert rechecked == [{"evicted"}]
+    assert mirror.fallbacks == 1 and mirror.repairs == 1
+
+    client.hashes["taskboard:task:evicted"] = to_hash(task_row(id="evicted"))
+    assert [task["id"] for task in asyncio.run(mirror.hot(10))] == [row["id"], "evicted"]
+    assert mirror.reads == 1
+
+
+def scripts(client, prefix):
+    upsert, remove = client.register_script(UPSERT_LUA), client.register_script(REMOVE_LUA)
+    open_key = f"{prefix}:open"
+
+    def keys(task_id):
+        return [open_key, f"{prefix}:task:{task_id}", f"{prefix}:version:{task_id}"]
+
+    def apply_upsert(row):
+        score = rank_score(row["hot_score"], row["priority"])
+        upsert(keys=keys(row["id"]), args=[60, row["id"], score, row["mirror_version"], json.dumps(to_hash(row))])
+
+    def apply_remove(task_id, version):
+        remove(keys=keys(task_id), args=[60, task_id, "" if version is None else version])
+
+    return open_key, apply_upsert, apply_remove
+
+
+def test_remove_before_a_late_upsert_stays_removed(live_redis):
+    client, prefix = live_redis
+    open_key, upsert, remove = scripts(client, prefix)
+    row = task_row(mirror_version=1)
+
+    remove(row["id"], 2)  # The claim lands first
+    upsert(row)  # The create arrives late
+    assert client.zscore(open_key, row["id"]) is None
+    assert not client.exists(f"{prefix}:task:{row['id']}")
+    assert client.get(f"{prefix}:version:{row['id']}") == "2"
+
+
+def test_newer_versions_win(live_redis):
+    client, prefix = live_redis
+    open_key, upsert, remove = scripts(client, prefix)
+    row = task_row(mirror_version=1)
+
+    upsert(row)
+    remove(row["id"], 2)
+    upsert(task_row(id=row["id"], mirror_version=3, title="Reopened"))
+    assert client.zscore(open_key, row["id"]) == rank_score(row["hot_score"], row["priority"])
+    assert client.hget(f"{prefix}:task:{row['id']}", "title") == "Reopened"
+
+    upsert(task_row(id=row["id"], mirror_version=2, title="Stale"))
+    assert client.hget(f"{prefix}:task:{row['id']}", "title") == "Reopened"
+    remove(row["id"], None)  # Row deleted: no version check
+    assert client.zscore(open_key, row["id"]) is None
+
+
+def test_rescore_applies_current_versions_to_mirrored_tasks_only(live_redis):
+    client, prefix = live_redis
+    open_key, upsert, _ = scripts(client, prefix)
+    rescore = client.register_script(RESCORE_LUA)
+
+    def apply_rescore(task_id, hot_score, version):
+        keys = [open_key, f"{prefix}:task:{task_id}", f"{prefix}:version:{task_id}"]
+        rescore(keys=keys, args=[60, task_id, rank_score(hot_score, 5), str(hot_score), version])
+
+    row = task_row(mirror_version=2)
+    upsert(row)
+    apply_rescore(row["id"], 1.5, 1)  # Read before the task last changed
+    assert client.zscore(open_key, row["id"]) == rank_score(row["hot_score"], 5)
+
+    apply_rescore(row["id"], 1.5, 3)
+    assert client.zscore(open_key, row["id"]) == rank_score(1.5, 5)
+    assert client.hget(f"{prefix}:task:{row['id']}", "hot_score") == "1.5"
+    upsert(task_row(id=row["id"], mirror_version=2, title="Stale"))  # The rescore advanced the version
+    assert client.hget(f"{prefix}:task:{row['id']}", "title") == row["title"]
+
+    apply_rescore("unmirrored", 9.0, 1)
+    assert client.zscore(open_key, "unmirrored") is None
+    assert not client.exists(f"{prefix}:task:unmirrored")
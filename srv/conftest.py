@@ -0,0 +1,139 @@
+"""
+Shared setup for the srv/receipts and srv/agents unit tests
+
+Both services use flat imports (from config import settings, import task_mirror),
+so their directories go on sys.path. A service's tests are left out, with a
+note in the report header, when its requirements are not installed. Tests
+needing a real Redis take the live_redis fixture and are skipped when none
+answers at REDIS_HOST:REDIS_PORT.
+"""
+import importlib.util
+import os
+import sys
+import uuid
+
+import pytest
+
+SRV_DIR = os.path.dirname(os.path.abspath(__file__))
+
+REQUIREMENTS = {
+    "receipts": ("fastapi", "asyncpg", "redis"),
+    "agents": ("redis",),
+}
+
+for service in REQUIREMENTS:
+    sys.path.insert(0, os.path.join(SRV_DIR, service))
+
+# Required by the receipts settings; unit tests never connect with them
+for name in ("POSTGRES_PASSWORD", "REDIS_PASSWORD", "JWT_SECRET"):
+    os.environ.setdefault(name, "")
+
+MISSING = {
+    service: [module for module in modules if importlib.util.find_spec(module) is None]
+    for service, modules in REQUIREMENTS.items()
+}
+collect_ignore_glob = [f"{service}/tests/*" for service, missing in MISSING.items() if missing]
+
+
+def pytest_report_header(config):
+    return [
+        f"{service}/tests skipped, not installed: {', '.join(missing)}"
+        for service, missing in MISSING.items() if missing
+    ]
+
+
+@pytest.fixture
+def live_redis():
+    """(client, key prefix) on a real Redis; keys under the prefix are deleted afterwards"""
+    import redis
+
+    client = redis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", "6379")),
+        password=os.getenv("REDIS_PASSWORD") or None,
+        decode_responses=True,
+        socket_timeout=0.5,
+    )
+    try:
+        client.ping()
+    except redis.RedisError:
+        pytest.skip("Redis not reachable")
+    prefix = f"test:{uuid.uuid4()}"
+    yield client, prefix
+    keys = client.keys(f"{prefix}*")
+    if keys:
+        client.delete(*keys)
+    client.close()
+
+
+class FakeScript:
+    """A registered script that records its calls and returns the client's script_result"""
+
+    def __init__(self, client: "FakeRedis"):
+        self.client = client
+        self.calls = []
+
+    async def __call__(self, keys, args):
+        self.client.check()
+        self.calls.append((keys, args))
+        return self.client.script_result
+
+
+class FakePipeline:
+    """Records commands; execute() answers HGETALLs from the client's hashes"""
+
+    def __init__(self, client: "FakeRedis"):
+        self.client = client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, *args))
+
+    async def execute(self):
+        self.client.check()
+        self.client.executed += self.commands
+        return [self.client.hashes.get(args[0], {}) for name, *args in self.commands if name == "hgetall"]
+
+
+class FakeRedis:
+    """In-memory stand-in for redis.asyncio.Redis; with down=True every call raises ConnectionError"""
+
+    def __init__(self, hashes: dict | None = None, ranking: list | None = None,
+                 script_result=None, policy: str = "noeviction", down: bool = False):
+        self.hashes = hashes or {}
+        self.ranking = ranking or []
+        self.script_result = script_result
+        self.policy = policy
+        self.down = down
+        self.executed = []
+
+    def check(self):
+        if self.down:
+            import redis
+            raise redis.ConnectionError("Redis down")
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        return FakeScript(self)
+
+    async def config_get(self, pattern):
+        self.check()
+        return {"maxmemory-policy": self.policy}
+
+    async def zrevrange(self, key, start, end):
+        self.check()
+        return self.ranking[start:end + 1]
+
+
+@pytest.fixture
+def fake_redis():
+    """The FakeRedis class, to build clients with"""
+    return FakeRedis
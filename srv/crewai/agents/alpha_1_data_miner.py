@@ -1,5 +1,6 @@
 from crewai import Agent
 import psycopg2
+import redis
 import os
 
 # Set Ollama environment
@@ -12,6 +13,12 @@ class Alpha1Agent:
             host="localhost", port=5432, database="phoenix_core",
             user="phoenix", password=os.getenv('POSTGRES_PASSWORD')
         )
+        # Unflushed hormone deltas, on the task board's noeviction Redis
+        self.redis = redis.Redis(
+            host=os.getenv('HORMONE_REDIS_HOST', os.getenv('REDIS_HOST', 'localhost')),
+            port=int(os.getenv('HORMONE_REDIS_PORT', '6380')),
+            password=os.getenv('REDIS_PASSWORD'), decode_responses=True, socket_timeout=0.5
+        )
         self.agent_id = None
         self.codename = "Alpha-1"
     
@@ -35,7 +42,19 @@ class Alpha1Agent:
         cur.execute("SELECT hormone_levels FROM agents WHERE id = %s", (self.agent_id,))
         result = cur.fetchone()
         cur.close()
-        return result[0] if result else {}
+        if not result:
+            return {}
+        # Add deltas the task board has not flushed yet (see srv/agents/hormones.py)
+        levels = dict(result[0])
+        try:
+            pending = self.redis.hgetall(f"hormones:pending:{self.agent_id}")
+        except redis.RedisError:
+            pending = {}
+        for hormone, delta in pending.items():
+            if hormone == "tasks_completed":  # Pending counter, not a hormone
+                continue
+            levels[hormone] = round(float(levels.get(hormone, 0)) + float(delta), 4)
+        return levels
     
     def create_agent(self):
         return Agent(
@@ -0,0 +1,170 @@
+"""
+Extraction Cache
+Content-addressed model results keyed by (file_hash, extraction_model, prompt version)
+"""
+from datetime import date
+from decimal import Decimal
+import json
+import logging
+import redis
+
+from ai.extractor import PROMPT_VERSION, ExtractionResult
+from cache import redis_client
+from config import settings
+from db import db
+from metrics import observe_redis
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(file_hash: str, model: str) -> str:
+    return f"extraction:{PROMPT_VERSION}:{model}:{file_hash}"
+
+
+def result_to_json(result: ExtractionResult) -> str:
+    return json.dumps({
+        "model": result.model,
+        "vendor_name": result.vendor_name,
+        "transaction_date": result.transaction_date.isoformat() if result.transaction_date else None,
+        "total_amount": str(result.total_amount) if result.total_amount is not None else None,
+        "tax_amount": str(result.tax_amount) if result.tax_amount is not None else None,
+        "currency": result.currency,
+        "category_code": result.category_code,
+        "confidence": result.confidence,
+        "duration_seconds": result.duration_seconds,
+        "raw": result.raw,
+    })
+
+
+def result_from_json(data: str) -> ExtractionResult:
+    fields = json.loads(data)
+    return ExtractionResult(
+        model=fields["model"],
+        vendor_name=fields["vendor_name"],
+        transaction_date=date.fromisoformat(fields["transaction_date"]) if fields["transaction_date"] else None,
+        total_amount=Decimal(fields["total_amount"]) if fields["total_amount"] is not None else None,
+        tax_amount=Decimal(fields["tax_amount"]) if fields["tax_amount"] is not None else None,
+        currency=fields["currency"],
+        category_code=fields["category_code"],
+        confidence=fields["confidence"],
+        duration_seconds=fields["duration_seconds"],
+        raw=fields["raw"],
+    )
+
+
+class ExtractionCache:
+    """
+    Two-level cache of model output
+
+    - Redis first: GETEX refreshes the TTL on every hit (sliding expiry), and
+      the server's allkeys-lru policy evicts cold keys under memory pressure
+    - receipts.extraction_cache in Postgres as the durable fallback, touched on
+      hit (last_hit_at) and pruned to EXTRACTION_CACHE_PG_MAX_ROWS by LRU
+    - Tracks hit ratio and the inference seconds each hit avoided
+    """
+
+    def __init__(self):
+        self.ttl_seconds = settings.EXTRACTION_CACHE_TTL_DAYS * 86400
+        self.redis_hits = 0
+        self.postgres_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.gpu_seconds_saved = 0.0
+
+    async def get(self, file_hash: str, model: str) -> ExtractionResult | None:
+        """Cached result for this image and model, or None"""
+        key = cache_key(file_hash, model)
+
+        try:
+            async with observe_redis("extraction_cache_get"):
+                data = await redis_client.getex(key, ex=self.ttl_seconds)
+        except redis.RedisError as e:
+            logger.warning(f"Extraction cache Redis lookup failed: {e}")
+            data = None
+        source = "redis"
+
+        if data is None:
+            async with db.acquire() as conn:
+                data = await conn.fetchval("""
+                    UPDATE receipts.extraction_cache
+                    SET hit_count = hit_count + 1, last_hit_at = NOW()
+                    WHERE cache_key = $1
+                      AND last_hit_at > NOW() - make_interval(days => $2)
+                    RETURNING result::text
+                """, key, settings.EXTRACTION_CACHE_TTL_DAYS)
+            source = "postgres"
+            if data is not None:
+                await self._set_redis(key, data)
+
+        if data is None:
+            self.misses += 1
+            return None
+
+        result = result_from_json(data)
+        if source == "redis":
+            self.redis_hits += 1
+        else:
+            self.postgres_hits += 1
+        self.gpu_seconds_saved += result.duration_seconds
+        result.raw = {**result.raw, "cache": {"hit": True, "source": source, "gpu_seconds_saved": result.duration_seconds}}
+        return result
+
+    async def put(self, file_hash: str, result: ExtractionResult):
+        """Store a fresh model result in both levels"""
+        key = cache_key(file_hash, result.model)
+        data = result_to_json(result)
+        await self._set_redis(key, data)
+
+        async with db.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO receipts.extraction_cache
+                    (cache_key, file_hash, extraction_model, prompt_version, result, gpu_seconds)
+                VALUES ($1, $2, $3, $4, $5::jsonb, $6)
+                ON CONFLICT (cache_key) DO UPDATE
+                SET result = EXCLUDED.result,
+                    gpu_seconds = EXCLUDED.gpu_seconds,
+                    last_hit_at = NOW()
+            """, key, file_hash, result.model, PROMPT_VERSION, data, result.duration_seconds)
+
+        self.stores += 1
+        if self.stores % settings.EXTRACTION_CACHE_PRUNE_EVERY == 0:
+            await self.prune()
+
+    async def prune(self):
+        """Drop expired rows, then least-recently-hit rows beyond the size cap"""
+        async with db.acquire() as conn:
+            await conn.execute("""
+                DELETE FROM receipts.extraction_cache
+                WHERE last_hit_at < NOW() - make_interval(days => $1)
+            """, settings.EXTRACTION_CACHE_TTL_DAYS)
+            await conn.execute("""
+                DELETE FROM receipts.extraction_cache
+                WHERE cache_key IN (
+                    SELECT cache_key FROM receipts.extraction_cache
+                    ORDER BY last_hit_at DESC
+                    OFFSET $1
+                )
+            """, settings.EXTRACTION_CACHE_PG_MAX_ROWS)
+
+    async def _set_redis(self, key: str, data: str):
+        try:
+            async with observe_redis("extraction_cache_set"):
+                await redis_client.set(key, data, ex=self.ttl_seconds)
+        except redis.RedisError as e:
+            logger.warning(f"Extraction cache Redis write failed: {e}")
+
+    def stats(self) -> dict:
+        """Hit ratio and inference time saved in this process"""
+        hits = self.redis_hits + self.postgres_hits
+        lookups = hits + self.misses
+        return {
+            "redis_hits": self.redis_hits,
+            "postgres_hits": self.postgres_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "gpu_seconds_saved": round(self.gpu_seconds_saved, 1),
+        }
+
+
+extraction_cache = ExtractionCache()
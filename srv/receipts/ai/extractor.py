@@ -0,0 +1,123 @@
+"""
+Receipt Extractor
+Sends a receipt image to an Ollama vision model and parses the structured fields
+"""
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal, InvalidOperation
+import asyncio
+import base64
+import json
+import logging
+import time
+
+from ai.ollama import OllamaClient, OllamaError
+
+logger = logging.getLogger(__name__)
+
+# Bump PROMPT_VERSION whenever EXTRACTION_PROMPT changes meaningfully
+PROMPT_VERSION = "v1"
+EXTRACTION_PROMPT = """You are reading a Canadian business receipt.
+Return ONLY a JSON object with these keys:
+  "vendor_name": string or null,
+  "transaction_date": "YYYY-MM-DD" or null,
+  "total_amount": number or null (grand total including tax),
+  "tax_amount": number or null (GST/HST/PST/QST combined),
+  "currency": three-letter code, default "CAD",
+  "category_code": one of ADVERTISING, MEALS, VEHICLE, TRAVEL, OFFICE, PROFESSIONAL, UTILITIES, or null,
+  "confidence": number between 0 and 1 for how sure you are overall
+"""
+
+
+class ExtractionError(Exception):
+    """Model call failed or returned something unusable"""
+
+
+@dataclass
+class ExtractionResult:
+    """Fields extracted from one receipt image"""
+    model: str
+    vendor_name: str | None = None
+    transaction_date: date | None = None
+    total_amount: Decimal | None = None
+    tax_amount: Decimal | None = None
+    currency: str = "CAD"
+    category_code: str | None = None
+    confidence: float = 0.0
+    duration_seconds: float = 0.0
+    raw: dict = field(default_factory=dict)
+
+
+def _amount(value) -> Decimal | None:
+    if value in (None, ""):
+        return None
+    try:
+        amount = Decimal(str(value).replace("$", "").replace(",", "").strip())
+    except InvalidOperation:
+        return None
+    return amount.quantize(Decimal("0.01")) if amount.is_finite() and abs(amount) < Decimal("1e8") else None
+
+
+def _date(value) -> date | None:
+    try:
+        return date.fromisoformat(str(value)[:10]) if value else None
+    except ValueError:
+        return None
+
+
+def parse_extraction(fields: dict, model: str, raw: dict, duration_seconds: float) -> ExtractionResult:
+    """Coerce the model's JSON into typed, column-safe values"""
+    try:
+        confidence = min(1.0, max(0.0, float(fields.get("confidence") or 0)))
+    except (TypeError, ValueError):
+        confidence = 0.0
+
+    currency = str(fields.get("currency") or "CAD").upper()[:3]
+    category_code = fields.get("category_code")
+
+    return ExtractionResult(
+        model=model,
+        vendor_name=(str(fields["vendor_name"]).strip() or None) if fields.get("vendor_name") else None,
+        transaction_date=_date(fields.get("transaction_date")),
+        total_amount=_amount(fields.get("total_amount")),
+        tax_amount=_amount(fields.get("tax_amount")),
+        currency=currency if len(currency) == 3 and currency.isalpha() else "CAD",
+        category_code=str(category_code).upper() if category_code else None,
+        confidence=round(confidence, 2),
+        duration_seconds=duration_seconds,
+        raw=raw,
+    )
+
+
+async def extract_receipt(client: OllamaClient, image_path: str, model: str) -> ExtractionResult:
+    """
+    Run one receipt image through an Ollama vision model
+
+    Raises:
+        ExtractionError: on HTTP errors, timeouts or unparseable model output
+    """
+    image = await asyncio.to_thread(_read_base64, image_path)
+
+    started = time.perf_counter()
+    try:
+        raw = await client.generate(
+            model, EXTRACTION_PROMPT, images=[image], format="json", options={"temperature": 0}
+        )
+    except OllamaError as e:
+        raise ExtractionError(str(e)) from e
+    # Ollama's own timing excludes time spent queued for a concurrency slot
+    duration = raw["total_duration"] / 1e9 if raw.get("total_duration") else time.perf_counter() - started
+
+    try:
+        fields = json.loads(raw.get("response") or "")
+    except json.JSONDecodeError as e:
+        raise ExtractionError(f"Model returned invalid JSON: {e}") from e
+    if not isinstance(fields, dict):
+        raise ExtractionError("Model returned JSON that is not an object")
+
+    return parse_extraction(fields, model, raw, duration)
+
+
+def _read_base64(path: str) -> str:
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode()
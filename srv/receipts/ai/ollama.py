@@ -0,0 +1,177 @@
+"""
+Ollama Client
+Shared pooled HTTP client with per-model concurrency, keep_alive management and warm-up
+"""
+from contextlib import asynccontextmanager
+import aiohttp
+import asyncio
+import logging
+import time
+
+from config import settings
+from metrics import OLLAMA_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaError(Exception):
+    """Ollama call failed (HTTP error, timeout or connection problem)"""
+
+
+def parse_model_settings(spec: str) -> dict[str, str]:
+    """'llava:34b=1,llava:13b=2' -> {'llava:34b': '1', 'llava:13b': '2'}"""
+    values = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, value = item.rpartition("=")
+        values[model.strip()] = value.strip()
+    return values
+
+
+class OllamaClient:
+    """
+    One aiohttp session to OLLAMA_HOST per process
+
+    - Keep-alive connection pool (OLLAMA_POOL_SIZE) instead of a socket per call
+    - Every request carries the model's keep_alive (OLLAMA_MODEL_KEEP_ALIVE,
+      default OLLAMA_KEEP_ALIVE) so Ollama keeps it resident between calls
+    - Per-model semaphores (OLLAMA_MODEL_CONCURRENCY, default OLLAMA_MAX_CONCURRENCY)
+    - Models in OLLAMA_WARM_MODELS are loaded at startup and pinged when idle
+      for OLLAMA_KEEP_WARM_SECONDS, so requests never pay a cold load
+    """
+
+    def __init__(self):
+        self._session: aiohttp.ClientSession | None = None
+        self._warm_task: asyncio.Task | None = None
+        self._limits = {m: int(v) for m, v in parse_model_settings(settings.OLLAMA_MODEL_CONCURRENCY).items()}
+        self._keep_alive = parse_model_settings(settings.OLLAMA_MODEL_KEEP_ALIVE)
+        self._slots: dict[str, asyncio.Semaphore] = {}
+        self._last_used: dict[str, float] = {}
+        self.calls: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        self.seconds: dict[str, float] = {}
+        self.warmups = 0
+
+    @property
+    def warm_models(self) -> list[str]:
+        return [m.strip() for m in settings.OLLAMA_WARM_MODELS.split(",") if m.strip()]
+
+    def keep_alive(self, model: str) -> str:
+        return self._keep_alive.get(model, settings.OLLAMA_KEEP_ALIVE)
+
+    def concurrency(self, model: str) -> int:
+        return self._limits.get(model, settings.OLLAMA_MAX_CONCURRENCY)
+
+    async def start(self, keep_warm: bool = True):
+        """Open the session and start warm-up / keep-warm pings (called once at startup)"""
+        if self._session is not None:
+            return
+        self._session = aiohttp.ClientSession(
+            base_url=settings.OLLAMA_HOST,
+            connector=aiohttp.TCPConnector(
+                limit=settings.OLLAMA_POOL_SIZE,
+                keepalive_timeout=settings.OLLAMA_HTTP_KEEPALIVE_SECONDS,
+            ),
+            timeout=aiohttp.ClientTimeout(total=settings.OLLAMA_TIMEOUT_SECONDS),
+        )
+        if keep_warm and self.warm_models:
+            self._warm_task = asyncio.create_task(self._keep_warm())
+
+    async def close(self):
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+            await asyncio.gather(self._warm_task, return_exceptions=True)
+            self._warm_task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @asynccontextmanager
+    async def _slot(self, model: str):
+        if model not in self._slots:
+            self._slots[model] = asyncio.Semaphore(self.concurrency(model))
+        async with self._slots[model]:
+            yield
+
+    async def _post(self, path: str, payload: dict) -> dict:
+        if self._session is None:
+            raise OllamaError("Ollama client is not started")
+        try:
+            async with self._session.post(path, json=payload) as resp:
+                if resp.status != 200:
+                    raise OllamaError(f"Ollama returned {resp.status}: {(await resp.text())[:200]}")
+                return await resp.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise OllamaError(f"Ollama request failed: {e}") from e
+
+    async def generate(self, model: str, prompt: str, images: list[str] | None = None,
+                       format: str | None = None, options: dict | None = None) -> dict:
+        """
+        Non-streaming /api/generate call, bounded by the model's concurrency limit
+
+        Raises:
+            OllamaError: on HTTP errors, timeouts or connection failures
+        """
+        payload = {"model": model, "prompt": prompt, "stream": False, "keep_alive": self.keep_alive(model)}
+        if images:
+            payload["images"] = images
+        if format:
+            payload["format"] = format
+        if options:
+            payload["options"] = options
+
+        async with self._slot(model):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                response = await self._post("/api/generate", payload)
+                outcome = "ok"
+                return response
+            except OllamaError:
+                self.errors[model] = self.errors.get(model, 0) + 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                OLLAMA_REQUEST_SECONDS.labels(model, outcome).observe(elapsed)
+                self._last_used[model] = time.monotonic()
+                self.calls[model] = self.calls.get(model, 0) + 1
+                self.seconds[model] = self.seconds.get(model, 0.0) + elapsed
+
+    async def warm(self, model: str):
+        """Load a model (an empty prompt loads it without generating) and refresh its keep_alive"""
+        started = time.perf_counter()
+        await self._post("/api/generate", {"model": model, "keep_alive": self.keep_alive(model)})
+        self._last_used[model] = time.monotonic()
+        self.warmups += 1
+        logger.info(f"Ollama model {model} warm ({time.perf_counter() - started:.1f}s)")
+
+    async def _keep_warm(self):
+        while True:
+            now = time.monotonic()
+            for model in self.warm_models:
+                last_used = self._last_used.get(model)
+                if last_used is not None and now - last_used < settings.OLLAMA_KEEP_WARM_SECONDS:
+                    continue
+                try:
+                    await self.warm(model)
+                except OllamaError as e:
+                    logger.warning(f"Ollama warm-up of {model} failed: {e}")
+            await asyncio.sleep(settings.OLLAMA_KEEP_WARM_SECONDS / 2)
+
+    def stats(self) -> dict:
+        """Per-model call counts and latency for this process"""
+        return {
+            "warmups": self.warmups,
+            "models": {
+                model: {
+                    "calls": calls,
+                    "errors": self.errors.get(model, 0),
+                    "avg_seconds": round(self.seconds.get(model, 0.0) / calls, 3) if calls else 0.0,
+                    "concurrency": self.concurrency(model),
+                    "keep_alive": self.keep_alive(model),
+                }
+                for model, calls in self.calls.items()
+            },
+        }
+
+
+ollama_client = OllamaClient()
@@ -0,0 +1,130 @@
+"""
+Ollama Stub Server
+Local stand-in for the Ollama API with simulated cold loads, keep_alive expiry and latency
+
+Exercises the client without a GPU:
+    python -m ai.ollama_stub --port 11434 --latency 0.5 --load-seconds 20
+    OLLAMA_HOST=http://localhost:11434 python -m ai.worker
+"""
+from aiohttp import web
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+STUB_FIELDS = {
+    "vendor_name": "Stub Coffee Co.",
+    "transaction_date": "2025-01-15",
+    "total_amount": 12.43,
+    "tax_amount": 1.43,
+    "currency": "CAD",
+    "category_code": "MEALS",
+    "confidence": 0.93,
+}
+
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def keep_alive_seconds(value, default: float = 300.0) -> float:
+    """Ollama keep_alive ('30m', '1h', 300, -1) -> seconds; negative means forever"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    match = re.fullmatch(r"(-?\d+(?:\.\d+)?)(ms|s|m|h)?", str(value).strip())
+    if not match:
+        return default
+    seconds = float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
+    return float("inf") if seconds < 0 else seconds
+
+
+class OllamaStub:
+    """
+    In-memory model residency
+
+    - A model not resident (or whose keep_alive lapsed) pays load_seconds first
+    - Each generate call takes latency seconds and holds the model (one at a time, like a GPU)
+    - fail_rate returns HTTP 500 for that fraction of generate calls
+    """
+
+    def __init__(self, latency: float, load_seconds: float, fail_rate: float):
+        self.latency = latency
+        self.load_seconds = load_seconds
+        self.fail_rate = fail_rate
+        self.loaded_until: dict[str, float] = {}
+        self.locks: dict[str, asyncio.Lock] = {}
+        self.calls = 0
+        self.cold_loads = 0
+
+    async def generate(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        model = body.get("model")
+        if not model:
+            return web.json_response({"error": "model is required"}, status=400)
+        if random.random() < self.fail_rate:
+            return web.json_response({"error": "stub failure"}, status=500)
+
+        started = time.perf_counter()
+        load_duration = 0.0
+        async with self.locks.setdefault(model, asyncio.Lock()):
+            if self.loaded_until.get(model, 0.0) < time.monotonic():
+                await asyncio.sleep(self.load_seconds)
+                load_duration = self.load_seconds
+                self.cold_loads += 1
+
+            prompt = body.get("prompt")
+            if prompt:
+                await asyncio.sleep(self.latency)
+                self.calls += 1
+            self.loaded_until[model] = time.monotonic() + keep_alive_seconds(body.get("keep_alive"))
+
+        response = json.dumps(STUB_FIELDS) if prompt else ""
+        return web.json_response({
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "response": response,
+            "done": True,
+            "done_reason": "stop" if prompt else "load",
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+            "load_duration": int(load_duration * 1e9),
+            "eval_count": len(response) // 4,
+        })
+
+    async def tags(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": m, "model": m} for m in self.loaded_until]})
+
+    async def ps(self, request: web.Request) -> web.Response:
+        now = time.monotonic()
+        return web.json_response({
+            "models": [{"name": m, "model": m} for m, until in self.loaded_until.items() if until >= now],
+            "calls": self.calls,
+            "cold_loads": self.cold_loads,
+        })
+
+
+def create_app(latency: float = 0.5, load_seconds: float = 5.0, fail_rate: float = 0.0) -> web.Application:
+    stub = OllamaStub(latency, load_seconds, fail_rate)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["stub"] = stub
+    app.router.add_post("/api/generate", stub.generate)
+    app.router.add_get("/api/tags", stub.tags)
+    app.router.add_get("/api/ps", stub.ps)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Ollama stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per generate call")
+    parser.add_argument("--load-seconds", type=float, default=5.0, help="Simulated cold model load")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of calls answered with 500")
+    args = parser.parse_args()
+    web.run_app(create_app(args.latency, args.load_seconds, args.fail_rate), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Image Pre-processing
+Shrinks receipt photos before vision inference: EXIF-orient, crop, deskew, grayscale, downscale
+"""
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageFilter, ImageOps
+import asyncio
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bump when the pipeline changes so cached derivatives are rebuilt
+PREPROCESS_VERSION = "v1"
+
+ANALYSIS_SIDE = 512  # Crop and deskew are estimated on a thumbnail this size
+DESKEW_MAX_DEGREES = 5.0
+DESKEW_STEP_DEGREES = 0.5
+
+
+def _otsu_threshold(img: Image.Image) -> int:
+    """Otsu's threshold from a grayscale histogram"""
+    histogram = img.histogram()
+    total = sum(histogram)
+    sum_all = sum(i * h for i, h in enumerate(histogram))
+    sum_bg = weight_bg = 0
+    best, threshold = 0.0, 128
+    for i, h in enumerate(histogram):
+        weight_bg += h
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += i * h
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if between > best:
+            best, threshold = between, i
+    return threshold
+
+
+def _paper_box(gray: Image.Image) -> tuple[int, int, int, int] | None:
+    """Bounding box of the bright paper region, in full-size coordinates"""
+    thumb = gray.copy()
+    thumb.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE))
+    scale = gray.width / thumb.width
+
+    threshold = _otsu_threshold(thumb)
+    mask = thumb.point(lambda p: 255 if p > threshold else 0).filter(ImageFilter.MedianFilter(5))
+    box = mask.getbbox()
+    if not box:
+        return None
+
+    left, top, right, bottom = box
+    if (right - left) * (bottom - top) < 0.2 * thumb.width * thumb.height:
+        return None  # Probably not a receipt edge, keep the whole frame
+
+    margin = 4
+    return (
+        max(0, int((left - margin) * scale)),
+        max(0, int((top - margin) * scale)),
+        min(gray.width, int((right + margin) * scale)),
+        min(gray.height, int((bottom + margin) * scale)),
+    )
+
+
+def _skew_angle(gray: Image.Image) -> float:
+    """Rotation (degrees) that makes text lines horizontal, via row projection variance"""
+    thumb = gray.copy()
+    thumb.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE))
+    threshold = _otsu_threshold(thumb)
+    ink = thumb.point(lambda p: 255 if p <= threshold else 0)  # Text as white on black
+
+    def score(angle: float) -> float:
+        rotated = ink.rotate(angle, resample=Image.BILINEAR, fillcolor=0)
+        rows = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+        mean = sum(rows) / len(rows)
+        return sum((r - mean) ** 2 for r in rows)
+
+    steps = int(DESKEW_MAX_DEGREES / DESKEW_STEP_DEGREES)
+    angles = [i * DESKEW_STEP_DEGREES for i in range(-steps, steps + 1)]
+    return max(angles, key=score)
+
+
+def prepare_image(src_path: str, dest_path: str, max_side: int, quality: int) -> dict:
+    """
+    Build the model-ready derivative of one receipt image (runs in a worker process)
+
+    Returns size stats for the original and the derivative.
+    """
+    started = time.perf_counter()
+    with Image.open(src_path) as img:
+        original_size = img.size
+        gray = ImageOps.exif_transpose(img).convert("L")
+
+    box = _paper_box(gray)
+    if box:
+        gray = gray.crop(box)
+
+    angle = _skew_angle(gray)
+    if abs(angle) >= DESKEW_STEP_DEGREES:
+        gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+    gray.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+    gray.save(tmp_path, "JPEG", quality=quality, optimize=True)
+    os.replace(tmp_path, dest_path)
+
+    return {
+        "original_px": original_size[0] * original_size[1],
+        "derived_px": gray.width * gray.height,
+        "original_bytes": os.path.getsize(src_path),
+        "derived_bytes": os.path.getsize(dest_path),
+        "cropped": bool(box),
+        "deskew_degrees": angle,
+        "preprocess_ms": round(1000 * (time.perf_counter() - started), 1),
+    }
+
+
+class ImagePreprocessor:
+    """
+    Process-pool front end for prepare_image with an on-disk derivative cache
+
+    Derivatives live at {UPLOAD_DIR}/.derived/{hash[:2]}/{file_hash}-{version}.jpg,
+    shared by every receipt with the same file_hash, next to a JSON sidecar
+    with their stats. They are a cache: jobs.purge_expired deletes them with
+    the source file, and a later receipt with the same hash rebuilds them.
+
+    What the smaller image saves is measured on the inference side: payload
+    bytes sent to the model, and mean inference latency on derivatives vs
+    originals (record_inference, called by the extraction worker).
+    """
+
+    def __init__(self):
+        self._executor: ProcessPoolExecutor | None = None
+        self.prepared = 0
+        self.cache_hits = 0
+        self.failures = 0
+        self.px_before = 0
+        self.px_after = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.inferences = {True: 0, False: 0}  # Keyed by "ran on a derivative"
+        self.inference_seconds = {True: 0.0, False: 0.0}
+
+    def start(self):
+        """Create the worker processes (called by the extraction pool at startup)"""
+        if settings.PREPROCESS_ENABLED and self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.PREPROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    @staticmethod
+    def derived_path(file_hash: str) -> str:
+        return os.path.join(
+            settings.UPLOAD_DIR, ".derived", file_hash[:2], f"{file_hash}-{PREPROCESS_VERSION}.jpg"
+        )
+
+    @staticmethod
+    def derived_files(file_hash: str) -> list[str]:
+        """Every derivative and sidecar of file_hash, across pipeline versions"""
+        directory = os.path.join(settings.UPLOAD_DIR, ".derived", file_hash[:2])
+        return glob.glob(os.path.join(directory, glob.escape(file_hash) + "-*"))
+
+    async def prepare(self, src_path: str, file_hash: str) -> tuple[str, dict]:
+        """
+        Path of the model-ready image plus per-image stats
+
+        Falls back to the original file (with an error in the stats) if
+        pre-processing is disabled or fails.
+        """
+        if self._executor is None:
+            return src_path, {"enabled": False}
+
+        dest_path = self.derived_path(file_hash)
+        stats_path = f"{dest_path}.json"
+        if os.path.exists(dest_path) and os.path.exists(stats_path):
+            try:
+                with open(stats_path) as f:
+                    stats = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Unreadable pre-processing stats for {file_hash}, rebuilding: {e}")
+            else:
+                self.cache_hits += 1
+                self._count_payload(stats)
+                return dest_path, {**stats, "cache_hit": True}
+
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        loop = asyncio.get_running_loop()
+        try:
+            stats = await loop.run_in_executor(
+                self._executor, prepare_image, src_path, dest_path,
+                settings.PREPROCESS_MAX_SIDE, settings.PREPROCESS_JPEG_QUALITY,
+            )
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Pre-processing failed for {file_hash}, using original: {e}")
+            return src_path, {"error": str(e)}
+
+        stats["pixel_reduction"] = round(1 - stats["derived_px"] / max(1, stats["original_px"]), 4)
+        stats["payload_bytes_saved"] = stats["original_bytes"] - stats["derived_bytes"]
+        # Atomic like the derivative: a concurrent cache hit never reads a partial sidecar
+        tmp_path = f"{stats_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(stats, f)
+        os.replace(tmp_path, stats_path)
+
+        self.prepared += 1
+        self.px_before += stats["original_px"]
+        self.px_after += stats["derived_px"]
+        self._count_payload(stats)
+        logger.info(
+            f"Pre-processed {file_hash[:12]}: {stats['original_px']} -> {stats['derived_px']} px "
+            f"in {stats['preprocess_ms']} ms"
+        )
+        return dest_path, {**stats, "cache_hit": False}
+
+    def _count_payload(self, stats: dict):
+        self.bytes_before += stats["original_bytes"]
+        self.bytes_after += stats["derived_bytes"]
+
+    def record_inference(self, derived: bool, seconds: float):
+        """Model latency for one image, split by whether it was the derivative"""
+        self.inferences[derived] += 1
+        self.inference_seconds[derived] += seconds
+
+    def stats(self) -> dict:
+        """Pre-processing counters for this process"""
+        def mean_ms(derived: bool) -> float | None:
+            count = self.inferences[derived]
+            return round(1000 * self.inference_seconds[derived] / count, 1) if count else None
+
+        return {
+            "prepared": self.prepared,
+            "cache_hits": self.cache_hits,
+            "failures": self.failures,
+            "pixel_reduction": round(1 - self.px_after / self.px_before, 4) if self.px_before else 0.0,
+            "payload_bytes_saved": self.bytes_before - self.bytes_after,
+            "inference_ms_derived": mean_ms(True),
+            "inference_ms_original": mean_ms(False),
+        }
+
+
+image_preprocessor = ImagePreprocessor()
@@ -0,0 +1,185 @@
+"""
+Vendor Normalization
+In-memory alias index (exact casefold map plus trigram fuzzy match) with buffered usage counters
+"""
+from datetime import datetime, timezone
+import asyncio
+import logging
+import re
+import uuid
+
+from config import settings
+from db import db
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY channel raised by the receipts.vendor_aliases statement trigger
+VENDOR_ALIASES_CHANNEL = "receipts_vendor_aliases_changed"
+
+_APOSTROPHES = re.compile(r"['\u2019]")
+_NOISE = re.compile(r"[^\w&]+")
+
+
+def vendor_key(name: str) -> str:
+    """Casefolded name with punctuation and repeated whitespace collapsed"""
+    return " ".join(_NOISE.sub(" ", _APOSTROPHES.sub("", name.casefold())).split())
+
+
+def trigrams(key: str) -> set[str]:
+    """pg_trgm-style trigrams: each word padded with two leading and one trailing space"""
+    grams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class VendorIndex:
+    """
+    Per-worker snapshot of receipts.vendor_aliases
+
+    - Exact lookups hit a dict keyed by vendor_key(raw_vendor_name)
+    - Misses fall back to trigram similarity (Jaccard >= VENDOR_FUZZY_THRESHOLD)
+      over an inverted index, which absorbs OCR noise like "STARBUCKS C0FFEE #12"
+    - Refreshed by NOTIFY on VENDOR_ALIASES_CHANNEL when aliases change
+    - times_seen / last_seen_at increments are buffered and flushed in one
+      UPDATE every VENDOR_FLUSH_SECONDS instead of one UPDATE per receipt
+    """
+
+    def __init__(self):
+        self._exact: dict[str, tuple[uuid.UUID, str]] = {}
+        self._grams: dict[str, tuple[set[str], uuid.UUID, str]] = {}
+        self._postings: dict[str, set[str]] = {}
+        self._pending: dict[uuid.UUID, tuple[int, datetime]] = {}
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self.reloads = 0
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.flushed = 0
+
+    async def reload(self, payload: str | None = None):
+        """Re-read aliases from Postgres (serialized so snapshots never go backwards)"""
+        async with self._lock:
+            async with db.acquire() as conn:
+                rows = await conn.fetch("""
+                    SELECT alias_id, raw_vendor_name, normalized_vendor_name
+                    FROM receipts.vendor_aliases
+                    ORDER BY times_seen DESC
+                """)
+
+            exact: dict[str, tuple[uuid.UUID, str]] = {}
+            for row in rows:
+                # Most-seen alias wins when raw names collide after casefolding
+                exact.setdefault(vendor_key(row["raw_vendor_name"]), (row["alias_id"], row["normalized_vendor_name"]))
+
+            grams, postings = {}, {}
+            for key, (alias_id, normalized) in exact.items():
+                key_grams = trigrams(key)
+                grams[key] = (key_grams, alias_id, normalized)
+                for gram in key_grams:
+                    postings.setdefault(gram, set()).add(key)
+
+            self._exact, self._grams, self._postings = exact, grams, postings
+            self.reloads += 1
+            logger.info(f"Vendor index loaded ({len(exact)} aliases, trigger={payload or 'startup'})")
+
+    def normalize(self, raw_name: str | None) -> str | None:
+        """Canonical vendor name for raw model output, title-cased raw name if unknown"""
+        if not raw_name or not raw_name.strip():
+            return None
+        key = vendor_key(raw_name)
+
+        match = self._exact.get(key)
+        if match:
+            self.exact_hits += 1
+        else:
+            match = self._fuzzy(key)
+            if match:
+                self.fuzzy_hits += 1
+
+        if not match:
+            self.misses += 1
+            return raw_name.strip().title()
+
+        alias_id, normalized = match
+        count, _ = self._pending.get(alias_id, (0, None))
+        self._pending[alias_id] = (count + 1, datetime.now(timezone.utc))
+        return normalized
+
+    def _fuzzy(self, key: str) -> tuple[uuid.UUID, str] | None:
+        query = trigrams(key)
+        if not query:
+            return None
+
+        shared: dict[str, int] = {}
+        for gram in query:
+            for candidate in self._postings.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        best, best_score = None, settings.VENDOR_FUZZY_THRESHOLD
+        for candidate, overlap in shared.items():
+            candidate_grams, alias_id, normalized = self._grams[candidate]
+            score = overlap / (len(query) + len(candidate_grams) - overlap)
+            if score >= best_score:
+                best, best_score = (alias_id, normalized), score
+        return best
+
+    async def start(self):
+        """Start the periodic counter flush (called by the extraction pool at startup)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.VENDOR_FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Vendor counter flush failed: {e}")
+
+    async def flush(self):
+        """Apply buffered times_seen / last_seen_at increments in one statement"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        alias_ids = list(pending)
+        try:
+            async with db.acquire() as conn:
+                await conn.execute("""
+                    UPDATE receipts.vendor_aliases a
+                    SET times_seen = a.times_seen + d.hits,
+                        last_seen_at = GREATEST(a.last_seen_at, d.seen_at)
+                    FROM unnest($1::uuid[], $2::int[], $3::timestamptz[]) AS d(alias_id, hits, seen_at)
+                    WHERE a.alias_id = d.alias_id
+                """, alias_ids, [pending[a][0] for a in alias_ids], [pending[a][1] for a in alias_ids])
+        except Exception:
+            # Put the counts back so the next flush retries them
+            for alias_id, (count, seen_at) in pending.items():
+                current, latest = self._pending.get(alias_id, (0, seen_at))
+                self._pending[alias_id] = (current + count, max(seen_at, latest))
+            raise
+        self.flushed += sum(count for count, _ in pending.values())
+
+    def stats(self) -> dict:
+        """Lookup counters for this process"""
+        return {
+            "aliases": len(self._exact),
+            "reloads": self.reloads,
+            "exact_hits": self.exact_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+            "pending_increments": sum(count for count, _ in self._pending.values()),
+            "flushed_increments": self.flushed,
+        }
+
+
+vendor_index = VendorIndex()
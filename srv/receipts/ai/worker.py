@@ -0,0 +1,289 @@
+"""
+Extraction Worker Pool
+Claims pending receipts with FOR UPDATE SKIP LOCKED and runs them through Ollama
+
+Runs inside every API worker (EXTRACTION_WORKERS > 0) or standalone:
+    python -m ai.worker
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+
+from ai.extraction_cache import extraction_cache
+from ai.extractor import ExtractionError, ExtractionResult, extract_receipt
+from ai.ollama import ollama_client
+from ai.preprocess import image_preprocessor
+from ai.vendors import VENDOR_ALIASES_CHANNEL, vendor_index
+from cache import close_redis
+from config import settings
+from db import db
+from metrics import EXTRACTION_QUEUE_DEPTH, EXTRACTIONS
+
+logger = logging.getLogger(__name__)
+
+# Claims due receipts, including 'processing' rows whose lease expired (crashed worker)
+CLAIM_SQL = """
+    WITH due AS (
+        SELECT receipt_id
+        FROM receipts.receipts
+        WHERE extraction_status IN ('pending', 'processing')
+          AND deleted_at IS NULL
+          AND next_attempt_at <= NOW()
+        ORDER BY next_attempt_at
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE receipts.receipts r
+    SET extraction_status = 'processing',
+        extraction_attempts = r.extraction_attempts + 1,
+        next_attempt_at = NOW() + make_interval(secs => $2),
+        updated_at = NOW()
+    FROM due
+    WHERE r.receipt_id = due.receipt_id
+    RETURNING r.receipt_id, r.user_id, r.storage_path, r.mime_type, r.file_hash, r.extraction_attempts
+"""
+
+
+class ExtractionWorkerPool:
+    """
+    Async extraction workers sharing the process-wide Ollama client
+
+    - Each worker claims up to EXTRACTION_BATCH_SIZE due receipts per round
+    - ollama_client bounds concurrent calls per model and keeps models warm
+    - Identical images already seen by this model are served from extraction_cache
+    - Vendor names are normalized in memory by vendor_index before saving
+    - Failures retry with exponential backoff, then land in manual_review
+    - Uploads call notify() so new receipts are picked up without waiting for the poll
+    """
+
+    def __init__(self):
+        self._tasks: list[asyncio.Task] = []
+        self._wake = asyncio.Event()
+        self.claimed = 0
+        self.completed = 0
+        self.retried = 0
+        self.manual_review = 0
+        self.failed = 0
+
+    async def start(self, workers: int = settings.EXTRACTION_WORKERS):
+        """Start the worker tasks (called once at startup)"""
+        if workers <= 0:
+            return
+        await ollama_client.start()
+        await vendor_index.start()
+        image_preprocessor.start()
+        self._tasks = [asyncio.create_task(self._run(n)) for n in range(workers)]
+        logger.info(f"Started {workers} extraction workers")
+
+    async def close(self):
+        """Stop workers; claimed receipts are re-claimed once their lease expires"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        image_preprocessor.close()
+        await ollama_client.close()
+        await vendor_index.close()
+
+    def notify(self):
+        """Wake idle workers (a receipt was just queued)"""
+        self._wake.set()
+
+    async def _run(self, n: int):
+        while True:
+            try:
+                async with db.acquire() as conn:
+                    jobs = await conn.fetch(
+                        CLAIM_SQL, settings.EXTRACTION_BATCH_SIZE, settings.EXTRACTION_LEASE_SECONDS
+                    )
+            except Exception as e:
+                logger.error(f"Extraction worker {n} claim failed: {e}")
+                jobs = []
+
+            if not jobs:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), settings.EXTRACTION_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+
+            self.claimed += len(jobs)
+            await asyncio.gather(*(self._handle(job) for job in jobs))
+
+    async def _handle(self, job):
+        """Process one job; an unexpected error retries the receipt instead of ending the worker"""
+        try:
+            await self._process(job)
+        except Exception as e:
+            logger.error(f"Extraction of {job['receipt_id']} failed: {e}", exc_info=True)
+            try:
+                await self._retry_or_give_up(job, str(e))
+            except Exception as e:
+                # Left in 'processing'; re-claimed once its lease expires
+                logger.error(f"Could not reschedule {job['receipt_id']}: {e}")
+
+    async def _process(self, job):
+        receipt_id = job["receipt_id"]
+        if job["mime_type"] == "application/pdf":
+            await self._finish_without_model(job, "manual_review", "PDF receipts need manual review")
+            return
+        if not os.path.exists(job["storage_path"]):
+            await self._finish_without_model(job, "failed", "Stored file is missing")
+            return
+
+        # Last attempt goes to the lighter fallback model
+        model = (settings.OLLAMA_FALLBACK_MODEL
+                 if job["extraction_attempts"] >= settings.EXTRACTION_MAX_ATTEMPTS
+                 else settings.OLLAMA_PRIMARY_MODEL)
+
+        try:
+            cached = await extraction_cache.get(job["file_hash"], model)
+        except Exception as e:
+            logger.warning(f"Extraction cache lookup failed for {receipt_id}: {e}")
+            cached = None
+        if cached:
+            await self._save(job, cached)
+            return
+
+        image_path, preprocess_stats = await image_preprocessor.prepare(job["storage_path"], job["file_hash"])
+
+        try:
+            result = await extract_receipt(ollama_client, image_path, model)
+        except ExtractionError as e:
+            await self._retry_or_give_up(job, str(e))
+            return
+        except Exception as e:
+            logger.error(f"Unexpected extraction error for {receipt_id}: {e}", exc_info=True)
+            await self._retry_or_give_up(job, str(e))
+            return
+
+        image_preprocessor.record_inference(image_path != job["storage_path"], result.duration_seconds)
+        result.raw["preprocess"] = {**preprocess_stats, "inference_ms": round(1000 * result.duration_seconds, 1)}
+        try:
+            await extraction_cache.put(job["file_hash"], result)
+        except Exception as e:
+            logger.warning(f"Extraction cache store failed for {receipt_id}: {e}")
+        await self._save(job, result)
+
+    async def _save(self, job, result: ExtractionResult):
+        vendor_name = vendor_index.normalize(result.vendor_name)
+        status = "completed" if result.confidence >= settings.EXTRACTION_MIN_CONFIDENCE else "manual_review"
+        async with db.acquire() as conn:
+            await conn.execute("""
+                UPDATE receipts.receipts
+                SET extraction_status = $2,
+                    vendor_name = $3,
+                    transaction_date = $4,
+                    total_amount = $5,
+                    tax_amount = $6,
+                    currency = $7,
+                    category_id = (
+                        SELECT category_id FROM receipts.categories
+                        WHERE category_code = $8 AND is_active = TRUE
+                    ),
+                    ai_confidence_score = $9,
+                    raw_ai_response = $10::jsonb,
+                    extraction_model = $11,
+                    processed_at = NOW(),
+                    updated_at = NOW()
+                WHERE receipt_id = $1 AND extraction_status = 'processing'
+            """, job["receipt_id"], status, vendor_name, result.transaction_date,
+                result.total_amount, result.tax_amount, result.currency, result.category_code,
+                result.confidence, json.dumps(result.raw), result.model)
+
+        if status == "completed":
+            self.completed += 1
+        else:
+            self.manual_review += 1
+        EXTRACTIONS.labels(status).inc()
+        logger.info(f"Extracted {job['receipt_id']} with {result.model} in {result.duration_seconds:.1f}s ({status})")
+
+    async def _retry_or_give_up(self, job, error: str):
+        attempts = job["extraction_attempts"]
+        if attempts >= settings.EXTRACTION_MAX_ATTEMPTS:
+            logger.warning(f"Extraction gave up on {job['receipt_id']} after {attempts} attempts: {error}")
+            await self._finish_without_model(job, "manual_review", error)
+            return
+
+        delay = settings.EXTRACTION_BACKOFF_SECONDS * 2 ** (attempts - 1)
+        delay *= random.uniform(0.8, 1.2)  # Jitter so retries from a burst spread out
+        async with db.acquire() as conn:
+            await conn.execute("""
+                UPDATE receipts.receipts
+                SET extraction_status = 'pending',
+                    next_attempt_at = NOW() + make_interval(secs => $2),
+                    updated_at = NOW()
+                WHERE receipt_id = $1 AND extraction_status = 'processing'
+            """, job["receipt_id"], delay)
+        self.retried += 1
+        EXTRACTIONS.labels("retried").inc()
+        logger.warning(f"Extraction attempt {attempts} failed for {job['receipt_id']}, retrying in {delay:.0f}s: {error}")
+
+    async def _finish_without_model(self, job, status: str, reason: str):
+        async with db.acquire() as conn:
+            await conn.execute("""
+                UPDATE receipts.receipts
+                SET extraction_status = $2,
+                    raw_ai_response = $3::jsonb,
+                    processed_at = NOW(),
+                    updated_at = NOW()
+                WHERE receipt_id = $1 AND extraction_status = 'processing'
+            """, job["receipt_id"], status, json.dumps({"error": reason, "attempts": job["extraction_attempts"]}))
+
+        if status == "failed":
+            self.failed += 1
+        else:
+            self.manual_review += 1
+        EXTRACTIONS.labels(status).inc()
+
+    async def sample_queue_depth(self):
+        """Metrics probe: pending and processing receipts (served by idx_receipts_extraction_queue)"""
+        async with db.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT extraction_status, COUNT(*) AS receipts
+                FROM receipts.receipts
+                WHERE extraction_status IN ('pending', 'processing') AND deleted_at IS NULL
+                GROUP BY extraction_status
+            """)
+        counts = {row["extraction_status"]: row["receipts"] for row in rows}
+        for status in ("pending", "processing"):
+            EXTRACTION_QUEUE_DEPTH.labels(status).set(counts.get(status, 0))
+
+    def stats(self) -> dict:
+        """Worker counters for this process"""
+        return {
+            "workers": len(self._tasks),
+            "claimed": self.claimed,
+            "completed": self.completed,
+            "retried": self.retried,
+            "manual_review": self.manual_review,
+            "failed": self.failed,
+        }
+
+
+extraction_workers = ExtractionWorkerPool()
+
+
+async def main():
+    """Run extraction workers without the API"""
+    logging.basicConfig(
+        level=getattr(logging, settings.LOG_LEVEL),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    await db.connect()
+    db.listen(VENDOR_ALIASES_CHANNEL, vendor_index.reload)
+    await db.start_listener()
+    await extraction_workers.start(max(1, settings.EXTRACTION_WORKERS))
+    try:
+        await asyncio.gather(*extraction_workers._tasks)
+    finally:
+        await extraction_workers.close()
+        await close_redis()
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
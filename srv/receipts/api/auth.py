@@ -4,11 +4,12 @@ User registration, login, and JWT token management
 """
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, EmailStr
-import psycopg2
-import bcrypt
+import asyncpg
 import logging
 
 from config import settings
+from db import db
+from hashing import password_hasher
 from middleware.jwt_auth import create_jwt_token, get_current_user
 
 logger = logging.getLogger(__name__)
@@ -34,41 +35,31 @@ class TokenResponse(BaseModel):
     email: str
 
 
-def get_db():
-    """Get database connection"""
-    return psycopg2.connect(settings.database_url)
-
-
 @router.post("/register", response_model=TokenResponse, status_code=201)
 async def register(user: UserRegister):
     """
     Register a new user
 
-    - Creates user account with bcrypt password hashing (cost factor 12)
+    - Creates user account with bcrypt password hashing (BCRYPT_ROUNDS, default 12)
     - Returns JWT token for immediate authentication
     - Initializes neurotransmitter gamification record
     """
-    conn = get_db()
-    cur = conn.cursor()
-
     try:
-        # Hash password with bcrypt (cost factor 12)
-        salt = bcrypt.gensalt(rounds=12)
-        password_hash = bcrypt.hashpw(user.password.encode(), salt).decode()
+        # Hash password with bcrypt on the hashing pool
+        password_hash = await password_hasher.hash(user.password)
 
         # Insert user
-        cur.execute("""
-            INSERT INTO receipts.users (email, password_hash, full_name)
-            VALUES (%s, %s, %s)
-            RETURNING user_id, email, subscription_tier
-        """, (user.email, password_hash, user.full_name))
+        async with db.acquire() as conn:
+            result = await conn.fetchrow("""
+                INSERT INTO receipts.users (email, password_hash, full_name)
+                VALUES ($1, $2, $3)
+                RETURNING user_id, email, subscription_tier
+            """, user.email, password_hash, user.full_name)
 
-        result = cur.fetchone()
         if not result:
             raise HTTPException(status_code=500, detail="User creation failed")
 
         user_id, email, tier = result
-        conn.commit()
 
         # Create JWT token
         token = create_jwt_token(str(user_id), email, tier)
@@ -82,16 +73,13 @@ async def register(user: UserRegister):
             email=email
         )
 
-    except psycopg2.IntegrityError:
-        conn.rollback()
+    except asyncpg.UniqueViolationError:
         raise HTTPException(status_code=400, detail="Email already registered")
+    except HTTPException:
+        raise
     except Exception as e:
-        conn.rollback()
         logger.error(f"Registration error: {e}")
         raise HTTPException(status_code=500, detail="Registration failed")
-    finally:
-        cur.close()
-        conn.close()
 
 
 @router.post("/login", response_model=TokenResponse)
@@ -102,35 +90,41 @@ async def login(credentials: UserLogin):
     - Validates credentials with bcrypt
     - Returns JWT token with 24h expiry
     - Updates last_login_at timestamp
+    - Rehashes the password if BCRYPT_ROUNDS changed since it was stored
     """
-    conn = get_db()
-    cur = conn.cursor()
-
     try:
         # Get user by email
-        cur.execute("""
-            SELECT user_id, email, password_hash, subscription_tier
-            FROM receipts.users
-            WHERE email = %s AND is_deleted = FALSE
-        """, (credentials.email,))
+        async with db.acquire() as conn:
+            result = await conn.fetchrow("""
+                SELECT user_id, email, password_hash, subscription_tier
+                FROM receipts.users
+                WHERE email = $1 AND is_deleted = FALSE
+            """, credentials.email)
 
-        result = cur.fetchone()
         if not result:
             raise HTTPException(status_code=401, detail="Invalid email or password")
 
         user_id, email, password_hash, tier = result
 
         # Verify password
-        if not bcrypt.checkpw(credentials.password.encode(), password_hash.encode()):
+        if not await password_hasher.verify(credentials.password, password_hash):
             raise HTTPException(status_code=401, detail="Invalid email or password")
 
-        # Update last_login_at
-        cur.execute("""
-            UPDATE receipts.users
-            SET last_login_at = NOW(), updated_at = NOW()
-            WHERE user_id = %s
-        """, (user_id,))
-        conn.commit()
+        # Transparent rehash when the configured cost factor changed
+        new_hash = None
+        if password_hasher.needs_rehash(password_hash):
+            new_hash = await password_hasher.hash(credentials.password)
+            password_hasher.rehashed += 1
+
+        # Update last_login_at (and password_hash if rehashed)
+        async with db.acquire() as conn:
+            await conn.execute("""
+                UPDATE receipts.users
+                SET last_login_at = NOW(),
+                    updated_at = NOW(),
+                    password_hash = COALESCE($2, password_hash)
+                WHERE user_id = $1
+            """, user_id, new_hash)
 
         # Create JWT token
         token = create_jwt_token(str(user_id), email, tier)
@@ -149,9 +143,6 @@ async def login(credentials: UserLogin):
     except Exception as e:
         logger.error(f"Login error: {e}")
         raise HTTPException(status_code=500, detail="Login failed")
-    finally:
-        cur.close()
-        conn.close()
 
 
 @router.get("/me")
@@ -161,44 +152,37 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
 
     Requires: Valid JWT token in Authorization header
     """
-    conn = get_db()
-    cur = conn.cursor()
-
-    try:
-        cur.execute("""
+    async with db.acquire() as conn:
+        result = await conn.fetchrow("""
             SELECT
                 u.user_id,
                 u.email,
                 u.full_name,
                 u.subscription_tier,
                 u.monthly_receipt_limit,
-                u.receipts_uploaded_this_month,
+                -- Synced from Redis; a stale month means nothing uploaded yet this month
+                CASE WHEN u.month_reset_date > CURRENT_DATE THEN u.receipts_uploaded_this_month ELSE 0 END,
                 u.created_at,
                 n.current_streak_days,
                 n.total_receipts_processed,
                 n.achievement_badges
             FROM receipts.users u
             LEFT JOIN receipts.user_neurotransmitters n ON u.user_id = n.user_id
-            WHERE u.user_id = %s AND u.is_deleted = FALSE
-        """, (current_user["sub"],))
-
-        result = cur.fetchone()
-        if not result:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        return {
-            "user_id": str(result[0]),
-            "email": result[1],
-            "full_name": result[2],
-            "subscription_tier": result[3],
-            "monthly_receipt_limit": result[4],
-            "receipts_uploaded_this_month": result[5],
-            "created_at": result[6].isoformat(),
-            "streak_days": result[7] or 0,
-            "total_receipts": result[8] or 0,
-            "badges": result[9] or []
-        }
-
-    finally:
-        cur.close()
-        conn.close()
+            WHERE u.user_id = $1 AND u.is_deleted = FALSE
+        """, current_user["sub"])
+
+    if not result:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return {
+        "user_id": str(result[0]),
+        "email": result[1],
+        "full_name": result[2],
+        "subscription_tier": result[3],
+        "monthly_receipt_limit": result[4],
+        "receipts_uploaded_this_month": result[5],
+        "created_at": result[6].isoformat(),
+        "streak_days": result[7] or 0,
+        "total_receipts": result[8] or 0,
+        "badges": result[9] or []
+    }
@@ -2,47 +2,60 @@
 Categories API Endpoints
 CRA T2125 business expense categories
 """
-from fastapi import APIRouter, Depends
-import psycopg2
+from fastapi import APIRouter, Depends, Request, Response
+from datetime import datetime, timezone
+import asyncio
+import hashlib
+import json
 import logging
 
-from config import settings
+from db import db
 from middleware.jwt_auth import get_current_user
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# NOTIFY channel raised by the receipts.categories statement trigger
+CATEGORIES_CHANNEL = "receipts_categories_changed"
 
-def get_db():
-    """Get database connection"""
-    return psycopg2.connect(settings.database_url)
 
-
-@router.get("/")
-async def list_categories(current_user: dict = Depends(get_current_user)):
+class CategoryCatalogue:
     """
-    List all active expense categories
+    Per-worker snapshot of the active category list
 
-    Returns CRA-compliant T2125 categories for Canadian business expenses
+    - Serialized once per change, served as pre-encoded JSON
+    - Strong ETag over the serialized body for If-None-Match / 304
+    - Refreshed by NOTIFY on CATEGORIES_CHANNEL, so every worker reloads together
     """
-    conn = get_db()
-    cur = conn.cursor()
-
-    try:
-        cur.execute("""
-            SELECT
-                category_id,
-                category_code,
-                category_name,
-                cra_line_number,
-                description
-            FROM receipts.categories
-            WHERE is_active = TRUE
-            ORDER BY category_name
-        """)
+
+    def __init__(self):
+        self.body: bytes = b""
+        self.etag: str | None = None
+        self.loaded_at: datetime | None = None
+        self.reloads = 0
+        self._lock = asyncio.Lock()
+
+    async def reload(self, payload: str | None = None):
+        """Re-read active categories from Postgres (serialized so snapshots never go backwards)"""
+        async with self._lock:
+            await self._load(payload)
+
+    async def _load(self, payload: str | None):
+        async with db.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT
+                    category_id,
+                    category_code,
+                    category_name,
+                    cra_line_number,
+                    description
+                FROM receipts.categories
+                WHERE is_active = TRUE
+                ORDER BY category_name
+            """)
 
         categories = []
-        for row in cur.fetchall():
+        for row in rows:
             categories.append({
                 "category_id": row[0],
                 "category_code": row[1],
@@ -51,8 +64,37 @@ async def list_categories(current_user: dict = Depends(get_current_user)):
                 "description": row[4]
             })
 
-        return {"categories": categories, "count": len(categories)}
+        body = json.dumps({"categories": categories, "count": len(categories)}).encode()
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.loaded_at = datetime.now(timezone.utc)
+        self.reloads += 1
+        logger.info(f"Category catalogue loaded ({len(categories)} categories, trigger={payload or 'startup'})")
+
+    def matches(self, if_none_match: str | None) -> bool:
+        """True if an If-None-Match header covers the current ETag"""
+        if not if_none_match or self.etag is None:
+            return False
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags
+
+
+category_catalogue = CategoryCatalogue()
+
+
+@router.get("/")
+async def list_categories(request: Request, current_user: dict = Depends(get_current_user)):
+    """
+    List all active expense categories
+
+    Returns CRA-compliant T2125 categories for Canadian business expenses.
+    Supports If-None-Match: unchanged catalogues return 304 Not Modified.
+    """
+    if category_catalogue.etag is None:
+        await category_catalogue.reload()
+
+    headers = {"ETag": category_catalogue.etag, "Cache-Control": "private, no-cache"}
+    if category_catalogue.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
 
-    finally:
-        cur.close()
-        conn.close()
+    return Response(content=category_catalogue.body, media_type="application/json", headers=headers)
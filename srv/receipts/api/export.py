@@ -1,28 +1,136 @@
 """
 Export API Endpoints
-Excel export with CRA T2125 template (Phase 4 implementation)
+Excel export with CRA T2125 summary, synchronous for small histories, background jobs for large ones
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, JSONResponse
+from starlette.background import BackgroundTask
+from datetime import date
 import logging
+import os
+import tempfile
+import uuid
 
+from config import settings
+from db import db
+from export.jobs import export_jobs
+from export.t2125 import count_receipts, fetch_summary, write_workbook
 from middleware.jwt_auth import get_current_user
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def export_filename(year: int | None) -> str:
+    return f"T2125_{year or 'all'}_{date.today().isoformat()}.xlsx"
+
+
+def job_to_dict(job) -> dict:
+    ready = job["status"] == "completed"
+    return {
+        "job_id": str(job["job_id"]),
+        "status": job["status"],
+        "year": job["tax_year"],
+        "receipt_count": job["receipt_count"],
+        "file_size_bytes": job["file_size_bytes"],
+        "error": job["error"],
+        "created_at": job["created_at"].isoformat(),
+        "completed_at": job["completed_at"].isoformat() if job["completed_at"] else None,
+        "expires_at": job["expires_at"].isoformat() if job["expires_at"] else None,
+        "status_url": f"/api/export/jobs/{job['job_id']}",
+        "download_url": f"/api/export/jobs/{job['job_id']}/download" if ready else None,
+    }
+
 
 @router.get("/excel")
 async def export_to_excel(
-    year: int = None,
+    year: int | None = Query(None, ge=2000, le=2100),
+    background: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Export receipts to Excel with CRA T2125 format
 
-    Phase 1: Placeholder
-    Phase 4: Full implementation with openpyxl and T2125 template
+    - Sheet 1: per-line T2125 totals computed in SQL (GROUP BY cra_line_number)
+    - Sheet 2: every receipt, written from a server-side cursor in constant memory
+    - Up to EXPORT_SYNC_MAX_RECEIPTS receipts: the workbook is returned directly
+    - Larger exports (or background=true): 202 with a job to poll and a download link
     """
-    raise HTTPException(
-        status_code=501,
-        detail="Excel export will be implemented in Phase 4"
+    user_id = current_user["sub"]
+    async with db.acquire() as conn:
+        count = await count_receipts(conn, user_id, year)
+
+    if background or count > settings.EXPORT_SYNC_MAX_RECEIPTS:
+        job_id = await export_jobs.submit(user_id, year, count)
+        job = await export_jobs.get(job_id, user_id)
+        return JSONResponse(status_code=202, content=job_to_dict(job))
+
+    # xlsx is a zip archive that is only valid once closed, so it is built on
+    # disk (openpyxl spools sheet XML there too) and sent in chunks from the file
+    tmp_dir = os.path.join(settings.UPLOAD_DIR, "exports")
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=".xlsx", dir=tmp_dir)
+    os.close(fd)
+    try:
+        async with db.acquire() as conn:
+            await write_workbook(conn, user_id, year, path)
+    except Exception:
+        os.unlink(path)
+        raise
+
+    return FileResponse(
+        path,
+        media_type=XLSX_MEDIA_TYPE,
+        filename=export_filename(year),
+        background=BackgroundTask(os.unlink, path),
     )
+
+
+@router.get("/summary")
+async def t2125_summary(
+    year: int = Query(..., ge=2000, le=2100),
+    current_user: dict = Depends(get_current_user)
+):
+    """Per-line T2125 totals for one tax year (reads receipts.t2125_summary)"""
+    async with db.acquire() as conn:
+        rows = await fetch_summary(conn, current_user["sub"], year)
+
+    return {
+        "year": year,
+        "lines": [
+            {
+                "line": row["line"],
+                "categories": row["categories"],
+                "receipts": row["receipts"],
+                "total": float(row["total"]),
+                "tax": float(row["tax"]),
+                "deductible": float(row["deductible"]),
+            }
+            for row in rows
+        ],
+    }
+
+
+@router.get("/jobs/{job_id}")
+async def get_export_job(job_id: uuid.UUID, current_user: dict = Depends(get_current_user)):
+    """Status of a background export"""
+    job = await export_jobs.get(job_id, current_user["sub"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job_to_dict(job)
+
+
+@router.get("/jobs/{job_id}/download")
+async def download_export(job_id: uuid.UUID, current_user: dict = Depends(get_current_user)):
+    """Download a finished background export"""
+    job = await export_jobs.get(job_id, current_user["sub"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    if not os.path.exists(job["file_path"]):
+        raise HTTPException(status_code=410, detail="Export file has expired")
+
+    return FileResponse(job["file_path"], media_type=XLSX_MEDIA_TYPE, filename=export_filename(job["tax_year"]))
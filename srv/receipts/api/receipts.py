@@ -2,77 +2,369 @@
 Receipts API Endpoints
 Upload, list, and manage receipts (Phase 2+ implementation)
 """
-from fastapi import APIRouter, Depends, HTTPException
-import psycopg2
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Literal
+import base64
+import json
 import logging
+import uuid
 
+from ai.worker import extraction_workers
 from config import settings
+from db import db
 from middleware.jwt_auth import get_current_user
+from quota import QuotaReservation, upload_quota
+from uploads import StagedUpload, stage_import, stage_uploads
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-def get_db():
-    """Get database connection"""
-    return psycopg2.connect(settings.database_url)
+RECEIPT_LIST_COLUMNS = """
+    receipt_id,
+    original_filename,
+    vendor_name,
+    transaction_date,
+    total_amount,
+    extraction_status,
+    uploaded_at
+"""
+
+ExtractionStatus = Literal["pending", "processing", "completed", "failed", "manual_review"]
+
+
+def encode_cursor(uploaded_at: datetime, receipt_id) -> str:
+    """Opaque keyset cursor for the (uploaded_at, receipt_id) position"""
+    raw = json.dumps([uploaded_at.isoformat(), str(receipt_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """Inverse of encode_cursor, 400 on anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        uploaded_at, receipt_id = json.loads(raw)
+        return datetime.fromisoformat(uploaded_at), uuid.UUID(receipt_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def receipt_to_dict(row) -> dict:
+    """Serialize one RECEIPT_LIST_COLUMNS row"""
+    return {
+        "receipt_id": str(row[0]),
+        "filename": row[1],
+        "vendor": row[2],
+        "date": row[3].isoformat() if row[3] else None,
+        "amount": float(row[4]) if row[4] else None,
+        "status": row[5],
+        "uploaded_at": row[6].isoformat()
+    }
+
+
+def build_list_query(user_id: str, cursor: str | None, date_from: date | None, date_to: date | None,
+                     category_id: int | None, status: str | None,
+                     min_amount: Decimal | None, max_amount: Decimal | None) -> tuple[str, list]:
+    """
+    Keyset query over idx_receipts_user_uploaded
+
+    Rows come back newest first; callers append their own LIMIT.
+    """
+    clauses = ["user_id = $1", "deleted_at IS NULL"]
+    args: list = [user_id]
+
+    def add(clause: str, *values):
+        for value in values:
+            args.append(value)
+            clause = clause.replace("?", f"${len(args)}", 1)
+        clauses.append(clause)
+
+    if cursor:
+        add("(uploaded_at, receipt_id) < (?, ?)", *decode_cursor(cursor))
+    if date_from:
+        add("transaction_date >= ?", date_from)
+    if date_to:
+        add("transaction_date <= ?", date_to)
+    if category_id is not None:
+        add("category_id = ?", category_id)
+    if status:
+        add("extraction_status = ?", status)
+    if min_amount is not None:
+        add("total_amount >= ?", min_amount)
+    if max_amount is not None:
+        add("total_amount <= ?", max_amount)
+
+    query = f"""
+        SELECT {RECEIPT_LIST_COLUMNS}
+        FROM receipts.receipts
+        WHERE {" AND ".join(clauses)}
+        ORDER BY uploaded_at DESC, receipt_id DESC
+    """
+    return query, args
+
+
+async def stream_receipts(query: str, args: list):
+    """NDJSON rows from a server-side cursor, constant memory regardless of history size"""
+    async with db.acquire() as conn:
+        async with conn.transaction(readonly=True):
+            async for row in conn.cursor(query, *args, prefetch=settings.RECEIPTS_STREAM_PREFETCH):
+                yield json.dumps(receipt_to_dict(row)) + "\n"
 
 
 @router.get("/list")
-async def list_receipts(current_user: dict = Depends(get_current_user)):
+async def list_receipts(
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    date_from: date | None = None,
+    date_to: date | None = None,
+    category_id: int | None = None,
+    status: ExtractionStatus | None = None,
+    min_amount: Decimal | None = None,
+    max_amount: Decimal | None = None,
+    format: Literal["json", "ndjson"] = "json",
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    List receipts for current user, newest first
+
+    - Keyset pagination: pass next_cursor back as ?cursor= for the next page
+    - Filters: transaction date range, category, extraction status, amount range
+    - format=ndjson streams every matching receipt (ignores limit) in constant memory
     """
-    List all receipts for current user
+    query, args = build_list_query(
+        current_user["sub"], cursor, date_from, date_to,
+        category_id, status, min_amount, max_amount
+    )
+
+    if format == "ndjson":
+        return StreamingResponse(stream_receipts(query, args), media_type="application/x-ndjson")
+
+    async with db.acquire() as conn:
+        rows = await conn.fetch(f"{query} LIMIT {limit + 1}", *args)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    receipts = [receipt_to_dict(row) for row in rows]
+    next_cursor = encode_cursor(rows[-1][6], rows[-1][0]) if has_more else None
 
-    Phase 1: Basic stub
-    Phase 2: Full implementation with pagination, filtering
+    return {"receipts": receipts, "count": len(receipts), "next_cursor": next_cursor}
+
+
+@router.post("/upload", status_code=202)
+async def upload_receipt(request: Request, current_user: dict = Depends(get_current_user)):
     """
-    conn = get_db()
-    cur = conn.cursor()
+    Upload new receipt (multipart/form-data with one file part)
+
+    - Streams to a temp file under UPLOAD_DIR while computing SHA-256 (O(chunk) memory)
+    - Enforces MAX_FILE_SIZE_MB, ALLOWED_EXTENSIONS and sniffed MIME type mid-stream
+    - A file this user already uploaded returns the existing receipt, nothing is stored
+    - New files count against the monthly quota (402 once it is used up)
+    - Returns 202 immediately; extraction workers pick the receipt up in the background
+    """
+    user_id = current_user["sub"]
+    staged = (await stage_uploads(request, max_files=1))[0]
+    quota = created = None
 
     try:
-        cur.execute("""
-            SELECT
-                receipt_id,
-                original_filename,
-                vendor_name,
-                transaction_date,
-                total_amount,
-                extraction_status,
-                uploaded_at
-            FROM receipts.receipts
-            WHERE user_id = %s AND deleted_at IS NULL
-            ORDER BY uploaded_at DESC
-            LIMIT 50
-        """, (current_user["sub"],))
-
-        receipts = []
-        for row in cur.fetchall():
-            receipts.append({
-                "receipt_id": str(row[0]),
-                "filename": row[1],
-                "vendor": row[2],
-                "date": row[3].isoformat() if row[3] else None,
-                "amount": float(row[4]) if row[4] else None,
-                "status": row[5],
-                "uploaded_at": row[6].isoformat()
-            })
-
-        return {"receipts": receipts, "count": len(receipts)}
-
-    finally:
-        cur.close()
-        conn.close()
-
-
-@router.post("/upload")
-async def upload_receipt(current_user: dict = Depends(get_current_user)):
+        async with db.acquire() as conn:
+            existing = await conn.fetchrow("""
+                SELECT receipt_id, extraction_status
+                FROM receipts.receipts
+                WHERE user_id = $1 AND file_hash = $2 AND deleted_at IS NULL
+            """, user_id, staged.file_hash)
+
+            if existing:
+                staged.discard()
+                return JSONResponse(status_code=200, content=upload_response(existing, staged, duplicate=True))
+
+            quota = await upload_quota.reserve(conn, user_id, current_user.get("tier", "free"))
+            if not quota.granted:
+                raise quota_exceeded(quota)
+
+            receipt_id = uuid.uuid4()
+            staged.store(user_id, receipt_id)
+            ttl_days = settings.FREE_TIER_TTL_DAYS if current_user.get("tier", "free") == "free" else None
+
+            for _ in range(2):
+                created = await conn.fetchrow("""
+                    INSERT INTO receipts.receipts (
+                        receipt_id, user_id, original_filename, file_hash,
+                        file_size_bytes, mime_type, storage_path, expires_at
+                    )
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, NOW() + make_interval(days => $8))
+                    ON CONFLICT (user_id, file_hash) WHERE deleted_at IS NULL DO NOTHING
+                    RETURNING receipt_id, extraction_status
+                """, receipt_id, user_id, staged.filename, staged.file_hash,
+                    staged.size_bytes, staged.mime_type, staged.temp_path, ttl_days)
+                if created:
+                    break
+
+                # Lost a race with a concurrent upload of the same file
+                existing = await conn.fetchrow("""
+                    SELECT receipt_id, extraction_status
+                    FROM receipts.receipts
+                    WHERE user_id = $1 AND file_hash = $2 AND deleted_at IS NULL
+                """, user_id, staged.file_hash)
+                if existing:
+                    staged.discard()
+                    await upload_quota.refund(quota, 1)
+                    return JSONResponse(status_code=200, content=upload_response(existing, staged, duplicate=True))
+                # The winner was deleted (by the user or the purge job) in between: insert again
+            else:
+                raise HTTPException(status_code=409, detail="Upload raced with a concurrent change to this file, retry")
+
+    except Exception:
+        staged.discard()
+        if quota and not created:
+            await upload_quota.refund(quota, quota.granted)
+        raise
+
+    extraction_workers.notify()
+    logger.info(f"Receipt uploaded: {created['receipt_id']} ({staged.size_bytes} bytes)")
+    return upload_response(created, staged, duplicate=False)
+
+
+@router.post("/import", status_code=202)
+async def import_receipts(request: Request, current_user: dict = Depends(get_current_user)):
     """
-    Upload new receipt
+    Bulk import: many file parts and/or zip archives in one multipart request
 
-    Phase 1: Placeholder
-    Phase 2: Full implementation with file upload, deduplication, AI extraction
+    - Up to IMPORT_MAX_FILES receipts, each checked like a single upload
+    - Bad files inside archives are reported in "rejected" instead of failing the import
+    - Files already uploaded (or repeated within the import) come back as duplicates
+    - New files count against the monthly quota; files past it are rejected
+      (402 if the quota was already used up and nothing else was imported)
+    - New receipts go in with one INSERT ... SELECT FROM unnest(), so the
+      statement-level streak trigger updates each user's counters once
     """
-    raise HTTPException(status_code=501, detail="Receipt upload will be implemented in Phase 2")
+    user_id = current_user["sub"]
+    staged, rejected = await stage_import(request)
+
+    results: list[dict] = []
+    over_quota: list[dict] = []
+    quota = None
+    stored = 0
+    fresh: dict[str, StagedUpload] = {}
+    repeats: list[StagedUpload] = []
+    for upload in staged:
+        if upload.file_hash in fresh:
+            repeats.append(upload)
+            upload.discard()
+        else:
+            fresh[upload.file_hash] = upload
+
+    try:
+        async with db.acquire() as conn:
+            existing = await conn.fetch("""
+                SELECT receipt_id, extraction_status, file_hash
+                FROM receipts.receipts
+                WHERE user_id = $1 AND file_hash = ANY($2::text[]) AND deleted_at IS NULL
+            """, user_id, list(fresh))
+            for row in existing:
+                upload = fresh.pop(row["file_hash"])
+                upload.discard()
+                results.append({"filename": upload.filename, **upload_response(row, upload, duplicate=True)})
+
+            if fresh:
+                quota = await upload_quota.reserve(conn, user_id, current_user.get("tier", "free"), len(fresh))
+                for file_hash in list(fresh)[quota.granted:]:
+                    upload = fresh.pop(file_hash)
+                    upload.discard()
+                    over_quota.append({"filename": upload.filename, "error": "Monthly upload limit reached"})
+                if over_quota and not fresh and not results:
+                    raise quota_exceeded(quota)
+
+            receipt_ids = {file_hash: uuid.uuid4() for file_hash in fresh}
+            for file_hash, upload in fresh.items():
+                upload.store(user_id, receipt_ids[file_hash])
+            ttl_days = settings.FREE_TIER_TTL_DAYS if current_user.get("tier", "free") == "free" else None
+
+            uploads = list(fresh.values())
+            created = await conn.fetch("""
+                INSERT INTO receipts.receipts (
+                    receipt_id, user_id, original_filename, file_hash,
+                    file_size_bytes, mime_type, storage_path, expires_at
+                )
+                SELECT receipt_id, $2, original_filename, file_hash,
+                       file_size_bytes, mime_type, storage_path,
+                       NOW() + make_interval(days => $8)
+                FROM unnest($1::uuid[], $3::text[], $4::text[], $5::int[], $6::text[], $7::text[])
+                    AS f(receipt_id, original_filename, file_hash, file_size_bytes, mime_type, storage_path)
+                ON CONFLICT (user_id, file_hash) WHERE deleted_at IS NULL DO NOTHING
+                RETURNING receipt_id, extraction_status, file_hash
+            """, [receipt_ids[u.file_hash] for u in uploads], user_id,
+                [u.filename for u in uploads], [u.file_hash for u in uploads],
+                [u.size_bytes for u in uploads], [u.mime_type for u in uploads],
+                [u.temp_path for u in uploads], ttl_days)
+
+            stored = len(created)
+            for row in created:
+                upload = fresh.pop(row["file_hash"])
+                results.append({"filename": upload.filename, **upload_response(row, upload, duplicate=False)})
+
+            if fresh:
+                # Lost races with concurrent uploads of the same files
+                raced = await conn.fetch("""
+                    SELECT receipt_id, extraction_status, file_hash
+                    FROM receipts.receipts
+                    WHERE user_id = $1 AND file_hash = ANY($2::text[]) AND deleted_at IS NULL
+                """, user_id, list(fresh))
+                for row in raced:
+                    upload = fresh.pop(row["file_hash"])
+                    upload.discard()
+                    results.append({"filename": upload.filename, **upload_response(row, upload, duplicate=True)})
+
+    except Exception:
+        for upload in fresh.values():
+            upload.discard()
+        if quota:
+            await upload_quota.refund(quota, quota.granted - stored)
+        raise
+
+    if quota:
+        # Granted uploads that lost a race or could not be stored
+        await upload_quota.refund(quota, quota.granted - stored)
+    rejected.extend(over_quota)
+    for file_hash, upload in fresh.items():
+        upload.discard()
+        rejected.append({"filename": upload.filename, "error": "Could not be imported, retry"})
+
+    by_hash = {r["file_hash"]: r for r in results}
+    for upload in repeats:
+        if upload.file_hash in by_hash:
+            results.append({**by_hash[upload.file_hash], "filename": upload.filename, "duplicate": True})
+
+    imported = sum(1 for r in results if not r["duplicate"])
+    if imported:
+        extraction_workers.notify()
+    logger.info(f"Bulk import for {user_id}: {imported} new, {len(results) - imported} duplicates, {len(rejected)} rejected")
+    return {
+        "imported": imported,
+        "duplicates": len(results) - imported,
+        "receipts": results,
+        "rejected": rejected,
+    }
+
+
+def quota_exceeded(quota: QuotaReservation) -> HTTPException:
+    return HTTPException(
+        status_code=402,
+        detail=f"Monthly upload limit of {quota.limit} receipts reached. Upgrade your plan to upload more.",
+    )
+
+
+def upload_response(row, staged: StagedUpload, duplicate: bool) -> dict:
+    """Response body shared by new and duplicate uploads"""
+    return {
+        "receipt_id": str(row["receipt_id"]),
+        "status": row["extraction_status"],
+        "file_hash": staged.file_hash,
+        "size_bytes": staged.size_bytes,
+        "duplicate": duplicate
+    }
 
 
 @router.get("/{receipt_id}")
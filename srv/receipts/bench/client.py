@@ -0,0 +1,119 @@
+"""
+Benchmark Clients
+One request interface over the ASGI app in-process or a live server over HTTP
+"""
+from urllib.parse import urlsplit
+import asyncio
+import json
+import uuid
+
+import aiohttp
+
+
+def multipart_body(files: list[tuple[str, bytes, str]]) -> tuple[str, bytes]:
+    """multipart/form-data body with one "file" part per (filename, data, content_type)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for filename, data, content_type in files:
+        parts.append(
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n".encode() + data + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return f"multipart/form-data; boundary={boundary}", b"".join(parts)
+
+
+def json_body(payload: dict) -> tuple[str, bytes]:
+    return "application/json", json.dumps(payload).encode()
+
+
+class ASGIClient:
+    """
+    Calls the app directly through the ASGI interface (no sockets, no server)
+
+    Runs the app lifespan on enter, so pools, workers and listeners start as
+    they would under uvicorn. Measures the app and middleware stack alone.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lifespan = None
+
+    async def __aenter__(self):
+        self._lifespan = self.app.router.lifespan_context(self.app)
+        await self._lifespan.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._lifespan.__aexit__(*exc)
+
+    async def request(self, method: str, path: str, headers: dict | None = None, body: bytes = b"") -> tuple[int, bytes]:
+        url = urlsplit(path)
+        raw_headers = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+        raw_headers += [(b"host", b"bench"), (b"content-length", str(len(body)).encode())]
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": url.path,
+            "raw_path": url.path.encode(),
+            "query_string": url.query.encode(),
+            "root_path": "",
+            "headers": raw_headers,
+            "client": ("127.0.0.1", 50000),
+            "server": ("bench", 80),
+        }
+        status = 500
+        chunks: list[bytes] = []
+        finished = asyncio.Event()
+        body_sent = False
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # Like a client that stays connected until the response is complete
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    finished.set()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finished.set()
+        return status, b"".join(chunks)
+
+
+class HTTPClient:
+    """Calls a running server (uvicorn workers, nginx) over keep-alive HTTP"""
+
+    def __init__(self, base_url: str, connections: int = 64):
+        self.base_url = base_url.rstrip("/")
+        self.connections = connections
+        self._session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connections),
+            timeout=aiohttp.ClientTimeout(total=300),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+
+    async def request(self, method: str, path: str, headers: dict | None = None, body: bytes = b"") -> tuple[int, bytes]:
+        async with self._session.request(method, f"{self.base_url}{path}", headers=headers, data=body) as resp:
+            return resp.status, await resp.read()
@@ -0,0 +1,109 @@
+"""
+Login Storm Benchmark
+Measures /health latency before and during a burst of concurrent logins
+
+Usage (against a running server):
+    python -m bench.login_storm --url http://localhost:8000 --concurrency 32 --duration 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import aiohttp
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples: list[float]) -> dict:
+    """Latency summary in milliseconds"""
+    return {
+        "count": len(samples),
+        "p50_ms": round(1000 * percentile(samples, 50), 2),
+        "p95_ms": round(1000 * percentile(samples, 95), 2),
+        "p99_ms": round(1000 * percentile(samples, 99), 2),
+        "mean_ms": round(1000 * statistics.fmean(samples), 2) if samples else 0.0,
+    }
+
+
+async def probe_health(session: aiohttp.ClientSession, url: str, duration: float, interval: float) -> list[float]:
+    """Hit /health at a fixed rate and record latencies"""
+    samples = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        async with session.get(f"{url}/health") as resp:
+            await resp.read()
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(max(0.0, interval - (time.perf_counter() - started)))
+    return samples
+
+
+async def login_worker(session: aiohttp.ClientSession, url: str, credentials: dict, deadline: float, latencies: list[float]):
+    """Log in back-to-back until the deadline"""
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        async with session.post(f"{url}/auth/login", json=credentials) as resp:
+            await resp.read()
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(args):
+    credentials = {
+        "email": args.email or f"bench-{uuid.uuid4().hex[:12]}@example.com",
+        "password": args.password,
+    }
+    connector = aiohttp.TCPConnector(limit=args.concurrency + 4)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        if not args.email:
+            async with session.post(f"{args.url}/auth/register", json=credentials) as resp:
+                if resp.status != 201:
+                    raise SystemExit(f"Could not register bench user: {resp.status} {await resp.text()}")
+
+        print(f"Idle phase: probing /health for {args.duration}s")
+        idle = await probe_health(session, args.url, args.duration, args.interval)
+
+        print(f"Storm phase: {args.concurrency} concurrent logins for {args.duration}s")
+        logins: list[float] = []
+        deadline = time.perf_counter() + args.duration
+        workers = [
+            asyncio.create_task(login_worker(session, args.url, credentials, deadline, logins))
+            for _ in range(args.concurrency)
+        ]
+        storm = await probe_health(session, args.url, args.duration, args.interval)
+        await asyncio.gather(*workers)
+
+    idle_summary, storm_summary = summarize(idle), summarize(storm)
+    print(f"/health idle : {idle_summary}")
+    print(f"/health storm: {storm_summary}")
+    print(f"/auth/login  : {summarize(logins)} ({len(logins) / args.duration:.1f} logins/s)")
+
+    if idle_summary["p99_ms"]:
+        ratio = storm_summary["p99_ms"] / idle_summary["p99_ms"]
+        print(f"/health p99 storm/idle ratio: {ratio:.2f}")
+        if args.max_ratio and ratio > args.max_ratio:
+            raise SystemExit(f"FAIL: /health p99 grew {ratio:.2f}x during the login storm (limit {args.max_ratio}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--email", help="Existing account to log in as (default: register a throwaway user)")
+    parser.add_argument("--password", default="bench-password-123")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--interval", type=float, default=0.05, help="Seconds between /health probes")
+    parser.add_argument("--max-ratio", type=float, default=2.0, help="Fail if storm p99 exceeds idle p99 by this factor")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
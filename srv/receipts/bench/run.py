@@ -0,0 +1,322 @@
+"""
+Receipts API Benchmark Suite
+Scenario load tests with per-route throughput and p50/p95/p99, compared against a stored baseline
+
+Needs Postgres and Redis (the tier1 containers, via the usual POSTGRES_* / REDIS_*
+settings). Ollama is replaced by ai.ollama_stub, started in-process.
+
+    # App and middleware only, driven through ASGI in this process
+    python -m bench.run --mode asgi
+
+    # Real server: 4 uvicorn workers started on a spare port
+    python -m bench.run --mode uvicorn --workers 4
+
+    # Already running server (its rate limits and quotas apply, so seed less or relax them)
+    python -m bench.run --mode url --url http://localhost:8000 --seed-receipts 0
+
+    # Record a new baseline, then fail later runs that regress against it
+    python -m bench.run --mode uvicorn --save-baseline
+    python -m bench.run --mode uvicorn --max-latency-regression 0.25 --max-throughput-regression 0.2
+"""
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import aiohttp
+from aiohttp import web
+
+from bench.client import ASGIClient, HTTPClient, json_body, multipart_body
+from bench.login_storm import summarize
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(BENCH_DIR)
+SCENARIOS = ("login", "list", "upload", "export")
+
+# Applied to the app under test (asgi/uvicorn modes) so the bench measures
+# request handling rather than tripping its own limits
+BENCH_ENV = {
+    "RATE_LIMIT_ENABLED": "false",
+    "FREE_TIER_MONTHLY_LIMIT": "100000000",
+    "OLLAMA_WARM_MODELS": "",
+    "EXTRACTION_POLL_SECONDS": "1",
+}
+
+
+@dataclass
+class BenchContext:
+    client: object
+    email: str
+    password: str
+    token: str = ""
+    samples: list[tuple[str, int, float]] = field(default_factory=list)
+
+    @property
+    def auth(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    async def call(self, route: str, method: str, path: str, headers: dict | None = None, body: bytes = b""):
+        started = time.perf_counter()
+        status, payload = await self.client.request(method, path, headers, body)
+        self.samples.append((route, status, time.perf_counter() - started))
+        return status, payload
+
+
+def receipt_png() -> bytes:
+    """Small unique PNG (random noise, so every upload has a new file hash)"""
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (64, 64), random.randbytes(64 * 64 * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# Scenarios: each worker loops until the deadline, recording every request
+# ---------------------------------------------------------------------------
+
+async def login_worker(ctx: BenchContext, deadline: float):
+    content_type, body = json_body({"email": ctx.email, "password": ctx.password})
+    while time.perf_counter() < deadline:
+        await ctx.call("POST /auth/login", "POST", "/auth/login", {"Content-Type": content_type}, body)
+
+
+async def list_worker(ctx: BenchContext, deadline: float, page_size: int = 50):
+    cursor = None
+    while time.perf_counter() < deadline:
+        path = f"/api/receipts/list?limit={page_size}" + (f"&cursor={cursor}" if cursor else "")
+        status, payload = await ctx.call("GET /api/receipts/list", "GET", path, ctx.auth)
+        cursor = json.loads(payload).get("next_cursor") if status == 200 else None
+
+
+async def upload_worker(ctx: BenchContext, deadline: float):
+    while time.perf_counter() < deadline:
+        content_type, body = multipart_body([(f"{uuid.uuid4().hex}.png", receipt_png(), "image/png")])
+        await ctx.call("POST /api/receipts/upload", "POST", "/api/receipts/upload",
+                       {**ctx.auth, "Content-Type": content_type}, body)
+
+
+async def export_worker(ctx: BenchContext, deadline: float):
+    while time.perf_counter() < deadline:
+        await ctx.call("GET /api/export/excel", "GET", "/api/export/excel", ctx.auth)
+
+
+WORKERS = {"login": login_worker, "list": list_worker, "upload": upload_worker, "export": export_worker}
+
+
+async def setup_user(ctx: BenchContext, seed_receipts: int):
+    """Register a throwaway user and give it a receipt history to page through and export"""
+    content_type, body = json_body({"email": ctx.email, "password": ctx.password})
+    status, payload = await ctx.client.request("POST", "/auth/register", {"Content-Type": content_type}, body)
+    if status != 201:
+        raise SystemExit(f"Could not register bench user: {status} {payload[:200]!r}")
+    ctx.token = json.loads(payload)["access_token"]
+
+    for start in range(0, seed_receipts, 100):
+        files = [(f"seed-{i}.png", receipt_png(), "image/png") for i in range(start, min(seed_receipts, start + 100))]
+        content_type, body = multipart_body(files)
+        status, payload = await ctx.client.request(
+            "POST", "/api/receipts/import", {**ctx.auth, "Content-Type": content_type}, body
+        )
+        if status != 202:
+            raise SystemExit(f"Could not seed receipts: {status} {payload[:200]!r}")
+
+
+async def run_scenario(ctx: BenchContext, name: str, concurrency: int, duration: float, warmup: float) -> dict:
+    """Per-route throughput and latency for one scenario"""
+    worker = WORKERS[name]
+    if warmup:
+        deadline = time.perf_counter() + warmup
+        await asyncio.gather(*(worker(ctx, deadline) for _ in range(concurrency)))
+
+    ctx.samples = []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(worker(ctx, deadline) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    routes: dict[str, dict] = {}
+    for route in sorted({route for route, _, _ in ctx.samples}):
+        latencies = [seconds for r, _, seconds in ctx.samples if r == route]
+        errors = sum(1 for r, status, _ in ctx.samples if r == route and status >= 400)
+        routes[route] = {
+            **summarize(latencies),
+            "rps": round(len(latencies) / elapsed, 2),
+            "errors": errors,
+        }
+    return routes
+
+
+# ---------------------------------------------------------------------------
+# Targets
+# ---------------------------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start_ollama_stub(latency: float) -> tuple[web.AppRunner, str]:
+    from ai.ollama_stub import create_app
+
+    runner = web.AppRunner(create_app(latency=latency, load_seconds=0.0))
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def start_uvicorn(workers: int, env: dict, timeout: float = 60.0) -> tuple[subprocess.Popen, str]:
+    """uvicorn main:app on a spare port, returned once /health answers"""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=SERVICE_DIR, env={**os.environ, **env},
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise SystemExit(f"uvicorn exited with {process.returncode}")
+            try:
+                async with session.get(f"{url}/health") as resp:
+                    if resp.status == 200:
+                        return process, url
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    process.terminate()
+    raise SystemExit(f"uvicorn did not become healthy within {timeout:.0f}s")
+
+
+# ---------------------------------------------------------------------------
+# Baselines
+# ---------------------------------------------------------------------------
+
+def compare(results: dict, baseline: dict, max_latency: float, max_throughput: float) -> list[str]:
+    """Regressions of p95/p99, throughput or error count against the baseline"""
+    failures = []
+    for scenario, routes in results["scenarios"].items():
+        for route, current in routes.items():
+            before = baseline.get("scenarios", {}).get(scenario, {}).get(route)
+            if not before:
+                continue
+            label = f"{scenario} {route}"
+            for metric in ("p95_ms", "p99_ms"):
+                if before[metric] and current[metric] > before[metric] * (1 + max_latency):
+                    failures.append(f"{label}: {metric} {before[metric]} -> {current[metric]}")
+            if before["rps"] and current["rps"] < before["rps"] * (1 - max_throughput):
+                failures.append(f"{label}: rps {before['rps']} -> {current['rps']}")
+            if current["errors"] > before["errors"]:
+                failures.append(f"{label}: errors {before['errors']} -> {current['errors']}")
+    return failures
+
+
+def print_report(results: dict, baseline: dict | None):
+    print(f"\n{'scenario':<8} {'route':<28} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}  vs baseline p95")
+    for scenario, routes in results["scenarios"].items():
+        for route, r in routes.items():
+            before = (baseline or {}).get("scenarios", {}).get(scenario, {}).get(route)
+            delta = f"{100 * (r['p95_ms'] / before['p95_ms'] - 1):+.1f}%" if before and before["p95_ms"] else "-"
+            print(f"{scenario:<8} {route:<28} {r['rps']:>9} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['errors']:>7}  {delta}")
+
+
+async def run(args) -> int:
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    async with AsyncExitStack() as stack:
+        if args.mode == "url":
+            client = await stack.enter_async_context(HTTPClient(args.url, args.concurrency + 4))
+        else:
+            stub, ollama_url = await start_ollama_stub(args.ollama_latency)
+            stack.push_async_callback(stub.cleanup)
+            env = {**BENCH_ENV, "OLLAMA_HOST": ollama_url}
+
+            if args.mode == "asgi":
+                os.environ.update(env)  # Read by config.Settings when main is imported
+                from main import app
+
+                client = await stack.enter_async_context(ASGIClient(app))
+            else:
+                env["PROMETHEUS_MULTIPROC_DIR"] = stack.enter_context(tempfile.TemporaryDirectory())
+                process, url = await start_uvicorn(args.workers, env)
+                stack.callback(process.wait, 30)
+                stack.callback(process.terminate)
+                client = await stack.enter_async_context(HTTPClient(url, args.concurrency + 4))
+
+        ctx = BenchContext(client, f"bench-{uuid.uuid4().hex[:12]}@example.com", "bench-password-123")
+        await setup_user(ctx, args.seed_receipts)
+
+        results = {"mode": args.mode, "workers": args.workers, "concurrency": args.concurrency,
+                   "duration": args.duration, "scenarios": {}}
+        for name in scenarios:
+            print(f"Running {name}: {args.concurrency} concurrent clients for {args.duration}s")
+            results["scenarios"][name] = await run_scenario(ctx, name, args.concurrency, args.duration, args.warmup)
+
+    baseline_path = args.baseline or os.path.join(BENCH_DIR, "baselines", f"{args.mode}.json")
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {baseline_path}")
+        return 0
+
+    if baseline is None:
+        print(f"\nNo baseline at {baseline_path}; run with --save-baseline to record one")
+        return 0
+
+    failures = compare(results, baseline, args.max_latency_regression, args.max_throughput_regression)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    print(f"\n{len(failures)} regressions against {baseline_path}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("asgi", "uvicorn", "url"), default="asgi")
+    parser.add_argument("--url", default="http://localhost:8000", help="Server to load in url mode")
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn workers in uvicorn mode")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15.0, help="Measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds before each scenario")
+    parser.add_argument("--seed-receipts", type=int, default=500, help="Receipts imported before the run")
+    parser.add_argument("--ollama-latency", type=float, default=0.05, help="Stub seconds per extraction")
+    parser.add_argument("--baseline", help="Baseline JSON (default: bench/baselines/<mode>.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run as the new baseline")
+    parser.add_argument("--output", help="Also write this run's results to a JSON file")
+    parser.add_argument("--max-latency-regression", type=float, default=0.25, help="Allowed p95/p99 growth (0.25 = +25%%)")
+    parser.add_argument("--max-throughput-regression", type=float, default=0.2, help="Allowed rps drop (0.2 = -20%%)")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Cache Module
+Shared async Redis client, closed by the app lifespan
+"""
+import redis.asyncio as aioredis
+import logging
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Redis client (connections are opened lazily from its pool)
+redis_client = aioredis.Redis(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    password=settings.REDIS_PASSWORD,
+    decode_responses=True,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+)
+
+
+async def close_redis():
+    """Release pooled Redis connections (called once at shutdown)"""
+    await redis_client.aclose()
@@ -16,29 +16,112 @@ class Settings(BaseSettings):
     POSTGRES_USER: str = "phoenix"
     POSTGRES_PASSWORD: str
 
+    # Database connection pool (per uvicorn worker)
+    DB_POOL_MIN_SIZE: int = 2
+    DB_POOL_MAX_SIZE: int = 10
+    DB_POOL_ACQUIRE_TIMEOUT: float = 5.0
+    DB_POOL_MAX_IDLE_SECONDS: float = 300.0
+    DB_STATEMENT_CACHE_SIZE: int = 256
+    DB_COMMAND_TIMEOUT: float = 30.0
+
+    # Audit log writer (per uvicorn worker)
+    AUDIT_QUEUE_MAX: int = 10000
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL: float = 1.0
+    AUDIT_ENQUEUE_TIMEOUT: float = 0.05
+    AUDIT_SPILL_DIR: str = "/var/receipts_data/.audit_spill"
+    AUDIT_SPILL_RETRY_SECONDS: float = 30.0
+
     # Redis
     REDIS_HOST: str = "phoenix_redis"
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: str
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_SOCKET_TIMEOUT: float = 0.5
+
+    # Metrics (PROMETHEUS_MULTIPROC_DIR is read from the environment by prometheus_client)
+    METRICS_SAMPLE_SECONDS: float = 15.0
+
+    # Rate limiting (policies per tier/route live in middleware/rate_limit.py)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_REDIS_RETRY_SECONDS: float = 5.0
+    RATE_LIMIT_FALLBACK_WORKERS: int = 4  # In-process fallback splits each budget across workers
 
     # JWT Authentication
     JWT_SECRET: str
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRY_HOURS: int = 24
+    JWT_CACHE_SIZE: int = 10000
+
+    # Password hashing (per uvicorn worker)
+    BCRYPT_ROUNDS: int = 12
+    BCRYPT_WORKERS: int = 2
+    BCRYPT_MAX_PENDING: int = 64
 
     # Ollama AI
     OLLAMA_HOST: str = "http://phoenix_ollama:11434"
     OLLAMA_PRIMARY_MODEL: str = "llava:34b"
     OLLAMA_FALLBACK_MODEL: str = "llava:13b"
+    OLLAMA_MAX_CONCURRENCY: int = 1  # Concurrent inference calls per uvicorn worker
+    OLLAMA_TIMEOUT_SECONDS: float = 300.0
+    OLLAMA_MODEL_CONCURRENCY: str = ""  # Per-model overrides, e.g. "llava:34b=1,llava:13b=2"
+    OLLAMA_POOL_SIZE: int = 8  # Keep-alive HTTP connections to Ollama per uvicorn worker
+    OLLAMA_HTTP_KEEPALIVE_SECONDS: float = 60.0
+    OLLAMA_KEEP_ALIVE: str = "30m"  # How long Ollama keeps a model resident after a call
+    OLLAMA_MODEL_KEEP_ALIVE: str = ""  # Per-model overrides, e.g. "llava:34b=2h,llava:13b=15m"
+    OLLAMA_WARM_MODELS: str = "llava:34b,llava:13b"  # Loaded at startup and kept resident
+    OLLAMA_KEEP_WARM_SECONDS: float = 600.0  # Ping idle warm models this often (< OLLAMA_KEEP_ALIVE)
+
+    # Extraction workers (per uvicorn worker, 0 disables in-process workers)
+    EXTRACTION_WORKERS: int = 2
+    EXTRACTION_BATCH_SIZE: int = 4
+    EXTRACTION_POLL_SECONDS: float = 5.0
+    EXTRACTION_LEASE_SECONDS: int = 900
+    EXTRACTION_MAX_ATTEMPTS: int = 3
+    EXTRACTION_BACKOFF_SECONDS: float = 30.0
+    EXTRACTION_MIN_CONFIDENCE: float = 0.80
+    EXTRACTION_CACHE_TTL_DAYS: int = 90
+    EXTRACTION_CACHE_PG_MAX_ROWS: int = 200000
+    EXTRACTION_CACHE_PRUNE_EVERY: int = 500
+
+    # Vendor normalization (ai/vendors.py)
+    VENDOR_FUZZY_THRESHOLD: float = 0.6  # Trigram Jaccard similarity for OCR-noisy names
+    VENDOR_FLUSH_SECONDS: float = 30.0  # times_seen / last_seen_at batch interval
+
+    # Image pre-processing before inference (process pool per uvicorn worker)
+    PREPROCESS_ENABLED: bool = True
+    PREPROCESS_WORKERS: int = 1
+    PREPROCESS_MAX_SIDE: int = 1344
+    PREPROCESS_JPEG_QUALITY: int = 90
 
     # File Storage
     UPLOAD_DIR: str = "/var/receipts_data"
     MAX_FILE_SIZE_MB: int = 10
     ALLOWED_EXTENSIONS: str = "png,jpg,jpeg,pdf"
 
+    # Bulk import (POST /api/receipts/import)
+    IMPORT_MAX_FILES: int = 500
+    IMPORT_MAX_ARCHIVE_MB: int = 200
+
+    # Receipts listing
+    RECEIPTS_STREAM_PREFETCH: int = 500
+
+    # Expired receipt purge (jobs/purge_expired.py)
+    PURGE_BATCH_SIZE: int = 500
+    PURGE_BATCH_PAUSE_SECONDS: float = 0.2
+    PURGE_UNLINK_CONCURRENCY: int = 8
+    PURGE_UNLINK_RATE: float = 200.0  # Files per second
+
+    # T2125 export
+    EXPORT_SYNC_MAX_RECEIPTS: int = 5000  # Larger exports become background jobs
+    EXPORT_MAX_CONCURRENT: int = 1  # Background workbooks built at once per uvicorn worker
+    EXPORT_RETENTION_HOURS: int = 24
+
     # Freemium Limits
     FREE_TIER_MONTHLY_LIMIT: int = 10
     FREE_TIER_TTL_DAYS: int = 7
+    QUOTA_SYNC_SECONDS: float = 30.0  # Redis counters copied to receipts.users this often
+    QUOTA_REDIS_RETRY_SECONDS: float = 5.0
 
     # System
     LOG_LEVEL: str = "INFO"
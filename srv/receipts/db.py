@@ -0,0 +1,179 @@
+"""
+Database Module
+Shared asyncpg connection pool and LISTEN connection, opened and closed by the app lifespan
+"""
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+import asyncio
+import asyncpg
+import logging
+import time
+
+from config import settings
+from metrics import DB_POOL_ACQUIRE_SECONDS, DB_POOL_ACQUIRE_TIMEOUTS, DB_POOL_IN_USE, DB_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class Database:
+    """
+    Lifespan-managed asyncpg pool
+
+    - One pool per uvicorn worker (DB_POOL_MAX_SIZE x 4 workers total)
+    - Queries are prepared once per connection and reused via the
+      asyncpg statement cache (DB_STATEMENT_CACHE_SIZE)
+    - Tracks how long handlers wait for a free connection
+    - One dedicated LISTEN connection fans NOTIFY payloads out to callbacks
+    """
+
+    def __init__(self):
+        self.pool: asyncpg.Pool | None = None
+        self._channels: dict[str, list] = {}
+        self._listener_task: asyncio.Task | None = None
+        self._listener_conn: asyncpg.Connection | None = None
+        self.acquire_count = 0
+        self.acquire_timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def connect(self):
+        """Open the pool (called once at startup)"""
+        self.pool = await asyncpg.create_pool(
+            dsn=settings.database_url,
+            min_size=settings.DB_POOL_MIN_SIZE,
+            max_size=settings.DB_POOL_MAX_SIZE,
+            max_inactive_connection_lifetime=settings.DB_POOL_MAX_IDLE_SECONDS,
+            statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+            command_timeout=settings.DB_COMMAND_TIMEOUT,
+        )
+        logger.info(
+            f"Database pool ready (min={settings.DB_POOL_MIN_SIZE}, max={settings.DB_POOL_MAX_SIZE})"
+        )
+
+    async def close(self):
+        """Stop the listener and close the pool (called once at shutdown)"""
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Borrow a connection from the pool
+
+        Raises:
+            HTTPException: 503 if no connection frees up within DB_POOL_ACQUIRE_TIMEOUT
+        """
+        if self.pool is None:
+            raise RuntimeError("Database pool is not initialised")
+
+        started = time.perf_counter()
+        try:
+            conn = await self.pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            DB_POOL_ACQUIRE_TIMEOUTS.inc()
+            logger.warning("Database pool exhausted, acquire timed out")
+            raise HTTPException(status_code=503, detail="Database busy, please retry")
+
+        waited = time.perf_counter() - started
+        self.acquire_count += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        DB_POOL_ACQUIRE_SECONDS.observe(waited)
+        DB_POOL_SIZE.set(self.pool.get_size())
+        DB_POOL_IN_USE.inc()
+
+        try:
+            yield conn
+        finally:
+            DB_POOL_IN_USE.dec()
+            await self.pool.release(conn)
+
+    def listen(self, channel: str, callback):
+        """
+        Register an async callback(payload) for a NOTIFY channel
+
+        Callbacks are also invoked with payload=None every time the listener
+        (re)connects, since notifications sent while disconnected are lost.
+        """
+        self._channels.setdefault(channel, []).append(callback)
+
+    async def start_listener(self):
+        """Start the LISTEN connection supervisor (called once at startup)"""
+        if self._channels and self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._run_listener())
+
+    def _dispatch(self, channel: str, payload: str | None):
+        for callback in self._channels.get(channel, []):
+            task = asyncio.create_task(callback(payload))
+            task.add_done_callback(self._log_callback_error)
+
+    @staticmethod
+    def _log_callback_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"NOTIFY callback failed: {task.exception()}")
+
+    async def _run_listener(self):
+        backoff = 1.0
+        while True:
+            lost = asyncio.Event()
+            conn = None
+            try:
+                conn = await asyncpg.connect(dsn=settings.database_url)
+                conn.add_termination_listener(lambda _conn: lost.set())
+                for channel in self._channels:
+                    await conn.add_listener(
+                        channel,
+                        lambda _conn, _pid, ch, payload: self._dispatch(ch, payload),
+                    )
+                self._listener_conn = conn
+                logger.info(f"Listening on {', '.join(self._channels)}")
+                backoff = 1.0
+
+                for channel in self._channels:
+                    self._dispatch(channel, None)
+
+                await lost.wait()
+                logger.warning("LISTEN connection lost, reconnecting")
+            except asyncio.CancelledError:
+                if conn is not None:
+                    await conn.close()
+                self._listener_conn = None
+                raise
+            except Exception as e:
+                logger.error(f"LISTEN connection failed: {e}")
+                if conn is not None:
+                    conn.terminate()
+
+            self._listener_conn = None
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def stats(self) -> dict:
+        """Pool usage and acquire wait-time stats for this worker"""
+        size = self.pool.get_size() if self.pool else 0
+        idle = self.pool.get_idle_size() if self.pool else 0
+        return {
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "min_size": settings.DB_POOL_MIN_SIZE,
+            "max_size": settings.DB_POOL_MAX_SIZE,
+            "acquire_count": self.acquire_count,
+            "acquire_timeouts": self.acquire_timeouts,
+            "wait_ms_avg": round(1000 * self.wait_seconds_total / self.acquire_count, 3)
+            if self.acquire_count else 0.0,
+            "wait_ms_max": round(1000 * self.wait_seconds_max, 3),
+        }
+
+
+db = Database()
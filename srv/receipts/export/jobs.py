@@ -0,0 +1,175 @@
+"""
+Export Jobs
+Background T2125 exports for users with too many receipts for a synchronous download
+"""
+import asyncio
+import logging
+import os
+import uuid
+
+from config import settings
+from db import db
+from export.t2125 import write_workbook
+
+logger = logging.getLogger(__name__)
+
+# A 'pending' or 'running' job that has not heartbeated for this long died with its worker
+STALE_JOB_SECONDS = 300
+
+
+def export_dir(user_id: str) -> str:
+    return os.path.join(settings.UPLOAD_DIR, "exports", str(user_id))
+
+
+class ExportJobRunner:
+    """
+    In-process runner for receipts.export_jobs
+
+    - submit() records the job and returns at once; at most EXPORT_MAX_CONCURRENT
+      workbooks are built at a time in this process
+    - Status lives in Postgres so any uvicorn worker can answer status/download
+    - Queued jobs heartbeat updated_at while they wait for a slot, running jobs
+      after every cursor batch; get() reports either as failed once that stops
+    - Any failure after submit(), completion included, ends in 'failed'
+    - Finished files are kept EXPORT_RETENTION_HOURS, then prune() removes them
+    """
+
+    def __init__(self):
+        self._slots = asyncio.Semaphore(settings.EXPORT_MAX_CONCURRENT)
+        self._tasks: dict[uuid.UUID, asyncio.Task] = {}
+        self.completed = 0
+        self.failed = 0
+
+    async def submit(self, user_id: str, year: int | None, receipt_count: int) -> uuid.UUID:
+        """Queue an export and return its job_id"""
+        try:
+            await self.prune()
+        except Exception as e:
+            logger.warning(f"Export prune failed: {e}")
+
+        job_id = uuid.uuid4()
+        async with db.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO receipts.export_jobs (job_id, user_id, tax_year, receipt_count)
+                VALUES ($1, $2, $3, $4)
+            """, job_id, user_id, year, receipt_count)
+
+        task = asyncio.create_task(self._run(job_id, user_id, year))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return job_id
+
+    async def _run(self, job_id: uuid.UUID, user_id: str, year: int | None):
+        try:
+            await self._wait_for_slot(job_id)
+            try:
+                await self._build(job_id, user_id, year)
+            finally:
+                self._slots.release()
+        except asyncio.CancelledError:
+            await asyncio.shield(self._fail(job_id, "Interrupted by shutdown"))
+            raise
+        except Exception as e:
+            logger.error(f"Export job {job_id} failed: {e}", exc_info=True)
+            self.failed += 1
+            await self._fail(job_id, str(e)[:500])
+
+    async def _wait_for_slot(self, job_id: uuid.UUID):
+        # Heartbeat while queued, so a job waiting behind others is not reported dead
+        while True:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), STALE_JOB_SECONDS / 3)
+                return
+            except asyncio.TimeoutError:
+                await self._update(job_id, "pending")
+
+    async def _build(self, job_id: uuid.UUID, user_id: str, year: int | None):
+        await self._update(job_id, "running")
+        os.makedirs(export_dir(user_id), exist_ok=True)
+        dest_path = os.path.join(export_dir(user_id), f"{job_id}.xlsx")
+
+        async def heartbeat(rows_written: int):
+            await self._update(job_id, "running")
+
+        try:
+            async with db.acquire() as conn:
+                count = await write_workbook(conn, user_id, year, dest_path, on_batch=heartbeat)
+            async with db.acquire() as conn:
+                await conn.execute("""
+                    UPDATE receipts.export_jobs
+                    SET status = 'completed',
+                        receipt_count = $2,
+                        file_path = $3,
+                        file_size_bytes = $4,
+                        completed_at = NOW(),
+                        updated_at = NOW(),
+                        expires_at = NOW() + make_interval(hours => $5)
+                    WHERE job_id = $1
+                """, job_id, count, dest_path, os.path.getsize(dest_path), settings.EXPORT_RETENTION_HOURS)
+        except BaseException:
+            # No completed row points at it, so nothing would ever prune it
+            if os.path.exists(dest_path):
+                os.unlink(dest_path)
+            raise
+        self.completed += 1
+        logger.info(f"Export job {job_id} finished: {count} receipts")
+
+    async def _fail(self, job_id: uuid.UUID, error: str):
+        try:
+            await self._update(job_id, "failed", error=error)
+        except Exception as e:
+            # Its heartbeat stops too, so get() reports it failed once it is stale
+            logger.error(f"Could not mark export job {job_id} failed: {e}")
+
+    async def _update(self, job_id: uuid.UUID, status: str, error: str | None = None):
+        async with db.acquire() as conn:
+            await conn.execute("""
+                UPDATE receipts.export_jobs
+                SET status = $2, error = $3, updated_at = NOW()
+                WHERE job_id = $1
+            """, job_id, status, error)
+
+    async def get(self, job_id: uuid.UUID, user_id: str):
+        """Job row for this user, with dead 'pending' and 'running' jobs reported as failed"""
+        async with db.acquire() as conn:
+            return await conn.fetchrow("""
+                SELECT job_id, tax_year, receipt_count, file_path, file_size_bytes,
+                       created_at, completed_at, expires_at,
+                       CASE WHEN status IN ('pending', 'running') AND updated_at < NOW() - make_interval(secs => $3)
+                            THEN 'failed' ELSE status END AS status,
+                       CASE WHEN status IN ('pending', 'running') AND updated_at < NOW() - make_interval(secs => $3)
+                            THEN 'Export worker stopped' ELSE error END AS error
+                FROM receipts.export_jobs
+                WHERE job_id = $1 AND user_id = $2
+            """, job_id, user_id, STALE_JOB_SECONDS)
+
+    async def prune(self):
+        """Delete expired export files and their job rows"""
+        async with db.acquire() as conn:
+            rows = await conn.fetch("""
+                DELETE FROM receipts.export_jobs
+                WHERE expires_at < NOW()
+                   OR created_at < NOW() - make_interval(hours => $1)
+                RETURNING file_path
+            """, settings.EXPORT_RETENTION_HOURS * 2)
+        for row in rows:
+            if row["file_path"] and os.path.exists(row["file_path"]):
+                os.unlink(row["file_path"])
+
+    async def close(self):
+        """Cancel in-flight jobs (marked failed; users can re-request)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """Export job counters for this process"""
+        return {
+            "running": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+export_jobs = ExportJobRunner()
@@ -0,0 +1,158 @@
+"""
+T2125 Workbook Builder
+Write-only openpyxl workbook fed from a server-side cursor (constant memory)
+"""
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+import asyncio
+import os
+
+from config import settings
+
+SUMMARY_HEADERS = ["T2125 Line", "Categories", "Receipts", "Total", "Tax", "Deductible"]
+DETAIL_HEADERS = [
+    "Date", "Vendor", "Category", "T2125 Line", "Total", "Tax",
+    "Currency", "Status", "Filename", "Receipt ID",
+]
+MONEY_FORMAT = "#,##0.00"
+
+# Per-line totals; meals and entertainment are 50% deductible (ITA s. 67.1)
+SUMMARY_SQL = """
+    SELECT COALESCE(c.cra_line_number, 'Uncategorized') AS line,
+           string_agg(DISTINCT c.category_name, ', ') AS categories,
+           COUNT(*) AS receipts,
+           COALESCE(SUM(r.total_amount), 0) AS total,
+           COALESCE(SUM(r.tax_amount), 0) AS tax,
+           COALESCE(SUM(CASE WHEN c.category_code = 'MEALS' THEN r.total_amount * 0.5
+                             ELSE r.total_amount END), 0)::NUMERIC(12,2) AS deductible
+    FROM receipts.receipts r
+    LEFT JOIN receipts.categories c ON c.category_id = r.category_id
+    WHERE {where}
+    GROUP BY c.cra_line_number
+    ORDER BY c.cra_line_number NULLS LAST
+"""
+
+# Same lines for one tax year from the trigger-maintained receipts.t2125_summary
+YEAR_SUMMARY_SQL = """
+    SELECT COALESCE(c.cra_line_number, 'Uncategorized') AS line,
+           string_agg(DISTINCT c.category_name, ', ') AS categories,
+           SUM(s.receipt_count)::INTEGER AS receipts,
+           SUM(s.total_amount) AS total,
+           SUM(s.tax_amount) AS tax,
+           SUM(CASE WHEN c.category_code = 'MEALS' THEN s.total_amount * 0.5
+                    ELSE s.total_amount END)::NUMERIC(12,2) AS deductible
+    FROM receipts.t2125_summary s
+    LEFT JOIN receipts.categories c ON c.category_id = s.category_id
+    WHERE s.user_id = $1 AND s.tax_year = $2 AND s.receipt_count <> 0
+    GROUP BY c.cra_line_number
+    ORDER BY c.cra_line_number NULLS LAST
+"""
+
+DETAIL_SQL = """
+    SELECT r.transaction_date, r.vendor_name, c.category_name, c.cra_line_number,
+           r.total_amount, r.tax_amount, r.currency, r.extraction_status,
+           r.original_filename, r.receipt_id::text
+    FROM receipts.receipts r
+    LEFT JOIN receipts.categories c ON c.category_id = r.category_id
+    WHERE {where}
+    ORDER BY r.transaction_date NULLS LAST, r.uploaded_at, r.receipt_id
+"""
+
+
+def export_filter(user_id: str, year: int | None) -> tuple[str, list]:
+    """WHERE clause shared by the count, summary and detail queries"""
+    if year is None:
+        return "r.user_id = $1 AND r.deleted_at IS NULL", [user_id]
+    return (
+        "r.user_id = $1 AND r.deleted_at IS NULL"
+        " AND r.transaction_date >= make_date($2, 1, 1) AND r.transaction_date < make_date($2 + 1, 1, 1)",
+        [user_id, year],
+    )
+
+
+async def count_receipts(conn, user_id: str, year: int | None) -> int:
+    where, args = export_filter(user_id, year)
+    return await conn.fetchval(f"SELECT COUNT(*) FROM receipts.receipts r WHERE {where}", *args)
+
+
+async def fetch_summary(conn, user_id: str, year: int | None):
+    """T2125 lines: an indexed lookup for one year, an aggregate over receipts for all years"""
+    if year is not None:
+        return await conn.fetch(YEAR_SUMMARY_SQL, user_id, year)
+    where, args = export_filter(user_id, year)
+    return await conn.fetch(SUMMARY_SQL.format(where=where), *args)
+
+
+def _header(ws, headers: list[str]):
+    bold = Font(bold=True)
+    cells = []
+    for title in headers:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = bold
+        cells.append(cell)
+    ws.append(cells)
+
+
+def _money(ws, value):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.number_format = MONEY_FORMAT
+    return cell
+
+
+def _append_summary(ws, rows):
+    for row in rows:
+        ws.append([
+            row["line"], row["categories"] or "", row["receipts"],
+            _money(ws, row["total"]), _money(ws, row["tax"]), _money(ws, row["deductible"]),
+        ])
+
+
+def _append_details(ws, rows):
+    for row in rows:
+        row = list(row)
+        row[4] = _money(ws, row[4])
+        row[5] = _money(ws, row[5])
+        ws.append(row)
+
+
+async def write_workbook(conn, user_id: str, year: int | None, dest_path: str, on_batch=None) -> int:
+    """
+    Build the T2125 workbook at dest_path and return the receipt count
+
+    Rows are pulled RECEIPTS_STREAM_PREFETCH at a time from a server-side
+    cursor and appended off the event loop. Write-only worksheets spool their
+    XML to disk, so memory stays flat however many receipts the user has.
+    on_batch(rows_written) is awaited after each batch (job heartbeats).
+    """
+    where, args = export_filter(user_id, year)
+    wb = Workbook(write_only=True)
+    summary = wb.create_sheet("T2125 Summary")
+    details = wb.create_sheet("Receipts")
+    summary.column_dimensions["B"].width = 40
+    details.column_dimensions["B"].width = 32
+    details.column_dimensions["I"].width = 32
+    details.column_dimensions["J"].width = 38
+
+    summary_rows = await fetch_summary(conn, user_id, year)
+    _header(summary, SUMMARY_HEADERS)
+    _append_summary(summary, summary_rows)
+
+    _header(details, DETAIL_HEADERS)
+    written = 0
+    async with conn.transaction(readonly=True):
+        cursor = await conn.cursor(DETAIL_SQL.format(where=where), *args)
+        while batch := await cursor.fetch(settings.RECEIPTS_STREAM_PREFETCH):
+            await asyncio.to_thread(_append_details, details, batch)
+            written += len(batch)
+            if on_batch is not None:
+                await on_batch(written)
+
+    tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+    try:
+        await asyncio.to_thread(wb.save, tmp_path)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return written
@@ -0,0 +1,112 @@
+"""
+Password Hashing Module
+Runs bcrypt on a bounded worker pool so hashing never blocks the event loop
+"""
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+import asyncio
+import bcrypt
+import logging
+import time
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasher:
+    """
+    Bounded bcrypt worker pool
+
+    - bcrypt releases the GIL, so a thread pool gives real parallelism
+    - At most BCRYPT_WORKERS hashes run at once per uvicorn worker
+    - Beyond BCRYPT_MAX_PENDING queued calls new requests get a 503
+    - Tracks time spent waiting for a worker and time spent hashing
+    """
+
+    def __init__(self):
+        self._executor: ThreadPoolExecutor | None = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.queue_seconds_total = 0.0
+        self.queue_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+
+    def start(self):
+        """Create the worker pool (called once at startup)"""
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.BCRYPT_WORKERS,
+            thread_name_prefix="bcrypt",
+        )
+
+    def close(self):
+        """Shut down the worker pool (called once at shutdown)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def _run(self, fn, *args):
+        if self._executor is None:
+            raise RuntimeError("Password hasher is not started")
+        if self.pending >= settings.BCRYPT_MAX_PENDING:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Authentication service busy, please retry")
+
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            result = fn(*args)
+            return result, started - submitted, time.perf_counter() - started
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, queued, ran = await loop.run_in_executor(self._executor, timed)
+        finally:
+            self.pending -= 1
+
+        self.completed += 1
+        self.queue_seconds_total += queued
+        self.queue_seconds_max = max(self.queue_seconds_max, queued)
+        self.run_seconds_total += ran
+        return result
+
+    async def hash(self, password: str) -> str:
+        """Hash a password with the configured cost factor"""
+        salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
+        hashed = await self._run(bcrypt.hashpw, password.encode(), salt)
+        return hashed.decode()
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        """Check a password against a stored bcrypt hash"""
+        return await self._run(bcrypt.checkpw, password.encode(), password_hash.encode())
+
+    @staticmethod
+    def needs_rehash(password_hash: str) -> bool:
+        """True if the stored hash was made with a different cost factor"""
+        try:
+            return int(password_hash.split("$")[2]) != settings.BCRYPT_ROUNDS
+        except (IndexError, ValueError):
+            return True
+
+    def stats(self) -> dict:
+        """Queue and hashing time stats for this worker"""
+        return {
+            "workers": settings.BCRYPT_WORKERS,
+            "rounds": settings.BCRYPT_ROUNDS,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "queue_ms_avg": round(1000 * self.queue_seconds_total / self.completed, 3)
+            if self.completed else 0.0,
+            "queue_ms_max": round(1000 * self.queue_seconds_max, 3),
+            "hash_ms_avg": round(1000 * self.run_seconds_total / self.completed, 3)
+            if self.completed else 0.0,
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,214 @@
+"""
+Expired Receipt Purge
+Soft-deletes expired free-tier receipts in small batches and unlinks their files
+(the upload and its .derived/ pre-processing cache entries)
+
+Run daily (resumes an interrupted run from its checkpoint):
+    python -m jobs.purge_expired
+"""
+from datetime import datetime
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from ai.preprocess import image_preprocessor
+from config import settings
+from db import db
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "purge_expired"
+
+# One bounded batch, oldest expiry first, keyset on idx_receipts_expires_at
+PURGE_BATCH_SQL = """
+    WITH batch AS (
+        SELECT r.receipt_id
+        FROM receipts.receipts r
+        WHERE r.deleted_at IS NULL
+          AND r.expires_at < $1
+          {after}
+          AND EXISTS (
+              SELECT 1 FROM receipts.users u
+              WHERE u.user_id = r.user_id AND u.subscription_tier = 'free'
+          )
+        ORDER BY r.expires_at, r.receipt_id
+        LIMIT $2
+        FOR UPDATE OF r SKIP LOCKED
+    )
+    UPDATE receipts.receipts r
+    SET deleted_at = NOW(), updated_at = NOW()
+    FROM batch
+    WHERE r.receipt_id = batch.receipt_id
+    RETURNING r.receipt_id, r.expires_at, r.storage_path, r.file_hash
+"""
+
+
+class FileUnlinker:
+    """Concurrent unlinks capped at PURGE_UNLINK_CONCURRENCY and PURGE_UNLINK_RATE per second"""
+
+    def __init__(self):
+        self._slots = asyncio.Semaphore(settings.PURGE_UNLINK_CONCURRENCY)
+        self._interval = 1.0 / settings.PURGE_UNLINK_RATE
+        self._next_at = time.monotonic()
+        self.unlinked = 0
+        self.missing = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    async def unlink_all(self, paths: list[str]):
+        started = time.perf_counter()
+        await asyncio.gather(*(self._unlink(path) for path in paths))
+        self.seconds += time.perf_counter() - started
+
+    async def _unlink(self, path: str):
+        # Pace starts evenly so a large backlog cannot saturate the upload volume
+        now = time.monotonic()
+        wait, self._next_at = self._next_at - now, max(self._next_at, now) + self._interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        upload_root = os.path.realpath(settings.UPLOAD_DIR)
+        if os.path.commonpath([upload_root, os.path.realpath(path)]) != upload_root:
+            logger.error(f"Refusing to unlink {path}: outside UPLOAD_DIR")
+            self.errors += 1
+            return
+
+        async with self._slots:
+            try:
+                await asyncio.to_thread(os.unlink, path)
+                self.unlinked += 1
+            except FileNotFoundError:
+                self.missing += 1
+            except OSError as e:
+                logger.warning(f"Could not unlink {path}: {e}")
+                self.errors += 1
+
+
+async def load_checkpoint(conn) -> dict | None:
+    """Position of an unfinished run, or None to start a new one"""
+    row = await conn.fetchrow("""
+        SELECT position::text
+        FROM receipts.job_checkpoints
+        WHERE job_name = $1
+          AND run_started_at IS NOT NULL
+          AND (run_finished_at IS NULL OR run_finished_at < run_started_at)
+    """, JOB_NAME)
+    return json.loads(row["position"]) if row and row["position"] else None
+
+
+async def save_checkpoint(conn, position: dict, started: bool = False):
+    await conn.execute("""
+        INSERT INTO receipts.job_checkpoints (job_name, position, run_started_at, updated_at)
+        VALUES ($1, $2::jsonb, NOW(), NOW())
+        ON CONFLICT (job_name) DO UPDATE
+        SET position = EXCLUDED.position,
+            run_started_at = CASE WHEN $3 THEN NOW() ELSE receipts.job_checkpoints.run_started_at END,
+            updated_at = NOW()
+    """, JOB_NAME, json.dumps(position), started)
+
+
+async def purge(batch_size: int = settings.PURGE_BATCH_SIZE) -> dict:
+    """
+    Purge expired receipts, resuming a previous run if it did not finish
+
+    Each batch soft-deletes at most batch_size rows and records the keyset
+    position plus that batch's file paths in the same short transaction.
+    Files are unlinked after commit; a crash in between leaves the paths in
+    the checkpoint, so the next run unlinks them before moving on.
+    """
+    started = time.perf_counter()
+    unlinker = FileUnlinker()
+    batches = purged = 0
+    db_seconds = 0.0
+
+    async with db.acquire() as conn:
+        position = await load_checkpoint(conn)
+        if position is None:
+            cutoff = await conn.fetchval("SELECT NOW()")
+            position = {"cutoff": cutoff.isoformat(), "expires_at": None, "receipt_id": None, "pending_paths": []}
+            await save_checkpoint(conn, position, started=True)
+        else:
+            logger.info(f"Resuming purge from {position['expires_at']} / {position['receipt_id']}")
+
+    cutoff = datetime.fromisoformat(position["cutoff"])
+    if position["pending_paths"]:
+        await unlinker.unlink_all(position["pending_paths"])
+
+    while True:
+        if position["expires_at"]:
+            query = PURGE_BATCH_SQL.format(after="AND (r.expires_at, r.receipt_id) > ($3, $4)")
+            args = [cutoff, batch_size, datetime.fromisoformat(position["expires_at"]), position["receipt_id"]]
+        else:
+            query = PURGE_BATCH_SQL.format(after="")
+            args = [cutoff, batch_size]
+
+        batch_started = time.perf_counter()
+        async with db.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(query, *args)
+                if rows:
+                    last = max(rows, key=lambda r: (r["expires_at"], str(r["receipt_id"])))
+                    position = {
+                        "cutoff": position["cutoff"],
+                        "expires_at": last["expires_at"].isoformat(),
+                        "receipt_id": str(last["receipt_id"]),
+                        # Source files plus their pre-processed derivatives
+                        "pending_paths": [r["storage_path"] for r in rows] + [
+                            path for r in rows if r["file_hash"]
+                            for path in image_preprocessor.derived_files(r["file_hash"])
+                        ],
+                    }
+                    await save_checkpoint(conn, position)
+        db_seconds += time.perf_counter() - batch_started
+
+        if not rows:
+            break
+        batches += 1
+        purged += len(rows)
+
+        await unlinker.unlink_all(position["pending_paths"])
+        position["pending_paths"] = []
+        async with db.acquire() as conn:
+            await save_checkpoint(conn, position)
+
+        logger.info(f"Purge batch {batches}: {len(rows)} receipts ({purged} total)")
+        await asyncio.sleep(settings.PURGE_BATCH_PAUSE_SECONDS)  # Leave room for uploads between batches
+
+    stats = {
+        "batches": batches,
+        "receipts_purged": purged,
+        "files_unlinked": unlinker.unlinked,
+        "files_missing": unlinker.missing,
+        "unlink_errors": unlinker.errors,
+        "db_seconds": round(db_seconds, 2),
+        "unlink_seconds": round(unlinker.seconds, 2),
+        "total_seconds": round(time.perf_counter() - started, 2),
+    }
+    async with db.acquire() as conn:
+        await conn.execute("""
+            UPDATE receipts.job_checkpoints
+            SET run_finished_at = NOW(), last_run_stats = $2::jsonb, updated_at = NOW()
+            WHERE job_name = $1
+        """, JOB_NAME, json.dumps(stats))
+    return stats
+
+
+async def main():
+    logging.basicConfig(
+        level=getattr(logging, settings.LOG_LEVEL),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    await db.connect()
+    try:
+        stats = await purge()
+    finally:
+        await db.close()
+    logger.info(f"Purge finished: {json.dumps(stats)}")
+    return 1 if stats["unlink_errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
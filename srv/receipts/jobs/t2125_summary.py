@@ -0,0 +1,121 @@
+"""
+T2125 Summary Maintenance
+Rebuilds or verifies receipts.t2125_summary against receipts.receipts
+
+Usage:
+    python -m jobs.t2125_summary verify [--user UUID]
+    python -m jobs.t2125_summary rebuild [--user UUID]
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+from config import settings
+from db import db
+
+logger = logging.getLogger(__name__)
+
+# What the triggers maintain, computed from scratch
+SOURCE_SQL = """
+    SELECT user_id,
+           EXTRACT(YEAR FROM transaction_date)::INTEGER AS tax_year,
+           category_id,
+           COUNT(*)::INTEGER AS receipt_count,
+           COALESCE(SUM(total_amount), 0)::NUMERIC(14,2) AS total_amount,
+           COALESCE(SUM(tax_amount), 0)::NUMERIC(14,2) AS tax_amount
+    FROM receipts.receipts
+    WHERE deleted_at IS NULL
+      AND transaction_date IS NOT NULL
+      AND ($1::uuid IS NULL OR user_id = $1)
+    GROUP BY user_id, EXTRACT(YEAR FROM transaction_date), category_id
+"""
+
+# Rows where the maintained table and the source disagree (zero-count rows are equivalent to absent)
+DIFF_SQL = f"""
+    WITH source AS ({SOURCE_SQL}),
+    maintained AS (
+        SELECT user_id, tax_year, category_id, receipt_count, total_amount, tax_amount
+        FROM receipts.t2125_summary
+        WHERE receipt_count <> 0 AND ($1::uuid IS NULL OR user_id = $1)
+    )
+    SELECT COALESCE(s.user_id, m.user_id) AS user_id,
+           COALESCE(s.tax_year, m.tax_year) AS tax_year,
+           COALESCE(s.category_id, m.category_id) AS category_id,
+           s.receipt_count AS expected_count, m.receipt_count AS actual_count,
+           s.total_amount AS expected_total, m.total_amount AS actual_total,
+           s.tax_amount AS expected_tax, m.tax_amount AS actual_tax
+    FROM source s
+    FULL OUTER JOIN maintained m
+      ON m.user_id = s.user_id
+     AND m.tax_year = s.tax_year
+     AND m.category_id IS NOT DISTINCT FROM s.category_id
+    WHERE (s.receipt_count, s.total_amount, s.tax_amount)
+          IS DISTINCT FROM (m.receipt_count, m.total_amount, m.tax_amount)
+"""
+
+
+async def verify(user_id: str | None) -> int:
+    """Log every mismatching row and return how many there were"""
+    async with db.acquire() as conn:
+        rows = await conn.fetch(DIFF_SQL, user_id)
+    for row in rows:
+        logger.warning(
+            f"Mismatch user={row['user_id']} year={row['tax_year']} category={row['category_id']}: "
+            f"count {row['actual_count']} != {row['expected_count']}, "
+            f"total {row['actual_total']} != {row['expected_total']}, "
+            f"tax {row['actual_tax']} != {row['expected_tax']}"
+        )
+    return len(rows)
+
+
+async def rebuild(user_id: str | None) -> int:
+    """
+    Replace summary rows with freshly aggregated ones and return the row count
+
+    The SHARE ROW EXCLUSIVE lock waits for in-flight trigger writes to commit and
+    holds new ones back until the rebuild commits, so no change is lost or
+    counted twice. Receipt writes that touch totals stall for the rebuild.
+    """
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("LOCK TABLE receipts.t2125_summary IN SHARE ROW EXCLUSIVE MODE")
+            await conn.execute("""
+                DELETE FROM receipts.t2125_summary
+                WHERE $1::uuid IS NULL OR user_id = $1
+            """, user_id)
+            status = await conn.execute(f"""
+                INSERT INTO receipts.t2125_summary
+                    (user_id, tax_year, category_id, receipt_count, total_amount, tax_amount)
+                {SOURCE_SQL}
+            """, user_id)
+    return int(status.split()[-1])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Rebuild or verify receipts.t2125_summary")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    parser.add_argument("--user", help="Limit to one user_id")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=getattr(logging, settings.LOG_LEVEL),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    await db.connect()
+    started = time.perf_counter()
+    try:
+        if args.command == "rebuild":
+            rows = await rebuild(args.user)
+            logger.info(f"Rebuilt {rows} summary rows in {time.perf_counter() - started:.1f}s")
+            return 0
+        mismatches = await verify(args.user)
+        logger.info(f"Verified in {time.perf_counter() - started:.1f}s: {mismatches} mismatching rows")
+        return 1 if mismatches else 0
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
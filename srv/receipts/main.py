@@ -2,14 +2,30 @@
 Expense Empire SaaS v1 — FastAPI Main Application
 Phoenix Battlestack Revenue Spore #1
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import logging
 
 from config import settings
+from ai.extraction_cache import extraction_cache
+from ai.ollama import ollama_client
+from ai.preprocess import image_preprocessor
+from ai.vendors import VENDOR_ALIASES_CHANNEL, vendor_index
+from ai.worker import extraction_workers
+from cache import close_redis
+from db import db
+from export.jobs import export_jobs
+from hashing import password_hasher
+from metrics import metrics_sampler, render as render_metrics
+from quota import upload_quota
 from api import auth, receipts, categories, export
-from middleware.audit_log import audit_middleware
+from api.categories import CATEGORIES_CHANNEL, category_catalogue
+from middleware.audit_log import audit_middleware, audit_writer
+from middleware.jwt_auth import token_cache
+from middleware.metrics import metrics_middleware
+from middleware.rate_limit import rate_limit_middleware, rate_limiter
 
 # Configure logging
 logging.basicConfig(
@@ -18,13 +34,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup, release them on shutdown"""
+    await db.connect()
+    db.listen(CATEGORIES_CHANNEL, category_catalogue.reload)
+    db.listen(VENDOR_ALIASES_CHANNEL, vendor_index.reload)
+    await db.start_listener()
+    await audit_writer.start()
+    password_hasher.start()
+    await extraction_workers.start()
+    await upload_quota.start()
+    metrics_sampler.add(extraction_workers.sample_queue_depth)
+    await metrics_sampler.start()
+    yield
+    await metrics_sampler.close()
+    await export_jobs.close()
+    await upload_quota.close()
+    await extraction_workers.close()
+    password_hasher.close()
+    await audit_writer.close()
+    await close_redis()
+    await db.close()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Expense Empire",
     description="AI-powered receipt processing for Canadian business owners",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # CORS middleware (localhost only in Phase 1)
@@ -36,11 +78,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Rate limiting middleware (inside audit logging, so 429s are audited too)
+@app.middleware("http")
+async def rate_limit_check_middleware(request: Request, call_next):
+    return await rate_limit_middleware(request, call_next)
+
 # Audit logging middleware
 @app.middleware("http")
 async def audit_log_middleware(request: Request, call_next):
     return await audit_middleware(request, call_next)
 
+# Metrics middleware (registered last, so it is outermost and times everything above)
+@app.middleware("http")
+async def request_metrics_middleware(request: Request, call_next):
+    return await metrics_middleware(request, call_next)
+
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(receipts.router, prefix="/api/receipts", tags=["Receipts"])
@@ -51,7 +103,29 @@ app.include_router(export.router, prefix="/api/export", tags=["Export"])
 @app.get("/health")
 async def health_check():
     """Health check endpoint for Docker healthcheck"""
-    return {"status": "healthy", "service": "expense_empire"}
+    return {
+        "status": "healthy",
+        "service": "expense_empire",
+        "db_pool": db.stats(),
+        "audit_queue": audit_writer.stats(),
+        "password_hasher": password_hasher.stats(),
+        "jwt_cache": token_cache.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "extraction_workers": extraction_workers.stats(),
+        "image_preprocessor": image_preprocessor.stats(),
+        "extraction_cache": extraction_cache.stats(),
+        "ollama": ollama_client.stats(),
+        "export_jobs": export_jobs.stats(),
+        "vendor_index": vendor_index.stats(),
+        "upload_quota": upload_quota.stats()
+    }
+
+# Prometheus scrape endpoint (aggregates all uvicorn workers)
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus exposition format"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 # Root endpoint
 @app.get("/")
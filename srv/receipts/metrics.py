@@ -0,0 +1,141 @@
+"""
+Prometheus Metrics
+Service metrics aggregated across uvicorn workers via prometheus_client multiprocess mode
+"""
+from contextlib import asynccontextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+import asyncio
+import logging
+import os
+import time
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Set in the Dockerfile; each worker writes its samples to files in this directory
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+OLLAMA_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "receipts_http_request_duration_seconds", "Request latency by route template",
+    ["method", "route", "status"], buckets=HTTP_BUCKETS,
+)
+HTTP_IN_PROGRESS = Gauge(
+    "receipts_http_requests_in_progress", "Requests currently being handled",
+    ["method"], multiprocess_mode="livesum",
+)
+
+DB_POOL_ACQUIRE_SECONDS = Histogram(
+    "receipts_db_pool_acquire_wait_seconds", "Time spent waiting for a pooled connection",
+    buckets=FAST_BUCKETS,
+)
+DB_POOL_ACQUIRE_TIMEOUTS = Counter(
+    "receipts_db_pool_acquire_timeouts", "Acquires that gave up after DB_POOL_ACQUIRE_TIMEOUT",
+)
+DB_POOL_IN_USE = Gauge(
+    "receipts_db_pool_connections_in_use", "Connections checked out of the pool",
+    multiprocess_mode="livesum",
+)
+DB_POOL_SIZE = Gauge(
+    "receipts_db_pool_connections", "Connections currently open in the pool",
+    multiprocess_mode="livesum",
+)
+
+REDIS_COMMAND_SECONDS = Histogram(
+    "receipts_redis_command_duration_seconds", "Redis round trips by caller",
+    ["operation", "outcome"], buckets=FAST_BUCKETS,
+)
+OLLAMA_REQUEST_SECONDS = Histogram(
+    "receipts_ollama_request_duration_seconds", "Ollama /api/generate calls (excluding slot wait)",
+    ["model", "outcome"], buckets=OLLAMA_BUCKETS,
+)
+
+EXTRACTION_QUEUE_DEPTH = Gauge(
+    "receipts_extraction_queue_depth", "Receipts waiting for or undergoing extraction",
+    ["status"], multiprocess_mode="livemax",
+)
+EXTRACTIONS = Counter(
+    "receipts_extractions", "Finished extraction attempts by outcome", ["outcome"],
+)
+
+AUDIT_QUEUE_DEPTH = Gauge(
+    "receipts_audit_queue_depth", "Audit rows queued in memory",
+    multiprocess_mode="livesum",
+)
+AUDIT_FLUSH_LAG_SECONDS = Histogram(
+    "receipts_audit_flush_lag_seconds", "Age of the oldest row in each flushed audit batch",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+AUDIT_ROWS_SPILLED = Counter(
+    "receipts_audit_rows_spilled", "Audit rows written to the disk spill instead of Postgres",
+)
+
+
+@asynccontextmanager
+async def observe_redis(operation: str):
+    """Time one Redis call; outcome is 'ok' or 'error'"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        REDIS_COMMAND_SECONDS.labels(operation, outcome).observe(time.perf_counter() - started)
+
+
+def render() -> tuple[bytes, str]:
+    """Exposition for /metrics: every live worker's samples when running multiprocess"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricsSampler:
+    """
+    Periodic probes for values that are not event-driven (queue depths read from Postgres)
+
+    - Probes are async callables registered with add() before start()
+    - Runs every METRICS_SAMPLE_SECONDS; a failing probe is logged and skipped
+    - close() marks this worker dead so its live* gauges drop out of /metrics
+    """
+
+    def __init__(self):
+        self._probes = []
+        self._task: asyncio.Task | None = None
+
+    def add(self, probe):
+        self._probes.append(probe)
+
+    async def start(self):
+        if self._task is None and self._probes:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if MULTIPROC_DIR:
+            multiprocess.mark_process_dead(os.getpid())
+
+    async def _run(self):
+        while True:
+            for probe in self._probes:
+                try:
+                    await probe()
+                except Exception as e:
+                    logger.warning(f"Metrics probe {getattr(probe, '__qualname__', probe)} failed: {e}")
+            await asyncio.sleep(settings.METRICS_SAMPLE_SECONDS)
+
+
+metrics_sampler = MetricsSampler()
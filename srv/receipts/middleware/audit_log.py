@@ -2,71 +2,320 @@
 Audit Log Middleware
 Logs all API requests to the database for forensics and compliance
 """
-import psycopg2
-from fastapi import Request, Response
-from datetime import datetime
+from fastapi import Request
+from datetime import datetime, timezone
+import asyncio
+import asyncpg
+import ipaddress
 import logging
 import json
+import os
+import time
 
 from config import settings
+from db import db
+from metrics import AUDIT_FLUSH_LAG_SECONDS, AUDIT_QUEUE_DEPTH, AUDIT_ROWS_SPILLED
+from middleware.jwt_auth import authenticate_request
 
 logger = logging.getLogger(__name__)
 
+AUDIT_COLUMNS = ("user_id", "action", "resource_type", "ip_address", "user_agent", "metadata", "created_at")
+
+# Rejected for what is in the rows, not for reaching Postgres: retrying cannot succeed.
+# asyncpg's DataError also covers client-side encoding failures.
+DATA_ERRORS = (
+    asyncpg.exceptions.DataError,
+    asyncpg.exceptions.IntegrityConstraintViolationError,
+    UnicodeError,
+    ValueError,
+    TypeError,
+)
+
+
+class AuditLogWriter:
+    """
+    In-process audit queue with batched COPY flushes
+
+    - submit() returns as soon as the row is queued
+    - Rows are flushed with COPY every AUDIT_BATCH_SIZE rows or AUDIT_FLUSH_INTERVAL seconds
+    - A full queue applies backpressure for at most AUDIT_ENQUEUE_TIMEOUT seconds
+    - Rows that cannot reach Postgres are spilled to AUDIT_SPILL_DIR and replayed later
+    - Rows Postgres rejects as bad data (found by bisecting the batch) and spill
+      lines that do not decode go to a .quarantine file there instead, never replayed
+    """
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.AUDIT_QUEUE_MAX)
+        self._task: asyncio.Task | None = None
+        self._stopping = asyncio.Event()
+        self._spill_path = os.path.join(settings.AUDIT_SPILL_DIR, f"audit-{os.getpid()}.jsonl")
+        self._quarantine_path = os.path.join(settings.AUDIT_SPILL_DIR, f"audit-{os.getpid()}.quarantine")
+        self._last_replay_attempt = 0.0
+        self.rows_written = 0
+        self.rows_spilled = 0
+        self.rows_replayed = 0
+        self.rows_quarantined = 0
+        self.flush_failures = 0
+        self.last_flush_ms = 0.0
+
+    async def start(self):
+        """Start the background flusher (called once at startup)"""
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Drain the queue and stop the flusher (called once at shutdown)"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def submit(self, record: tuple):
+        """Queue one audit row, spilling to disk if the queue stays full"""
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self.queue.put(record), settings.AUDIT_ENQUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("Audit queue full, spilling row to disk")
+                await asyncio.to_thread(self._spill, [record])
+                AUDIT_ROWS_SPILLED.inc()
+        AUDIT_QUEUE_DEPTH.set(self.queue.qsize())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not (self._stopping.is_set() and self.queue.empty()):
+            batch = []
+            deadline = loop.time() + settings.AUDIT_FLUSH_INTERVAL
+            while len(batch) < settings.AUDIT_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                if self._stopping.is_set() and self.queue.empty():
+                    break
+
+            AUDIT_QUEUE_DEPTH.set(self.queue.qsize())
+            if batch and await self._flush(batch):
+                try:
+                    await self._replay_spilled()
+                except Exception as e:
+                    # Never let a replay problem stop the flusher
+                    logger.error(f"Audit spill replay failed: {e}", exc_info=True)
+
+    async def _copy(self, records: list[tuple]):
+        async with db.acquire() as conn:
+            await conn.copy_records_to_table(
+                "audit_log",
+                schema_name="receipts",
+                columns=AUDIT_COLUMNS,
+                records=records,
+            )
+
+    async def _write(self, records: list[tuple]) -> tuple[int, Exception | None]:
+        """
+        COPY records in order, quarantining rows rejected as bad data
+
+        A data error splits the chunk in halves until the offending rows are
+        isolated. Returns (rows written or quarantined, the connection-type error
+        that stopped the write, if any); the caller spills what is left.
+        """
+        try:
+            await self._copy(records)
+            return len(records), None
+        except DATA_ERRORS as e:
+            if len(records) == 1:
+                logger.error(f"Audit row rejected, quarantined: {e}")
+                await asyncio.to_thread(self._quarantine, [_encode(records[0])])
+                return 1, None
+            half = len(records) // 2
+            done, error = await self._write(records[:half])
+            if error is not None:
+                return done, error
+            more, error = await self._write(records[half:])
+            return done + more, error
+        except Exception as e:
+            return 0, e
+
+    async def _flush(self, batch: list[tuple]) -> bool:
+        started = time.perf_counter()
+        quarantined = self.rows_quarantined
+        done, error = await self._write(batch)
+        if error is not None:
+            self.flush_failures += 1
+            logger.error(f"Audit flush failed, spilling {len(batch) - done} rows: {error}")
+            await asyncio.to_thread(self._spill, batch[done:])
+            AUDIT_ROWS_SPILLED.inc(len(batch) - done)
+            return False
+
+        # created_at is stamped at submit, so the oldest row shows how far the log trails requests
+        AUDIT_FLUSH_LAG_SECONDS.observe((datetime.now(timezone.utc) - min(r[6] for r in batch)).total_seconds())
+        self.rows_written += len(batch) - (self.rows_quarantined - quarantined)
+        self.last_flush_ms = round(1000 * (time.perf_counter() - started), 3)
+        return True
+
+    def _spill(self, records: list[tuple]):
+        try:
+            os.makedirs(settings.AUDIT_SPILL_DIR, exist_ok=True)
+            with open(self._spill_path, "a") as f:
+                for record in records:
+                    f.write(_encode(record) + "\n")
+            self.rows_spilled += len(records)
+        except OSError as e:
+            logger.error(f"Audit spill failed, {len(records)} rows lost: {e}")
+
+    def _quarantine(self, lines: list[str]):
+        try:
+            os.makedirs(settings.AUDIT_SPILL_DIR, exist_ok=True)
+            with open(self._quarantine_path, "a") as f:
+                for line in lines:
+                    f.write(line.rstrip("\n") + "\n")
+            self.rows_quarantined += len(lines)
+        except OSError as e:
+            logger.error(f"Audit quarantine failed, {len(lines)} rows lost: {e}")
+
+    def _claim_spilled(self) -> list[tuple[str, list[tuple]]]:
+        """
+        Claim every spill file (any worker's) and decode it; undecodable lines are quarantined
+
+        Returns (claimed path, records) per file; the caller removes each file once replayed.
+        """
+        try:
+            names = sorted(n for n in os.listdir(settings.AUDIT_SPILL_DIR) if n.endswith(".jsonl"))
+        except FileNotFoundError:
+            return []
+
+        claimed_files = []
+        for name in names:
+            path = os.path.join(settings.AUDIT_SPILL_DIR, name)
+            claimed = f"{path}.{os.getpid()}.replay"
+            try:
+                os.rename(path, claimed)  # Another worker may have claimed it first
+            except FileNotFoundError:
+                continue
+
+            records, bad = [], []
+            with open(claimed, errors="replace") as f:
+                for line in f:
+                    try:
+                        records.append(_decode(line))
+                    except (ValueError, TypeError, IndexError, AttributeError) as e:
+                        logger.error(f"Undecodable audit spill line in {name}, quarantined: {e}")
+                        bad.append(line)
+            if bad:
+                self._quarantine(bad)
+            claimed_files.append((claimed, records))
+        return claimed_files
+
+    async def _replay_spilled(self):
+        """Re-insert rows spilled by any worker once Postgres is reachable again"""
+        now = time.monotonic()
+        if now - self._last_replay_attempt < settings.AUDIT_SPILL_RETRY_SECONDS:
+            return
+        self._last_replay_attempt = now
+
+        claimed_files = await asyncio.to_thread(self._claim_spilled)
+        for i, (claimed, records) in enumerate(claimed_files):
+            done = 0
+            while done < len(records):
+                quarantined = self.rows_quarantined
+                chunk = records[done:done + settings.AUDIT_BATCH_SIZE]
+                handled, error = await self._write(chunk)
+                done += handled
+                self.rows_replayed += handled - (self.rows_quarantined - quarantined)
+                if error is not None:
+                    # Hand back this file's remainder and every file not replayed yet
+                    leftover = records[done:] + [r for _, rest in claimed_files[i + 1:] for r in rest]
+                    logger.error(f"Audit spill replay failed, re-spilling {len(leftover)} rows: {error}")
+                    await asyncio.to_thread(self._spill, leftover)
+                    self.rows_spilled -= len(leftover)  # Already counted when first spilled
+                    for path, _ in claimed_files[i:]:
+                        await asyncio.to_thread(os.remove, path)
+                    return
+            await asyncio.to_thread(os.remove, claimed)
+            logger.info(f"Replayed {len(records)} spilled audit rows from {os.path.basename(claimed)}")
+
+    def stats(self) -> dict:
+        """Queue depth and flush counters for this worker"""
+        return {
+            "queued": self.queue.qsize(),
+            "rows_written": self.rows_written,
+            "rows_spilled": self.rows_spilled,
+            "rows_replayed": self.rows_replayed,
+            "rows_quarantined": self.rows_quarantined,
+            "flush_failures": self.flush_failures,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+def _encode(record: tuple) -> str:
+    row = list(record)
+    row[6] = row[6].isoformat()
+    return json.dumps(row, default=str)
+
+
+def _decode(line: str) -> tuple:
+    row = json.loads(line)
+    row[6] = datetime.fromisoformat(row[6])
+    return tuple(row)
+
+
+audit_writer = AuditLogWriter()
+
+
+def _client_ip(request: Request) -> str | None:
+    """Client address, or None if it is not a valid INET value"""
+    if not request.client:
+        return None
+    try:
+        return str(ipaddress.ip_address(request.client.host))
+    except ValueError:
+        return None
+
 
 async def audit_middleware(request: Request, call_next):
     """Log all requests to audit_log table"""
 
-    # Extract user_id from JWT if present
-    user_id = None
-    if "authorization" in request.headers:
-        try:
-            from middleware.jwt_auth import verify_jwt_token
-            token = request.headers["authorization"].split()[1]
-            payload = verify_jwt_token(token)
-            user_id = payload.get("sub")
-        except:
-            pass  # Continue without user_id if token invalid
+    # Extract user_id from JWT if present (decoded once, shared via request.state)
+    payload = authenticate_request(request)
+    user_id = payload.get("sub") if payload else None
 
     # Process request
     response = await call_next(request)
 
-    # Log to database (async in background to not block response)
-    try:
-        conn = psycopg2.connect(settings.database_url)
-        cur = conn.cursor()
-
-        action = f"{request.method} {request.url.path}"
-        ip_address = request.client.host if request.client else None
-        user_agent = request.headers.get("user-agent")
-
-        # Determine resource type from path
-        resource_type = None
-        if "/receipts/" in request.url.path:
-            resource_type = "receipt"
-        elif "/users/" in request.url.path:
-            resource_type = "user"
-        elif "/auth/" in request.url.path:
-            resource_type = "auth"
-
-        metadata = {
-            "method": request.method,
-            "path": str(request.url.path),
-            "status_code": response.status_code,
-            "query_params": dict(request.query_params),
-        }
+    # Queue for the background writer (never blocks the response on Postgres)
+    action = f"{request.method} {request.url.path}"
+    user_agent = request.headers.get("user-agent")
 
-        cur.execute("""
-            INSERT INTO receipts.audit_log
-            (user_id, action, resource_type, ip_address, user_agent, metadata)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (user_id, action, resource_type, ip_address, user_agent, json.dumps(metadata)))
+    # Determine resource type from path
+    resource_type = None
+    if "/receipts/" in request.url.path:
+        resource_type = "receipt"
+    elif "/users/" in request.url.path:
+        resource_type = "user"
+    elif "/auth/" in request.url.path:
+        resource_type = "auth"
 
-        conn.commit()
-        cur.close()
-        conn.close()
+    metadata = {
+        "method": request.method,
+        "path": str(request.url.path),
+        "status_code": response.status_code,
+        "query_params": dict(request.query_params),
+    }
 
-    except Exception as e:
-        logger.error(f"Audit logging failed: {e}")
-        # Don't fail the request if audit logging fails
+    await audit_writer.submit((
+        user_id,
+        action,
+        resource_type,
+        _client_ip(request),
+        user_agent,
+        json.dumps(metadata),
+        datetime.now(timezone.utc),
+    ))
 
     return response
@@ -2,16 +2,89 @@
 JWT Authentication Middleware
 Validates JWT tokens and extracts user information
 """
-from fastapi import HTTPException, Depends, Header
+from fastapi import HTTPException, Depends, Header, Request
+from collections import OrderedDict
 from datetime import datetime, timedelta
+import hashlib
 import jwt
 import logging
+import time
 
 from config import settings
 
 logger = logging.getLogger(__name__)
 
 
+class VerifiedTokenCache:
+    """
+    Bounded LRU of verified JWT payloads
+
+    - Keyed by SHA-256 digest of the raw token (tokens are never stored)
+    - Entries are dropped once the token's exp has passed
+    - Hit/miss counters are exposed for sizing JWT_CACHE_SIZE
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> dict | None:
+        """Cached payload, or None on a miss or if the token has expired"""
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        exp, payload = entry
+        if exp <= time.time():
+            del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return payload
+
+    def put(self, token: str, payload: dict):
+        """Remember a verified payload until its exp"""
+        exp = payload.get("exp")
+        if not exp or self.max_size <= 0:
+            return
+
+        key = self._key(token)
+        self._entries[key] = (float(exp), payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Cache size and hit/miss counters for this worker"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+token_cache = VerifiedTokenCache(settings.JWT_CACHE_SIZE)
+
+
 def create_jwt_token(user_id: str, email: str, tier: str) -> str:
     """Create a new JWT token for authenticated user"""
     payload = {
@@ -26,13 +99,18 @@ def create_jwt_token(user_id: str, email: str, tier: str) -> str:
 
 
 def verify_jwt_token(token: str) -> dict:
-    """Verify JWT token and return payload"""
+    """Verify JWT token and return payload (served from token_cache when possible)"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
     try:
         payload = jwt.decode(
             token,
             settings.JWT_SECRET,
             algorithms=[settings.JWT_ALGORITHM]
         )
+        token_cache.put(token, payload)
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
@@ -40,8 +118,37 @@ def verify_jwt_token(token: str) -> dict:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
-async def get_current_user(authorization: str = Header(None)) -> dict:
+def authenticate_request(request: Request) -> dict | None:
+    """
+    Verified JWT payload for this request, or None if absent or invalid
+
+    The result is stored on request.state so the token is decoded at most
+    once per request, however many middlewares and dependencies ask.
+    """
+    payload = getattr(request.state, "jwt_payload", False)
+    if payload is not False:
+        return payload
+
+    payload = None
+    authorization = request.headers.get("authorization")
+    if authorization:
+        try:
+            scheme, token = authorization.split()
+            if scheme.lower() == "bearer":
+                payload = verify_jwt_token(token)
+        except (ValueError, HTTPException):
+            pass  # Missing or invalid token: treat as anonymous
+
+    request.state.jwt_payload = payload
+    return payload
+
+
+async def get_current_user(request: Request, authorization: str = Header(None)) -> dict:
     """Dependency to get current authenticated user from JWT token"""
+    payload = getattr(request.state, "jwt_payload", None)
+    if payload is not None:
+        return payload
+
     if not authorization:
         raise HTTPException(status_code=401, detail="Authorization header missing")
 
@@ -52,6 +159,7 @@ async def get_current_user(authorization: str = Header(None)) -> dict:
             raise HTTPException(status_code=401, detail="Invalid authentication scheme")
 
         payload = verify_jwt_token(token)
+        request.state.jwt_payload = payload
         return payload
 
     except ValueError:
@@ -0,0 +1,28 @@
+"""
+Request Metrics Middleware
+Latency histogram and in-flight gauge labelled by route template, not raw path
+"""
+from fastapi import Request
+import time
+
+from metrics import HTTP_IN_PROGRESS, HTTP_REQUEST_SECONDS
+
+
+async def metrics_middleware(request: Request, call_next):
+    """Time every request; unmatched paths share one label so scanners cannot explode cardinality"""
+    method = request.method
+    in_progress = HTTP_IN_PROGRESS.labels(method)
+    in_progress.inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # The router stores the matched route in the shared scope
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            method, route.path if route is not None else "unmatched", str(status)
+        ).observe(time.perf_counter() - started)
+        in_progress.dec()
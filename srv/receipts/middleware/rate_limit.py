@@ -1,54 +1,267 @@
 """
 Rate Limiting Middleware
-Enforces 100 requests/minute per user per endpoint using Redis
+Per-tier, per-route limits enforced atomically in Redis with one script call
 """
-from fastapi import HTTPException
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from starlette.routing import Match
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+import math
+import os
 import redis
 import logging
+import time
 
+from cache import redis_client
 from config import settings
+from metrics import observe_redis
+from middleware.jwt_auth import authenticate_request
 
 logger = logging.getLogger(__name__)
 
-# Redis client
-redis_client = redis.Redis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    password=settings.REDIS_PASSWORD,
-    decode_responses=True
-)
 
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """A request budget: `limit` requests per `window` seconds"""
+    algorithm: str  # "sliding_window" or "token_bucket"
+    limit: int
+    window: int
 
-async def rate_limit_check(user_id: str, endpoint: str, limit: int = 100):
+    @property
+    def header(self) -> str:
+        return f"{self.limit};w={self.window}"
+
+
+# Default budget per endpoint, by subscription tier
+TIER_POLICIES = {
+    "anonymous": RateLimitPolicy("sliding_window", 30, 60),
+    "free": RateLimitPolicy("sliding_window", 100, 60),
+    "pro": RateLimitPolicy("token_bucket", 300, 60),
+    "enterprise": RateLimitPolicy("token_bucket", 1000, 60),
+}
+
+# Route-specific budgets, overriding the tier default
+ROUTE_POLICIES = {
+    "/auth/login": {"anonymous": RateLimitPolicy("sliding_window", 10, 60)},
+    "/auth/register": {"anonymous": RateLimitPolicy("sliding_window", 5, 60)},
+    "/api/receipts/upload": {"free": RateLimitPolicy("sliding_window", 20, 60)},
+    "/api/receipts/import": {"free": RateLimitPolicy("sliding_window", 2, 60)},
+}
+
+EXEMPT_PATHS = {"/", "/health", "/metrics", "/docs", "/redoc", "/openapi.json"}
+
+# Bucket for paths no route matches (probes, typos), shared so they cannot mint keys
+UNMATCHED_ROUTE = "unmatched"
+
+# KEYS[1] = zset of request timestamps; ARGV = limit, window_ms, member suffix
+SLIDING_WINDOW_LUA = """
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+local count = redis.call('ZCARD', KEYS[1])
+if count < limit then
+  redis.call('ZADD', KEYS[1], now, now .. ':' .. ARGV[3])
+  redis.call('PEXPIRE', KEYS[1], window)
+  return {1, limit - count - 1, window}
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return {0, 0, tonumber(oldest[2]) + window - now}
+"""
+
+# KEYS[1] = hash {tokens, ts}; ARGV = capacity, window_ms (capacity refills once per window)
+TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local rate = capacity / window
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], window)
+local reset
+if allowed == 1 then
+  reset = math.ceil((capacity - tokens) / rate)
+else
+  reset = math.ceil((1 - tokens) / rate)
+end
+return {allowed, math.floor(tokens), reset}
+"""
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    policy: RateLimitPolicy
+    remaining: int
+    reset_seconds: int
+
+    def headers(self) -> dict:
+        return {
+            "RateLimit-Limit": str(self.policy.limit),
+            "RateLimit-Remaining": str(max(0, self.remaining)),
+            "RateLimit-Reset": str(self.reset_seconds),
+            "RateLimit-Policy": self.policy.header,
+        }
+
+
+class LocalRateLimiter:
+    """
+    In-process fallback used while Redis is unreachable
+
+    Same algorithms as the Redis scripts, with each budget divided by
+    RATE_LIMIT_FALLBACK_WORKERS so the service as a whole stays near its limit.
     """
-    Check if user has exceeded rate limit for this endpoint
 
-    Args:
-        user_id: User ID from JWT token
-        endpoint: API endpoint path
-        limit: Max requests per minute (default 100)
+    def __init__(self, max_keys: int = 50000):
+        self.max_keys = max_keys
+        self._windows: OrderedDict[str, deque] = OrderedDict()
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def check(self, key: str, policy: RateLimitPolicy) -> RateLimitResult:
+        limit = max(1, policy.limit // settings.RATE_LIMIT_FALLBACK_WORKERS)
+        now = time.monotonic()
+
+        if policy.algorithm == "token_bucket":
+            rate = limit / policy.window
+            tokens, ts = self._buckets.pop(key, (float(limit), now))
+            tokens = min(limit, tokens + (now - ts) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._trim(self._buckets)
+            reset = math.ceil(((limit - tokens) if allowed else (1 - tokens)) / rate)
+            return RateLimitResult(allowed, policy, int(tokens), reset)
+
+        hits = self._windows.pop(key, None) or deque()
+        while hits and hits[0] <= now - policy.window:
+            hits.popleft()
+        allowed = len(hits) < limit
+        if allowed:
+            hits.append(now)
+        self._windows[key] = hits
+        self._trim(self._windows)
+        reset = math.ceil(hits[0] + policy.window - now) if hits else policy.window
+        return RateLimitResult(allowed, policy, limit - len(hits), reset)
+
+    def _trim(self, entries: OrderedDict):
+        while len(entries) > self.max_keys:
+            entries.popitem(last=False)
+
 
-    Raises:
-        HTTPException: If rate limit exceeded
+class RateLimiter:
     """
-    key = f"rate_limit:{user_id}:{endpoint}"
-
-    try:
-        current_count = redis_client.get(key)
-
-        if current_count and int(current_count) >= limit:
-            raise HTTPException(
-                status_code=429,
-                detail=f"Rate limit exceeded. Maximum {limit} requests per minute. Try again in 60 seconds."
-            )
-
-        # Increment counter with 60-second TTL
-        pipe = redis_client.pipeline()
-        pipe.incr(key)
-        pipe.expire(key, 60)
-        pipe.execute()
-
-    except redis.RedisError as e:
-        logger.error(f"Redis error in rate limiting: {e}")
-        # Don't block request if Redis is down
-        pass
+    Redis-backed limiter, one EVALSHA round trip per request
+
+    Falls back to LocalRateLimiter (never fails open) while Redis is down,
+    retrying Redis after RATE_LIMIT_REDIS_RETRY_SECONDS.
+    """
+
+    def __init__(self):
+        self._sliding_window = redis_client.register_script(SLIDING_WINDOW_LUA)
+        self._token_bucket = redis_client.register_script(TOKEN_BUCKET_LUA)
+        self._local = LocalRateLimiter()
+        self._redis_down_until = 0.0
+        self._seq = 0
+        self.limited = 0
+        self.redis_errors = 0
+        self.fallback_checks = 0
+
+    @staticmethod
+    def policy_for(path: str, tier: str) -> RateLimitPolicy:
+        route = ROUTE_POLICIES.get(path, {})
+        return route.get(tier) or TIER_POLICIES.get(tier) or TIER_POLICIES["anonymous"]
+
+    async def check(self, identity: str, path: str, tier: str) -> RateLimitResult:
+        policy = self.policy_for(path, tier)
+        key = f"rate_limit:{policy.algorithm}:{identity}:{path}"
+
+        if time.monotonic() >= self._redis_down_until:
+            try:
+                async with observe_redis("rate_limit"):
+                    if policy.algorithm == "token_bucket":
+                        allowed, remaining, reset_ms = await self._token_bucket(
+                            keys=[key], args=[policy.limit, policy.window * 1000]
+                        )
+                    else:
+                        self._seq += 1
+                        allowed, remaining, reset_ms = await self._sliding_window(
+                            keys=[key], args=[policy.limit, policy.window * 1000, f"{os.getpid()}:{self._seq}"]
+                        )
+                return RateLimitResult(bool(allowed), policy, int(remaining), math.ceil(int(reset_ms) / 1000))
+            except redis.RedisError as e:
+                self.redis_errors += 1
+                self._redis_down_until = time.monotonic() + settings.RATE_LIMIT_REDIS_RETRY_SECONDS
+                logger.error(f"Redis error in rate limiting, using in-process limiter: {e}")
+
+        self.fallback_checks += 1
+        return self._local.check(key, policy)
+
+    def stats(self) -> dict:
+        """Decision counters for this worker"""
+        return {
+            "limited": self.limited,
+            "redis_errors": self.redis_errors,
+            "fallback_checks": self.fallback_checks,
+            "redis_available": time.monotonic() >= self._redis_down_until,
+        }
+
+
+rate_limiter = RateLimiter()
+
+
+def route_template(request: Request) -> str:
+    """
+    Template of the route a request will hit (/api/receipts/{receipt_id}, not the raw path)
+
+    Middleware runs before routing, so scope["route"] is not set yet; match the
+    way the router will: the first full match (path and method), else the first
+    route whose path matches with the wrong method, else UNMATCHED_ROUTE.
+    """
+    partial = None
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or UNMATCHED_ROUTE
+
+
+async def rate_limit_middleware(request: Request, call_next):
+    """Enforce per-tier, per-route limits and attach RateLimit-* headers"""
+    path = request.url.path
+    if not settings.RATE_LIMIT_ENABLED or path in EXEMPT_PATHS or request.method == "OPTIONS":
+        return await call_next(request)
+
+    payload = authenticate_request(request)
+    if payload:
+        identity, tier = f"user:{payload.get('sub')}", payload.get("tier") or "free"
+    else:
+        identity, tier = f"ip:{request.client.host if request.client else 'unknown'}", "anonymous"
+
+    # Buckets are per route template: changing an id in the URL is the same budget
+    result = await rate_limiter.check(identity, route_template(request), tier)
+    if not result.allowed:
+        rate_limiter.limited += 1
+        return JSONResponse(
+            status_code=429,
+            content={"detail": f"Rate limit exceeded. Maximum {result.policy.limit} requests per "
+                               f"{result.policy.window} seconds. Try again in {result.reset_seconds} seconds."},
+            headers={**result.headers(), "Retry-After": str(result.reset_seconds)},
+        )
+
+    response = await call_next(request)
+    response.headers.update(result.headers())
+    return response
@@ -0,0 +1,226 @@
+"""
+Upload Quota
+Monthly upload counters in Redis, keyed by month so each month starts fresh without a reset job
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+import asyncio
+import logging
+import redis
+import time
+
+from cache import redis_client
+from config import settings
+from db import db
+from metrics import observe_redis
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] = quota:{user_id}:{YYYY-MM}; ARGV = n, limit (-1 = unlimited), seed (-1 = unknown), ttl_s
+# Grants up to n uploads and returns {granted, used}; {-1, 0} asks the caller for a seed
+RESERVE_LUA = """
+local used = redis.call('GET', KEYS[1])
+if not used then
+  if tonumber(ARGV[3]) < 0 then
+    return {-1, 0}
+  end
+  used = ARGV[3]
+  redis.call('SET', KEYS[1], used, 'EX', ARGV[4])
+end
+used = tonumber(used)
+local granted = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+if limit >= 0 then
+  granted = math.max(0, math.min(granted, limit - used))
+end
+if granted > 0 then
+  used = redis.call('INCRBY', KEYS[1], granted)
+end
+return {granted, used}
+"""
+
+# KEYS[1] = quota key; ARGV[1] = n. A missing key is left alone (it is re-seeded from Postgres)
+REFUND_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return 0
+end
+local used = redis.call('DECRBY', KEYS[1], ARGV[1])
+if used < 0 then
+  redis.call('SET', KEYS[1], 0, 'KEEPTTL')
+  return 0
+end
+return used
+"""
+
+# Everything uploaded this month counts, including receipts deleted or purged since
+MONTH_UPLOADS_SQL = """
+    SELECT COUNT(*)
+    FROM receipts.receipts
+    WHERE user_id = $1 AND uploaded_at >= $2
+"""
+
+
+def month_bounds(now: datetime | None = None) -> tuple[datetime, datetime]:
+    """Start of the current UTC month and of the next one"""
+    now = now or datetime.now(timezone.utc)
+    start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+
+@dataclass
+class QuotaReservation:
+    """Uploads granted against one month's counter (key is None when Redis was bypassed)"""
+    key: str | None
+    granted: int
+    used: int
+    limit: int | None
+
+    @property
+    def remaining(self) -> int | None:
+        return None if self.limit is None else max(0, self.limit - self.used)
+
+
+class UploadQuota:
+    """
+    Per-user monthly upload counters
+
+    - reserve() is one EVALSHA: increment-and-check against quota:{user}:{YYYY-MM},
+      seeded from Postgres the first time a user uploads in a month
+    - A new month means a new key, so nothing is ever reset; old keys expire
+    - refund() returns reservations that did not become receipts
+    - Counters are copied to users.receipts_uploaded_this_month every
+      QUOTA_SYNC_SECONDS for the users this worker saw, in one UPDATE
+    - While Redis is down, quotas are checked against a Postgres count instead
+    """
+
+    def __init__(self):
+        self._reserve = redis_client.register_script(RESERVE_LUA)
+        self._refund = redis_client.register_script(REFUND_LUA)
+        self._dirty: dict[str, tuple[str, date]] = {}
+        self._redis_down_until = 0.0
+        self._task: asyncio.Task | None = None
+        self.denied = 0
+        self.seeded = 0
+        self.refunded = 0
+        self.redis_errors = 0
+        self.fallback_checks = 0
+        self.synced = 0
+
+    @staticmethod
+    def limit_for(tier: str) -> int | None:
+        return settings.FREE_TIER_MONTHLY_LIMIT if tier == "free" else None
+
+    async def reserve(self, conn, user_id: str, tier: str, n: int = 1) -> QuotaReservation:
+        """Grant up to n uploads this month; granted < n means the limit was reached"""
+        limit = self.limit_for(tier)
+        start, end = month_bounds()
+        key = f"quota:{user_id}:{start:%Y-%m}"
+
+        if time.monotonic() >= self._redis_down_until:
+            # Keys outlive their month by a day so late refunds still land
+            ttl = int((end - datetime.now(timezone.utc)).total_seconds()) + 86400
+            args = [n, -1 if limit is None else limit, -1, ttl]
+            try:
+                async with observe_redis("quota_reserve"):
+                    granted, used = await self._reserve(keys=[key], args=args)
+                if granted < 0:
+                    self.seeded += 1
+                    args[2] = await conn.fetchval(MONTH_UPLOADS_SQL, user_id, start)
+                    async with observe_redis("quota_reserve"):
+                        granted, used = await self._reserve(keys=[key], args=args)
+                self._dirty[user_id] = (key, end.date())
+                if granted < n:
+                    self.denied += 1
+                return QuotaReservation(key, int(granted), int(used), limit)
+            except redis.RedisError as e:
+                self.redis_errors += 1
+                self._redis_down_until = time.monotonic() + settings.QUOTA_REDIS_RETRY_SECONDS
+                logger.error(f"Redis error in upload quota, counting in Postgres: {e}")
+
+        self.fallback_checks += 1
+        used = await conn.fetchval(MONTH_UPLOADS_SQL, user_id, start)
+        granted = n if limit is None else max(0, min(n, limit - used))
+        if granted < n:
+            self.denied += 1
+        return QuotaReservation(None, granted, used + granted, limit)
+
+    async def refund(self, reservation: QuotaReservation, n: int):
+        """Give back n granted uploads that were not stored (duplicates, lost races, errors)"""
+        if n <= 0 or reservation.key is None:
+            return
+        try:
+            async with observe_redis("quota_refund"):
+                await self._refund(keys=[reservation.key], args=[n])
+            self.refunded += n
+        except redis.RedisError as e:
+            # The counter stays high until next month; the user is never over-granted
+            logger.warning(f"Could not refund {n} uploads on {reservation.key}: {e}")
+
+    async def start(self):
+        """Start the periodic Postgres sync (called once at startup)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.sync()
+        except Exception as e:
+            logger.warning(f"Final quota sync failed: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.QUOTA_SYNC_SECONDS)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"Quota sync failed: {e}")
+
+    async def sync(self):
+        """Copy this worker's recently used counters to receipts.users in one statement"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        user_ids = list(dirty)
+        try:
+            async with observe_redis("quota_sync"):
+                counts = await redis_client.mget([dirty[u][0] for u in user_ids])
+            rows = [(u, int(c), dirty[u][1]) for u, c in zip(user_ids, counts) if c is not None]
+            if rows:
+                async with db.acquire() as conn:
+                    await conn.execute("""
+                        UPDATE receipts.users u
+                        SET receipts_uploaded_this_month = d.used,
+                            month_reset_date = d.reset_date,
+                            updated_at = NOW()
+                        FROM unnest($1::uuid[], $2::int[], $3::date[]) AS d(user_id, used, reset_date)
+                        WHERE u.user_id = d.user_id
+                          AND (u.receipts_uploaded_this_month, u.month_reset_date)
+                              IS DISTINCT FROM (d.used, d.reset_date)
+                    """, [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows])
+        except Exception:
+            # Keep newer entries; retry the rest on the next pass
+            for user_id, entry in dirty.items():
+                self._dirty.setdefault(user_id, entry)
+            raise
+        self.synced += len(rows)
+
+    def stats(self) -> dict:
+        """Quota counters for this worker"""
+        return {
+            "denied": self.denied,
+            "seeded": self.seeded,
+            "refunded": self.refunded,
+            "redis_errors": self.redis_errors,
+            "fallback_checks": self.fallback_checks,
+            "pending_sync": len(self._dirty),
+            "synced": self.synced,
+            "redis_available": time.monotonic() >= self._redis_down_until,
+        }
+
+
+upload_quota = UploadQuota()
@@ -0,0 +1,62 @@
+"""
+Category catalogue: ETag and If-None-Match handling (no database needed)
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import api.categories as categories
+
+ROWS = [
+    (1, "meals", "Meals and entertainment", "8523", None),
+    (2, "office", "Office expenses", "8810", "Stationery"),
+]
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+
+    @asynccontextmanager
+    async def acquire(self):
+        rows = self.rows
+
+        class Conn:
+            async def fetch(self, query):
+                return rows
+
+        yield Conn()
+
+
+def load(monkeypatch, rows) -> categories.CategoryCatalogue:
+    monkeypatch.setattr(categories, "db", FakeDB(rows))
+    catalogue = categories.CategoryCatalogue()
+    asyncio.run(catalogue.reload())
+    return catalogue
+
+
+def test_etag_is_stable_for_identical_content(monkeypatch):
+    first, second = load(monkeypatch, ROWS), load(monkeypatch, list(ROWS))
+    assert first.etag == second.etag
+    assert first.etag.startswith('"') and first.etag.endswith('"')
+
+
+def test_etag_changes_with_content(monkeypatch):
+    renamed = [ROWS[0], (2, "office", "Office supplies", "8810", "Stationery")]
+    assert load(monkeypatch, ROWS).etag != load(monkeypatch, renamed).etag
+
+
+def test_if_none_match(monkeypatch):
+    catalogue = load(monkeypatch, ROWS)
+    etag = catalogue.etag
+    assert catalogue.matches(etag)
+    assert catalogue.matches(f'"stale", {etag}')
+    assert catalogue.matches(f"W/{etag}")  # Weak comparison, as If-None-Match requires
+    assert catalogue.matches("*")
+    assert not catalogue.matches('"stale"')
+    assert not catalogue.matches(None)
+    assert not catalogue.matches("")
+
+
+def test_nothing_matches_before_the_first_load():
+    catalogue = categories.CategoryCatalogue()
+    assert not catalogue.matches("*")
@@ -0,0 +1,65 @@
+"""
+Receipts listing: keyset cursor and query builder (no database needed)
+"""
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+
+from api.receipts import build_list_query, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip_keeps_microseconds_and_timezone():
+    uploaded_at = datetime(2025, 3, 9, 23, 59, 59, 999999, tzinfo=timezone(timedelta(hours=-5)))
+    receipt_id = uuid.uuid4()
+    assert decode_cursor(encode_cursor(uploaded_at, receipt_id)) == (uploaded_at, receipt_id)
+
+
+def test_cursor_is_url_safe_without_padding():
+    for _ in range(20):
+        cursor = encode_cursor(datetime.now(timezone.utc), uuid.uuid4())
+        assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    "",
+    encode_cursor(datetime.now(timezone.utc), uuid.uuid4())[:-4],  # Truncated
+    "WyIyMDI1LTAxLTAxIl0",  # ["2025-01-01"]: wrong arity
+    "WyIyMDI1LTAxLTAxIiwgIm5vdC1hLXV1aWQiXQ",  # ["2025-01-01", "not-a-uuid"]
+    "eyJhIjogMX0",  # {"a": 1}
+])
+def test_malformed_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as excinfo:
+        decode_cursor(cursor)
+    assert excinfo.value.status_code == 400
+
+
+def test_query_placeholders_follow_argument_order():
+    uploaded_at, receipt_id = datetime(2025, 1, 2, tzinfo=timezone.utc), uuid.uuid4()
+    query, args = build_list_query(
+        "user-1", encode_cursor(uploaded_at, receipt_id), date(2025, 1, 1), None,
+        7, "completed", Decimal("1.50"), None,
+    )
+    assert args == ["user-1", uploaded_at, receipt_id, date(2025, 1, 1), 7, "completed", Decimal("1.50")]
+    assert "(uploaded_at, receipt_id) < ($2, $3)" in query
+    assert "transaction_date >= $4" in query
+    assert "category_id = $5" in query
+    assert "extraction_status = $6" in query
+    assert "total_amount >= $7" in query
+    assert "$8" not in query
+    assert query.strip().endswith("ORDER BY uploaded_at DESC, receipt_id DESC")
+
+
+def test_first_page_has_no_keyset_clause():
+    query, args = build_list_query("user-1", None, None, None, None, None, None, None)
+    assert args == ["user-1"]
+    assert "uploaded_at, receipt_id) <" not in query
+
+
+def test_category_zero_is_still_a_filter():
+    query, args = build_list_query("user-1", None, None, None, 0, None, None, None)
+    assert args == ["user-1", 0]
+    assert "category_id = $2" in query
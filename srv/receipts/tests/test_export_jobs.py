@@ -0,0 +1,97 @@
+"""
+Export jobs: every failure ends in 'failed', and queued jobs heartbeat (no database needed)
+"""
+import asyncio
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+
+import export.jobs as jobs
+from config import settings
+
+
+class FakeDB:
+    def __init__(self, fail_on: str | None = None):
+        self.fail_on = fail_on
+        self.executed = []
+
+    @asynccontextmanager
+    async def acquire(self):
+        db = self
+
+        class Conn:
+            async def execute(self, query, *args):
+                if db.fail_on and db.fail_on in query:
+                    raise ConnectionError("Postgres down")
+                db.executed.append((query, args))
+
+        yield Conn()
+
+    def statuses(self) -> list[str]:
+        return [args[1] for query, args in self.executed if "SET status = $2" in query]
+
+
+@pytest.fixture
+def export_env(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+
+    async def write_workbook(conn, user_id, year, dest_path, on_batch=None):
+        with open(dest_path, "wb") as f:
+            f.write(b"xlsx")
+        await on_batch(3)
+        return 3
+
+    monkeypatch.setattr(jobs, "write_workbook", write_workbook)
+
+    def use(db: FakeDB):
+        monkeypatch.setattr(jobs, "db", db)
+        return jobs.ExportJobRunner()
+
+    return use
+
+
+def test_a_failed_completion_update_marks_the_job_failed(export_env):
+    db = FakeDB(fail_on="'completed'")
+    runner, job_id = export_env(db), uuid.uuid4()
+
+    asyncio.run(runner._run(job_id, "user-1", 2025))
+
+    assert db.statuses() == ["running", "running", "failed"]
+    assert db.executed[-1][1][2] == "Postgres down"
+    assert not os.path.exists(os.path.join(jobs.export_dir("user-1"), f"{job_id}.xlsx"))
+    assert (runner.completed, runner.failed) == (0, 1)
+
+
+def test_a_failed_workbook_marks_the_job_failed(export_env, monkeypatch):
+    async def write_workbook(*args, **kwargs):
+        raise ValueError("bad receipt row")
+
+    monkeypatch.setattr(jobs, "write_workbook", write_workbook)
+    db = FakeDB()
+    runner = export_env(db)
+
+    asyncio.run(runner._run(uuid.uuid4(), "user-1", None))
+
+    assert db.statuses() == ["running", "failed"]
+    assert db.executed[-1][1][2] == "bad receipt row"
+
+
+def test_queued_jobs_heartbeat_until_a_slot_frees(export_env, monkeypatch):
+    monkeypatch.setattr(jobs, "STALE_JOB_SECONDS", 0.03)
+    db = FakeDB()
+    runner = export_env(db)
+
+    async def run():
+        runner._slots = asyncio.Semaphore(0)
+        job = asyncio.create_task(runner._run(uuid.uuid4(), "user-1", 2025))
+        await asyncio.sleep(0.05)
+        runner._slots.release()
+        await job
+
+    asyncio.run(run())
+
+    statuses = db.statuses()
+    assert statuses[0] == "pending" and statuses[-2:] == ["running", "running"]
+    assert "'completed'" in db.executed[-1][0] and runner.completed == 1
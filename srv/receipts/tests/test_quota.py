@@ -0,0 +1,120 @@
+"""
+Upload quota: month keys, reservation accounting and the reserve/refund scripts
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from config import settings
+from quota import REFUND_LUA, RESERVE_LUA, QuotaReservation, UploadQuota, month_bounds
+
+
+class FakeConn:
+    def __init__(self, uploaded: int):
+        self.uploaded = uploaded
+        self.queries = 0
+
+    async def fetchval(self, query, *args):
+        self.queries += 1
+        return self.uploaded
+
+
+class FakeReserve:
+    """Stands in for the registered script: asks for a seed once, then counts"""
+
+    def __init__(self):
+        self.used = None
+        self.calls = []
+
+    async def __call__(self, keys, args):
+        self.calls.append((keys, list(args)))
+        n, limit, seed, _ = args
+        if self.used is None:
+            if seed < 0:
+                return [-1, 0]
+            self.used = seed
+        granted = n if limit < 0 else max(0, min(n, limit - self.used))
+        self.used += granted
+        return [granted, self.used]
+
+
+def test_month_bounds_mid_month():
+    start, end = month_bounds(datetime(2025, 2, 14, 13, 30, 5, 123, tzinfo=timezone.utc))
+    assert start == datetime(2025, 2, 1, tzinfo=timezone.utc)
+    assert end == datetime(2025, 3, 1, tzinfo=timezone.utc)
+
+
+def test_month_bounds_rolls_over_in_december():
+    start, end = month_bounds(datetime(2025, 12, 31, 23, 59, 59, tzinfo=timezone.utc))
+    assert start == datetime(2025, 12, 1, tzinfo=timezone.utc)
+    assert end == datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def test_reservation_remaining():
+    assert QuotaReservation("k", 1, 48, 50).remaining == 2
+    assert QuotaReservation("k", 0, 53, 50).remaining == 0  # Seeded above a lowered limit
+    assert QuotaReservation("k", 1, 500, None).remaining is None
+
+
+def test_only_the_free_tier_is_limited():
+    assert UploadQuota.limit_for("free") == settings.FREE_TIER_MONTHLY_LIMIT
+    assert UploadQuota.limit_for("pro") is None
+    assert UploadQuota.limit_for("enterprise") is None
+
+
+def test_reserve_seeds_the_counter_from_postgres_once():
+    quota, script = UploadQuota(), FakeReserve()
+    quota._reserve = script
+    conn = FakeConn(uploaded=settings.FREE_TIER_MONTHLY_LIMIT - 2)
+
+    first = asyncio.run(quota.reserve(conn, "user-1", "free", n=1))
+    second = asyncio.run(quota.reserve(conn, "user-1", "free", n=3))
+
+    assert (first.granted, first.remaining) == (1, 1)
+    assert (second.granted, second.remaining) == (1, 0)  # Partial grant up to the limit
+    assert conn.queries == 1 and quota.seeded == 1 and quota.denied == 1
+    assert script.calls[0][1][2] == -1 and script.calls[1][1][2] == settings.FREE_TIER_MONTHLY_LIMIT - 2
+    assert first.key == f"quota:user-1:{month_bounds()[0]:%Y-%m}"
+
+
+def test_reserve_counts_in_postgres_while_redis_is_down():
+    quota = UploadQuota()
+    quota._redis_down_until = time.monotonic() + 60
+    conn = FakeConn(uploaded=settings.FREE_TIER_MONTHLY_LIMIT - 1)
+
+    reservation = asyncio.run(quota.reserve(conn, "user-1", "free", n=2))
+
+    assert reservation.key is None
+    assert (reservation.granted, reservation.used) == (1, settings.FREE_TIER_MONTHLY_LIMIT)
+    assert quota.fallback_checks == 1 and quota.denied == 1
+    asyncio.run(quota.refund(reservation, 1))  # Nothing to give back to Redis
+    assert quota.refunded == 0
+
+
+def test_reserve_script(live_redis):
+    client, prefix = live_redis
+    key = f"{prefix}:quota"
+    reserve = client.register_script(RESERVE_LUA)
+
+    assert reserve(keys=[key], args=[1, 50, -1, 60]) == [-1, 0]  # Needs a seed
+    assert not client.exists(key)
+    assert reserve(keys=[key], args=[1, 50, 48, 60]) == [1, 49]
+    assert 0 < client.ttl(key) <= 60
+    assert reserve(keys=[key], args=[3, 50, -1, 60]) == [1, 50]  # Partial grant
+    assert reserve(keys=[key], args=[1, 50, -1, 60]) == [0, 50]
+    assert reserve(keys=[key], args=[5, -1, -1, 60]) == [5, 55]  # Unlimited tier
+
+
+def test_refund_script(live_redis):
+    client, prefix = live_redis
+    key = f"{prefix}:quota"
+    refund = client.register_script(REFUND_LUA)
+
+    assert refund(keys=[key], args=[1]) == 0
+    assert not client.exists(key)  # A missing counter is re-seeded, never created here
+
+    client.set(key, 3, ex=60)
+    assert refund(keys=[key], args=[2]) == 1
+    assert refund(keys=[key], args=[5]) == 0  # Floors at zero
+    assert client.get(key) == "0"
+    assert 0 < client.ttl(key) <= 60  # TTL kept
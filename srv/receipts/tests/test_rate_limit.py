@@ -0,0 +1,149 @@
+"""
+Rate limiter: policies, route keys, in-process fallback and the Redis scripts
+"""
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from starlette.requests import Request
+
+import middleware.rate_limit as rate_limit
+from config import settings
+from middleware.rate_limit import (
+    SLIDING_WINDOW_LUA, TOKEN_BUCKET_LUA, LocalRateLimiter, RateLimitPolicy, RateLimiter, route_template,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_route_override_then_tier_default_then_anonymous():
+    assert RateLimiter.policy_for("/auth/login", "anonymous").limit == 10
+    assert RateLimiter.policy_for("/auth/login", "free") == rate_limit.TIER_POLICIES["free"]
+    assert RateLimiter.policy_for("/api/receipts/upload", "free").limit == 20
+    assert RateLimiter.policy_for("/api/receipts/upload", "pro") == rate_limit.TIER_POLICIES["pro"]
+    assert RateLimiter.policy_for("/anything", "no-such-tier") == rate_limit.TIER_POLICIES["anonymous"]
+
+
+def test_local_sliding_window(clock):
+    limiter = LocalRateLimiter()
+    policy = RateLimitPolicy("sliding_window", 2 * settings.RATE_LIMIT_FALLBACK_WORKERS, 60)
+
+    assert [limiter.check("k", policy).allowed for _ in range(3)] == [True, True, False]
+    denied = limiter.check("k", policy)
+    assert not denied.allowed and denied.remaining == 0 and denied.reset_seconds == 60
+
+    clock.now += 59.9
+    assert not limiter.check("k", policy).allowed
+    clock.now += 0.2
+    assert limiter.check("k", policy).allowed
+    assert limiter.check("other", policy).allowed  # Keys are independent
+
+
+def test_local_token_bucket_refills_at_limit_per_window(clock):
+    limiter = LocalRateLimiter()
+    policy = RateLimitPolicy("token_bucket", 2 * settings.RATE_LIMIT_FALLBACK_WORKERS, 60)
+
+    assert [limiter.check("k", policy).allowed for _ in range(3)] == [True, True, False]
+    clock.now += 31  # Just over one token at 2 per 60 s
+    assert limiter.check("k", policy).allowed
+    assert not limiter.check("k", policy).allowed
+
+
+def test_local_limiter_evicts_least_recent_keys(clock):
+    limiter = LocalRateLimiter(max_keys=2)
+    policy = RateLimitPolicy("sliding_window", 1 * settings.RATE_LIMIT_FALLBACK_WORKERS, 60)
+    for key in ("a", "b", "c"):
+        limiter.check(key, policy)
+    assert list(limiter._windows) == ["b", "c"]
+
+
+def request_for(app: FastAPI, method: str, path: str) -> Request:
+    return Request({
+        "type": "http", "method": method, "path": path, "root_path": "", "app": app,
+        "headers": [], "query_string": b"",
+    })
+
+
+def test_buckets_are_keyed_by_route_template():
+    app = FastAPI()
+
+    @app.get("/api/receipts/{receipt_id}")
+    async def get_receipt(receipt_id: str):
+        return {}
+
+    @app.post("/api/receipts/upload")
+    async def upload():
+        return {}
+
+    first = route_template(request_for(app, "GET", f"/api/receipts/{uuid.uuid4()}"))
+    second = route_template(request_for(app, "GET", f"/api/receipts/{uuid.uuid4()}"))
+    assert first == second == "/api/receipts/{receipt_id}"
+    assert route_template(request_for(app, "POST", "/api/receipts/upload")) == "/api/receipts/upload"
+    # Right path, wrong method: the first route whose path matches, as the router picks it
+    assert route_template(request_for(app, "DELETE", "/api/receipts/upload")) == "/api/receipts/{receipt_id}"
+    assert route_template(request_for(app, "GET", f"/probe/{uuid.uuid4()}")) == rate_limit.UNMATCHED_ROUTE
+    assert route_template(request_for(app, "GET", "/.env")) == rate_limit.UNMATCHED_ROUTE
+
+
+def test_full_match_wins_over_an_earlier_partial_one():
+    app = FastAPI()
+
+    @app.get("/api/receipts/{receipt_id}")
+    async def get_receipt(receipt_id: str):
+        return {}
+
+    @app.post("/api/receipts/upload")
+    async def upload():
+        return {}
+
+    # GET /{receipt_id} matches the path first, with the wrong method
+    assert route_template(request_for(app, "POST", "/api/receipts/upload")) == "/api/receipts/upload"
+    assert route_template(request_for(app, "PUT", "/api/receipts/upload")) == "/api/receipts/{receipt_id}"
+
+
+def test_sliding_window_script(live_redis):
+    client, prefix = live_redis
+    key = f"{prefix}:rate_limit"
+    script = client.register_script(SLIDING_WINDOW_LUA)
+    results = [script(keys=[key], args=[3, 60000, f"t:{i}"]) for i in range(4)]
+
+    assert [allowed for allowed, _, _ in results] == [1, 1, 1, 0]
+    assert [remaining for _, remaining, _ in results[:3]] == [2, 1, 0]
+    assert 0 < results[3][2] <= 60000
+    assert client.zcard(key) == 3  # Denied requests are not recorded
+    assert 0 < client.pttl(key) <= 60000
+
+
+def test_same_millisecond_requests_are_counted_separately(live_redis):
+    client, prefix = live_redis
+    key = f"{prefix}:rate_limit"
+    script = client.register_script(SLIDING_WINDOW_LUA)
+    with client.pipeline(transaction=False) as pipe:
+        for i in range(5):
+            script(keys=[key], args=[10, 60000, f"t:{i}"], client=pipe)
+        pipe.execute()
+    assert client.zcard(key) == 5
+
+
+def test_token_bucket_script(live_redis):
+    client, prefix = live_redis
+    key = f"{prefix}:rate_limit"
+    script = client.register_script(TOKEN_BUCKET_LUA)
+    results = [script(keys=[key], args=[2, 60000]) for _ in range(3)]
+
+    assert [allowed for allowed, _, _ in results] == [1, 1, 0]
+    assert [remaining for _, remaining, _ in results] == [1, 0, 0]
+    assert 0 < results[2][2] <= 30000  # Next token in at most window / capacity
@@ -0,0 +1,360 @@
+"""
+Upload Module
+Streams multipart receipt uploads to disk while hashing, enforcing limits mid-stream
+"""
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+from dataclasses import dataclass
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import zipfile
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Leading bytes of each accepted format
+MAGIC_NUMBERS = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"%PDF-", "application/pdf"),
+    (b"PK\x03\x04", "application/zip"),
+)
+SNIFF_BYTES = 8
+ARCHIVE_EXTENSION = "zip"
+COPY_CHUNK_BYTES = 64 * 1024
+
+EXTENSION_MIME_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "pdf": "application/pdf",
+    ARCHIVE_EXTENSION: "application/zip",
+}
+
+MAX_FIELD_BYTES = 64 * 1024  # Non-file form fields are ignored, but still bounded
+
+
+def sniff_mime_type(head: bytes) -> str | None:
+    """MIME type from the first bytes of a file, or None if unrecognised"""
+    for magic, mime_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    return None
+
+
+@dataclass
+class StagedUpload:
+    """One uploaded file, fully hashed and sitting in a temp file under UPLOAD_DIR"""
+    filename: str
+    extension: str
+    mime_type: str
+    size_bytes: int
+    file_hash: str
+    temp_path: str
+
+    def store(self, user_id: str, receipt_id) -> str:
+        """Move into permanent storage: {UPLOAD_DIR}/{user_id}/{receipt_id}.{ext}"""
+        user_dir = os.path.join(settings.UPLOAD_DIR, str(user_id))
+        os.makedirs(user_dir, exist_ok=True)
+        storage_path = os.path.join(user_dir, f"{receipt_id}.{self.extension}")
+        os.replace(self.temp_path, storage_path)
+        self.temp_path = storage_path
+        return storage_path
+
+    def discard(self):
+        """Delete the staged file (no-op if already gone)"""
+        try:
+            os.unlink(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+
+class _UploadCollector:
+    """MultipartParser callbacks that hash and spool file parts as they arrive"""
+
+    def __init__(self, max_files: int, allow_archives: bool = False):
+        self.max_files = max_files
+        self.allow_archives = allow_archives
+        self.max_bytes = settings.MAX_FILE_SIZE_MB * 1024 * 1024
+        self._max_part_bytes = self.max_bytes
+        self.incoming_dir = os.path.join(settings.UPLOAD_DIR, ".incoming")
+        self.staged: list[StagedUpload] = []
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._file = None
+        self._hasher = None
+        self._head = b""
+        self._size = 0
+        self._filename = ""
+        self._extension = ""
+        self._temp_path = ""
+        self._field_bytes = 0
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._field_bytes = 0
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        filename = options.get(b"filename")
+        if filename is None:
+            return  # Plain form field
+
+        if len(self.staged) >= self.max_files:
+            raise HTTPException(status_code=400, detail=f"At most {self.max_files} file(s) per request")
+
+        self._filename = os.path.basename(filename.decode("utf-8", "replace")) or "receipt"
+        self._extension = self._filename.rsplit(".", 1)[-1].lower() if "." in self._filename else ""
+        is_archive = self.allow_archives and self._extension == ARCHIVE_EXTENSION
+        if self._extension not in settings.allowed_extensions_list and not is_archive:
+            raise HTTPException(
+                status_code=415,
+                detail=f"File type not allowed. Allowed: {settings.ALLOWED_EXTENSIONS}"
+            )
+        self._max_part_bytes = settings.IMPORT_MAX_ARCHIVE_MB * 1024 * 1024 if is_archive else self.max_bytes
+
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        fd, self._temp_path = tempfile.mkstemp(dir=self.incoming_dir, suffix=f".{self._extension}")
+        self._file = os.fdopen(fd, "wb")
+        self._hasher = hashlib.sha256()
+        self._head = b""
+        self._size = 0
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._file is None:
+            self._field_bytes += end - start
+            if self._field_bytes > MAX_FIELD_BYTES:
+                raise HTTPException(status_code=413, detail="Form field too large")
+            return
+
+        chunk = data[start:end]
+        self._size += len(chunk)
+        if self._size > self._max_part_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Maximum {self._max_part_bytes // (1024 * 1024)} MB"
+            )
+
+        if len(self._head) < SNIFF_BYTES:
+            self._head += chunk[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= SNIFF_BYTES:
+                self._check_mime_type()
+
+        self._hasher.update(chunk)
+        self._file.write(chunk)
+
+    def on_part_end(self):
+        if self._file is None:
+            return
+
+        self._file.close()
+        self._file = None
+        if self._size == 0:
+            os.unlink(self._temp_path)
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+        if len(self._head) < SNIFF_BYTES:
+            self._check_mime_type()
+
+        self.staged.append(StagedUpload(
+            filename=self._filename,
+            extension=self._extension,
+            mime_type=EXTENSION_MIME_TYPES[self._extension],
+            size_bytes=self._size,
+            file_hash=self._hasher.hexdigest(),
+            temp_path=self._temp_path,
+        ))
+
+    def _check_mime_type(self):
+        sniffed = sniff_mime_type(self._head)
+        if sniffed is None or sniffed != EXTENSION_MIME_TYPES.get(self._extension):
+            raise HTTPException(
+                status_code=415,
+                detail=f"File content does not match its .{self._extension} extension"
+            )
+
+    def abort(self):
+        """Remove everything staged so far (including a half-written part)"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            try:
+                os.unlink(self._temp_path)
+            except FileNotFoundError:
+                pass
+        for upload in self.staged:
+            upload.discard()
+        self.staged = []
+
+
+async def stage_uploads(request: Request, max_files: int = 1, allow_archives: bool = False) -> list[StagedUpload]:
+    """
+    Stream a multipart/form-data body into staged temp files
+
+    Memory stays O(chunk size): every chunk is hashed and written as it
+    arrives. Size, extension and sniffed MIME type are enforced mid-stream,
+    so oversized or mislabelled uploads are rejected without reading the rest.
+
+    Raises:
+        HTTPException: 400/413/415 on malformed, oversized or disallowed uploads
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=415, detail="Expected multipart/form-data upload")
+
+    collector = _UploadCollector(max_files, allow_archives)
+    parser = MultipartParser(params[b"boundary"], collector.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except HTTPException:
+        collector.abort()
+        raise
+    except Exception as e:
+        collector.abort()
+        logger.error(f"Upload stream failed: {e}")
+        raise HTTPException(status_code=400, detail="Malformed upload")
+
+    if not collector.staged:
+        raise HTTPException(status_code=400, detail="No file in upload")
+    return collector.staged
+
+
+def _stage_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, incoming_dir: str) -> StagedUpload:
+    """Copy one archive member to a temp file while hashing; ValueError if it is not acceptable"""
+    filename = os.path.basename(info.filename)
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if extension not in settings.allowed_extensions_list:
+        raise ValueError("File type not allowed")
+    max_bytes = settings.MAX_FILE_SIZE_MB * 1024 * 1024
+    if info.file_size > max_bytes:
+        raise ValueError(f"File too large. Maximum {settings.MAX_FILE_SIZE_MB} MB")
+
+    fd, temp_path = tempfile.mkstemp(dir=incoming_dir, suffix=f".{extension}")
+    hasher = hashlib.sha256()
+    size = 0
+    head = b""
+    try:
+        with os.fdopen(fd, "wb") as out, archive.open(info) as member:
+            # Declared sizes can lie, so the cap is enforced on the bytes actually inflated
+            while chunk := member.read(COPY_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"File too large. Maximum {settings.MAX_FILE_SIZE_MB} MB")
+                if len(head) < SNIFF_BYTES:
+                    head += chunk[:SNIFF_BYTES - len(head)]
+                hasher.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise ValueError("File is empty")
+        if sniff_mime_type(head) != EXTENSION_MIME_TYPES[extension]:
+            raise ValueError(f"File content does not match its .{extension} extension")
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+    return StagedUpload(
+        filename=filename,
+        extension=extension,
+        mime_type=EXTENSION_MIME_TYPES[extension],
+        size_bytes=size,
+        file_hash=hasher.hexdigest(),
+        temp_path=temp_path,
+    )
+
+
+def expand_archive(archive_upload: StagedUpload, max_files: int) -> tuple[list[StagedUpload], list[dict]]:
+    """
+    Stage every receipt inside a zip (runs in a thread)
+
+    Bad members are reported and skipped rather than failing the whole archive.
+    Directories, dotfiles and __MACOSX metadata are ignored.
+    """
+    incoming_dir = os.path.dirname(archive_upload.temp_path)
+    staged: list[StagedUpload] = []
+    rejected: list[dict] = []
+    over_limit = 0
+    try:
+        with zipfile.ZipFile(archive_upload.temp_path) as archive:
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                    continue
+                if len(staged) >= max_files:
+                    over_limit += 1
+                    continue
+                try:
+                    staged.append(_stage_member(archive, info, incoming_dir))
+                except (ValueError, zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+                    rejected.append({"filename": name, "error": str(e)})
+        if over_limit:
+            rejected.append({
+                "filename": archive_upload.filename,
+                "error": f"{over_limit} more files skipped: at most {settings.IMPORT_MAX_FILES} per import",
+            })
+    except zipfile.BadZipFile:
+        for upload in staged:
+            upload.discard()
+        raise HTTPException(status_code=400, detail=f"{archive_upload.filename} is not a valid zip archive")
+    finally:
+        archive_upload.discard()
+    return staged, rejected
+
+
+async def stage_import(request: Request) -> tuple[list[StagedUpload], list[dict]]:
+    """
+    Stage a bulk import: any number of receipt files and/or zip archives
+
+    Returns the staged receipts (at most IMPORT_MAX_FILES) and per-file
+    rejections from inside archives.
+    """
+    uploads = await stage_uploads(request, max_files=settings.IMPORT_MAX_FILES, allow_archives=True)
+    staged: list[StagedUpload] = []
+    rejected: list[dict] = []
+    try:
+        for upload in uploads:
+            if upload.extension != ARCHIVE_EXTENSION:
+                staged.append(upload)
+                continue
+            members, failures = await asyncio.to_thread(
+                expand_archive, upload, settings.IMPORT_MAX_FILES - len(staged)
+            )
+            staged.extend(members)
+            rejected.extend(failures)
+    except Exception:
+        for upload in staged + uploads:
+            upload.discard()
+        raise
+
+    if len(staged) > settings.IMPORT_MAX_FILES:
+        for upload in staged:
+            upload.discard()
+        raise HTTPException(status_code=400, detail=f"At most {settings.IMPORT_MAX_FILES} files per import")
+    return staged, rejected